@@ -1,105 +1,306 @@
+import time
+launch_time = time.perf_counter()
+
 from ursina import *
 from ursina.prefabs.first_person_controller import FirstPersonController
+from static_batching import StaticBatcher, count_draw_calls
+from light_manager import LightManager
+from simulation import Simulation, PlayerInput, FixedTimestep
+from replay import InputRecorder, InputPlayer, timing_report, write_report
+from benchmark import CameraRig, FlythroughBenchmark
+from profiler import FrameProfiler
+from assets import AssetLoader, LoadingScreen
+from hud import ReactiveHUD
+from scheduler import Scheduler
+from audio_engine import AudioEngine, attenuation
+from lightmap import load_lightmap
+from instancing import InstancedModel
+from shader_effects import baked_shader, ghost_shader, flicker
+from level import load_level, DEFAULT_LEVEL
+from procgen import mansion_level
+from streaming import ChunkStreamer, peak_memory_mb, memory_mb
+from portals import RoomGraph, view_half_angle
+from startup import StartupLog, DeferredWork
+from quality import QualityGovernor, ResolutionScaler, level_index
+from cli import arg_value
+from panda3d.core import TransparencyAttrib
+import atexit
 import random
 import math
+import statistics
+import sys
+import json
+import hashlib
+import os
+
+# Milliseconds per startup phase (see startup.py)
+startup = StartupLog(launch_time)
+startup.phase('imports')
+
+# ============================================================================
+# SETTINGS
+# ============================================================================
+# --benchmark renders offscreen, flies the camera through every room for
+# --frames frames and writes frame times to --benchmark-out
+BENCHMARK = '--benchmark' in sys.argv
+BENCHMARK_FRAMES = arg_value('--frames', 1800)
+BENCHMARK_OUT = arg_value('--benchmark-out', 'benchmark.json')
+
+# --soak N dies or wins and restarts N times offscreen, then checks that the
+# entity count and memory ended where they started
+SOAK = arg_value('--soak', 0)
+
+# Level file to play (levels/*.json)
+LEVEL_PATH = arg_value('--level', DEFAULT_LEVEL)
+
+# --mansion SEED plays a generated house of --rooms x --rooms rooms instead.
+# Big houses only keep the rooms near the player loaded (--no-streaming to
+# build everything up front)
+MANSION_SEED = arg_value('--mansion', -1)
+MANSION_ROOMS = arg_value('--rooms', 20)
+STREAMING = MANSION_SEED >= 0 and '--no-streaming' not in sys.argv
+
+# Merge static house geometry into a few meshes (F2 toggles at runtime)
+STATIC_BATCHING = '--no-batching' not in sys.argv
+
+# Walls, floor and ceiling use lighting baked once per level (cached in
+# .cache/lightmaps) and only the props get real time lights. Streamed levels
+# are always lit in real time.
+BAKED_LIGHTING = '--no-baked-lighting' not in sys.argv and not STREAMING
+
+# Draw props as GPU instances, one draw call per material, instead of merged
+# meshes (the light bulbs are always instanced). Not for streamed levels.
+INSTANCED_PROPS = '--instanced-props' in sys.argv and not STREAMING
+
+# Switch off rooms that can't be seen through any doorway (F5 toggles at
+# runtime). Needs the level's rooms, and doesn't apply to streamed levels.
+ROOM_CULLING = '--no-culling' not in sys.argv
+frame_times = []
+
+# How many FlickeringLights get a real PointLight at once
+MAX_ACTIVE_LIGHTS = arg_value('--lights', 4)
+
+# Ghost navigation grid resolution in world units
+NAV_CELL_SIZE = arg_value('--nav-cell', 1.0)
+
+# --nightmare N hunts the player with N ghosts (NumPy from SWARM_MIN_GHOSTS
+# up, see simulation.py). Only the nearest GHOST_POOL_SIZE of them are drawn.
+NIGHTMARE = arg_value('--nightmare', 1)
+GHOST_POOL_SIZE = 64
 
-app = Ursina(title='SCREAM - Psychological Horror', borderless=False)
+# Simulation ticks per second, independent of the frame rate. Lower it on
+# weak hardware to save CPU; rendering is interpolated between ticks.
+TICK_RATE = arg_value('--tick-rate', 60)
+MAX_CATCH_UP_STEPS = 5
+
+# Runs are seeded (random seed unless --seed N). --record FILE saves every
+# tick's input, --replay FILE plays it back and writes frame timings to
+# --report (replay_report.json) before quitting.
+SEED = arg_value('--seed', -1)
+RECORD_PATH = arg_value('--record', '')
+REPLAY_PATH = arg_value('--replay', '')
+REPORT_PATH = arg_value('--report', 'replay_report.json')
+
+# --profile times each subsystem every frame and dumps the last seconds to
+# CSV/JSON when a frame takes longer than --hitch-ms
+PROFILE = '--profile' in sys.argv
+HITCH_MS = arg_value('--hitch-ms', 50.0)
+
+# HUD attributes are only written when the shown value changes (F6 or
+# --eager-hud writes them every frame, to compare the write counts)
+REACTIVE_HUD = '--eager-hud' not in sys.argv
+
+# --quality auto steps the light count, render resolution, overlays and how
+# often lights and the HUD animate down, and back up, to hold --target-fps
+# (see quality.py). lowest, low, medium or high fixes the level; runs that
+# time frames are fixed at high unless --quality is given.
+QUALITY = arg_value('--quality', 'high' if BENCHMARK or SOAK or REPLAY_PATH else 'auto')
+TARGET_FPS = arg_value('--target-fps', 60)
+
+# The batched house is saved to .cache/scenes and loaded from there next
+# time; the entities behind it, and UI not on screen yet, are built after
+# the first frame (--no-scene-cache builds everything up front, every time).
+# --startup-report FILE quits once everything is built and writes the
+# startup timings to FILE (python startup.py runs it cold and warm).
+SCENE_CACHE = '--no-scene-cache' not in sys.argv
+STARTUP_REPORT = arg_value('--startup-report', '')
+# Deferred work per frame: more behind the loading screen than in the game
+DEFERRED_LOADING_MS = 50
+DEFERRED_PLAYING_MS = 3
+
+replay_player = InputPlayer(REPLAY_PATH) if REPLAY_PATH else None
+if replay_player:
+    # The recording decides what's played, whatever the other flags say
+    SEED = replay_player.seed
+    TICK_RATE = replay_player.tick_rate
+    LEVEL_PATH = replay_player.level_path or LEVEL_PATH
+    MANSION_SEED = replay_player.mansion_seed
+    MANSION_ROOMS = replay_player.rooms
+    NIGHTMARE = replay_player.ghosts
+    NAV_CELL_SIZE = replay_player.nav_cell_size
+    STREAMING = MANSION_SEED >= 0 and '--no-streaming' not in sys.argv
+    BAKED_LIGHTING = '--no-baked-lighting' not in sys.argv and not STREAMING
+    INSTANCED_PROPS = '--instanced-props' in sys.argv and not STREAMING
+
+# Fixed size offscreen buffer so benchmark runs are comparable
+window_settings = dict(window_type='offscreen', size=(1280, 720)) if BENCHMARK or SOAK or STARTUP_REPORT else {}
+app = Ursina(title='SCREAM - Psychological Horror', borderless=False, **window_settings)
 window.fullscreen = False
 window.color = color.rgb(5, 5, 10)
 window.fps_counter.enabled = False
+startup.phase('window')
 
 # ============================================================================
-# GAME STATE
+# GAME STATE - The rules live in simulation.py, this file renders them
 # ============================================================================
-game_over = False
-game_won = False
-sanity = 100  # Player's sanity level - decreases when ghost is near
-ghost_seen_timer = 0
-flicker_timer = 0
-ambient_fear = 0
-heartbeat_intensity = 0
+level = mansion_level(MANSION_SEED, MANSION_ROOMS, MANSION_ROOMS) if MANSION_SEED >= 0 else load_level(LEVEL_PATH)
+if replay_player:
+    replay_player.check_level(level)
+sim = Simulation(seed=SEED if SEED >= 0 else None, nav_cell_size=NAV_CELL_SIZE, level=level, ghosts=NIGHTMARE)
+sim_clock = FixedTimestep(TICK_RATE, MAX_CATCH_UP_STEPS)
+
+# Visual-only randomness gets its own stream so it never touches the rules
+render_rng = sim.stream('render')
+
+# Timed screen effects, on the frame clock (see scheduler.py)
+effects = Scheduler()
+
+# Built after the first frame, a few milliseconds a frame
+deferred = DeferredWork()
+startup.phase('level')
+
+lightmap = None
+if BAKED_LIGHTING:
+    bake_start = time.perf_counter()
+    lightmap, baked = load_lightmap(level)
+    print(f'LIGHTMAP: {"baked" if baked else "loaded"} {lightmap.width}x{lightmap.height} atlas for {level.name} '
+          f'in {(time.perf_counter() - bake_start) * 1000:.0f} ms{" (cached)" if baked else ""}')
+    startup.phase('lightmap')
+
+recorder = InputRecorder(RECORD_PATH, TICK_RATE, sim, LEVEL_PATH, MANSION_SEED, MANSION_ROOMS) if RECORD_PATH else None
+if recorder:
+    atexit.register(recorder.close)
+restart_pending = False
+
+# Replay timings
+replay_frame_times = []
+replay_tick_times = []
+replay_done = False
+
+# Player and ghost positions before the latest tick, for interpolation
+previous_positions = (sim.player.x, sim.player.z, sim.ghost.x, sim.ghost.z)
+
+# Mouse movement not yet handed to a tick
+look_x = 0
+look_y = 0
 
 # ============================================================================
 # LOAD TEXTURES FROM PARENT DIRECTORY
 # ============================================================================
-wall_texture = load_texture('../../wall_converted.png')
-ghost_texture = load_texture('../../ghost_converted.png')
-bed_texture = load_texture('../../bed_converted.png')
+# Everything streams in on background threads behind the loading screen,
+# missing files keep a placeholder (see assets.py)
+assets = AssetLoader()
+wall_texture = assets.texture('../../wall_converted.png')
+ghost_texture = assets.texture('../../ghost_converted.png', placeholder=color.rgba(200, 200, 210, 180))
+bed_texture = assets.texture('../../bed_converted.png')
 
 # ============================================================================
 # AUDIO SETUP
 # ============================================================================
-# Heavy breathing background audio - loops continuously
-breathing_audio = Audio('../../freesound_community-heavy-breathing-14431.mp3', loop=True, autoplay=True, volume=0.4)
+# Same loudness as ursina's Audio, which halves every volume
+audio = AudioEngine(assets, volume_scale=Audio.volume_multiplier)
+
+# Heavy breathing background audio - loops continuously, streamed
+breathing_audio = audio.loop('../../freesound_community-heavy-breathing-14431.mp3', volume=0.4)
 
-# Scream sound for jumpscare - played when ghost catches player
-scream_audio = Audio('../../scream.mp3', loop=False, autoplay=False, volume=1.0)
+# Scream sound for jumpscare - played when ghost catches player. Decoded
+# into memory up front so it starts on the frame of the jumpscare.
+scream_audio = audio.one_shot('../../scream.mp3', volume=1.0)
+startup.phase('assets')
+
+# Time to first frame / time to interactive, in seconds since launch
+startup_times = {}
 
 # ============================================================================
 # LIGHTING SYSTEM WITH FLICKERING
 # ============================================================================
 class FlickeringLight(Entity):
-    def __init__(self, position, intensity=1.0, flicker_speed=0.1, **kwargs):
+    bulb = None  # Entity.__init__ calls on_enable before ours adds it
+
+    def __init__(self, index, position, intensity=1.0, flicker_speed=0.1, **kwargs):
         super().__init__(**kwargs)
-        self.light = PointLight(parent=self, position=position, color=color.rgb(255, 200, 150))
+        # On/off state comes from sim.lights[index], this only draws it
+        self.index = index
+        # The light manager hands out real PointLights, we only keep the color
+        self.light_position = Vec3(*position)
         self.base_intensity = intensity
         self.flicker_speed = flicker_speed
-        self.flicker_timer = random.random() * 10
+        # Where this light is in the flicker, so lights don't flicker in step
+        self.phase = render_rng.random() * 10
         self.is_on = True
-        self.malfunction_chance = 0.02
-        self.off_duration = 0
-        
-        # Visual bulb representation
-        self.bulb = Entity(
-            parent=self,
-            model='sphere',
-            scale=0.3,
-            position=position,
-            color=color.yellow,
-            unlit=True
-        )
-    
-    def update(self):
-        global ambient_fear
-        self.flicker_timer += time.dt
-        
-        # Random malfunction - light goes out temporarily
-        if self.is_on and random.random() < self.malfunction_chance * (1 + ambient_fear * 0.5):
-            self.is_on = False
-            self.off_duration = random.uniform(0.1, 2.0)
         
+        # Visual bulb representation, one instance of the shared bulb model.
+        # Its flicker runs in the shader, we only touch it when the light
+        # goes out or comes back on.
+        self.bulb = bulbs.add(position, scale=0.3, color=BULB_ON, flicker=BULB_FLICKER, phase=self.phase)
+
+    @property
+    def light_color(self):
+        # Only the few lights holding a PointLight are asked, the rest
+        # flicker on the GPU
         if not self.is_on:
-            self.off_duration -= time.dt
-            if self.off_duration <= 0:
-                self.is_on = True
-        
-        # Flickering effect
-        if self.is_on:
-            flicker = math.sin(self.flicker_timer * 20) * 0.3 + random.uniform(-0.1, 0.1)
-            intensity = max(0.2, self.base_intensity + flicker)
-            self.light.color = color.rgb(
-                int(255 * intensity),
-                int(200 * intensity),
-                int(150 * intensity)
-            )
-            self.bulb.color = color.rgb(255, 255, 200)
-            self.bulb.scale = 0.3 + flicker * 0.1
+            return LIGHT_OFF
+        intensity = max(0.2, self.base_intensity + flicker(self.phase))
+        return color.rgb(
+            int(255 * intensity),
+            int(200 * intensity),
+            int(150 * intensity)
+        )
+
+    def switch(self, is_on):
+        """The light went out or came back on"""
+        self.is_on = is_on
+        if is_on:
+            bulbs.recolor(self.bulb, BULB_ON)
+            bulbs.set_flicker(self.bulb, BULB_FLICKER)
         else:
-            self.light.color = color.rgb(20, 15, 10)
-            self.bulb.color = color.rgb(50, 40, 30)
-            self.bulb.scale = 0.2
+            bulbs.recolor(self.bulb, BULB_OFF)
+            bulbs.set_flicker(self.bulb, 0)
+        if self.enabled:
+            self.show_bulb()
+        update_lamp(self)
+
+    def show_bulb(self):
+        bulbs.move(self.bulb, scale=0.3 if self.is_on else 0.2)
+
+    def on_enable(self):
+        if self.bulb is not None:
+            self.show_bulb()
 
+    def on_disable(self):
+        # Culled with its room, hide the bulb
+        if self.bulb is not None:
+            bulbs.move(self.bulb, scale=0)
+
+LIGHT_OFF = color.rgb(20, 15, 10)
+BULB_ON = color.rgb(255, 255, 200)
+BULB_OFF = color.rgb(50, 40, 30)
+# A lit bulb swells and shrinks by a third of its light's flicker
+BULB_FLICKER = 1 / 3
+# The 60 vertex icosphere, the shader pays per vertex and a bulb is tiny
+bulbs = InstancedModel('icosphere', lit=False, name='bulbs')
 lights = []
+light_manager = LightManager(max_active=MAX_ACTIVE_LIGHTS)
 
 # ============================================================================
-# HOUSE STRUCTURE - MULTIPLE ROOMS
+# HOUSE STRUCTURE - Built from the level file (see level.py)
 # ============================================================================
-house_width = 60
-house_depth = 60
-wall_height = 8
-wall_thickness = 0.5
+house_width = level.house_width
+house_depth = level.house_depth
+wall_height = level.wall_height
+wall_thickness = level.wall_thickness
 
-# Floor
+# Floor (with baked lighting, only its collider - the tiles below are drawn)
 floor = Entity(
     model='plane',
     scale=(house_width, 1, house_depth),
@@ -107,156 +308,270 @@ floor = Entity(
     texture_scale=(20, 20),
     color=color.rgb(30, 25, 20),
     collider='box',
-    position=(0, 0, 0)
+    position=(0, 0, 0),
+    visible=lightmap is None
 )
 
-# Ceiling
-ceiling = Entity(
-    model='plane',
-    scale=(house_width, 1, house_depth),
-    texture='white_cube',
-    texture_scale=(20, 20),
-    color=color.rgb(20, 18, 15),
-    position=(0, wall_height, 0),
-    rotation=(180, 0, 0)
-)
+# Texture names used in level files
+level_textures = {'wall': wall_texture, 'bed': bed_texture, 'ghost': ghost_texture}
+
+static_batcher = StaticBatcher()
+if lightmap is None:
+    # Ceiling
+    ceiling = Entity(
+        model='plane',
+        scale=(house_width, 1, house_depth),
+        texture='white_cube',
+        texture_scale=(20, 20),
+        color=color.rgb(20, 18, 15),
+        position=(0, wall_height, 0),
+        rotation=(180, 0, 0)
+    )
+    static_batcher.add('white_cube', [floor, ceiling])
+
+def make_baked(model, position, scale, texture, tint, collider=None):
+    """An entity lit only by the lightmap"""
+    entity = Entity(model=model, position=position, scale=scale, texture=texture, color=tint,
+                    collider=collider, unlit=True)
+    lightmap.apply(entity)
+    # Flickers with its lamp in the shader, no lamp until add_static says
+    entity.model.set_shader(baked_shader())
+    entity.model.set_shader_input('lamp', NO_LAMP)
+    return entity
 
-def create_wall(pos, scale, scary=False):
-    """Create a wall with scary texture"""
-    wall = Entity(
+# Walls with scary texture, outer walls and the rooms in between. index is
+# the wall's place in level.walls, for its part of the lightmap.
+def make_wall(wall, index=None):
+    if lightmap and index is not None:
+        return make_baked(lightmap.wall_model(index, wall), wall.position, wall.scale, wall_texture,
+                          color.rgb(80, 70, 65), collider='box')
+    return Entity(
         model='cube',
-        position=pos,
-        scale=scale,
-        texture=wall_texture if scary else 'white_cube',
-        texture_scale=(scale[0]/2, scale[1]/2) if scary else (1, 1),
-        color=color.rgb(60, 50, 45) if not scary else color.rgb(80, 70, 65),
+        position=wall.position,
+        scale=wall.scale,
+        texture=wall_texture,
+        texture_scale=(wall.scale[0]/2, wall.scale[1]/2),
+        color=color.rgb(80, 70, 65),
         collider='box'
     )
-    return wall
 
-# Outer walls with scary texture
-walls = []
-# North wall
-walls.append(create_wall((0, wall_height/2, house_depth/2), (house_width, wall_height, wall_thickness), scary=True))
-# South wall
-walls.append(create_wall((0, wall_height/2, -house_depth/2), (house_width, wall_height, wall_thickness), scary=True))
-# East wall
-walls.append(create_wall((house_width/2, wall_height/2, 0), (wall_thickness, wall_height, house_depth), scary=True))
-# West wall
-walls.append(create_wall((-house_width/2, wall_height/2, 0), (wall_thickness, wall_height, house_depth), scary=True))
+# Furniture, paintings, the bed... Everything else that never moves
+def make_prop(prop):
+    entity = Entity(
+        model='cube',
+        position=prop.position,
+        scale=prop.scale,
+        texture=level_textures.get(prop.texture, prop.texture),
+        color=color.rgba(*prop.color),
+        collider='box' if prop.collider else None
+    )
+    if prop.texture_scale:
+        entity.texture_scale = prop.texture_scale
+    return entity
 
-# ============================================================================
-# ROOM LAYOUT - Creating multiple interconnected rooms
-# ============================================================================
-room_walls = []
+# With --instanced-props, one instanced cube per batch group instead
+prop_models = {}    # Batch group -> InstancedModel
 
-# Room 1: Entrance Hall (South-West)
-room_walls.append(create_wall((-15, wall_height/2, -10), (wall_thickness, wall_height, 20), scary=True))
-room_walls.append(create_wall((-22.5, wall_height/2, 0), (15, wall_height, wall_thickness), scary=True))
+def make_instanced_prop(prop):
+    """Add a prop to its group's instances, grouped like add_static() would"""
+    group = prop.batch or 'white_cube'
+    rooms = None
+    if room_graph is not None:
+        x, z = prop.position[0], prop.position[2]
+        half_x, half_z = prop.scale[0] / 2, prop.scale[2] / 2
+        rooms = room_graph.rooms_touching((x - half_x, z - half_z, x + half_x, z + half_z))
+        group = f'{group} {sorted(rooms)}'
+    model = prop_models.get(group)
+    if model is None:
+        model = prop_models[group] = InstancedModel('cube', texture=level_textures.get(prop.texture, prop.texture),
+                                                    max_lights=max(MAX_ACTIVE_LIGHTS, 1), name=group)
+        if rooms is not None:
+            cull_nodes.setdefault(rooms, []).append(model)
+    return model.add(prop.position, prop.scale, color=color.rgba(*prop.color),
+                     texture_scale=prop.texture_scale or (1, 1), collider=prop.collider)
 
-# Room 2: Living Room (South-East)
-room_walls.append(create_wall((10, wall_height/2, -15), (wall_thickness, wall_height, 10), scary=True))
-room_walls.append(create_wall((17.5, wall_height/2, -10), (15, wall_height, wall_thickness), scary=True))
+# Room graph for culling: each wall, prop and light is tagged with the rooms
+# it can be seen from (walls between rooms belong to both) and batched with
+# the others of the same rooms, so a hidden room hides whole meshes
+room_graph = RoomGraph.from_level(level) if ROOM_CULLING and level.rooms and not STREAMING else None
+cull_groups = {}    # Rooms -> entities
+cull_nodes = {}     # Rooms -> batched meshes
+visible_rooms = None
+culling_enabled = room_graph is not None
+cull_stats = {'rooms': 0, 'objects': 0, 'lights': 0}
 
-# Room 3: Kitchen (North-West)
-room_walls.append(create_wall((-10, wall_height/2, 15), (20, wall_height, wall_thickness), scary=True))
-room_walls.append(create_wall((-20, wall_height/2, 22.5), (wall_thickness, wall_height, 15), scary=True))
+# Baked surfaces are also grouped by the lamp that lights them most. Their
+# shader scales the baked light by that lamp's flicker; the lamp's phase
+# and whether it's on are a shader input, set when the lamp switches.
+lamp_entities = {}  # Lamp -> entities
+lamp_nodes = {}     # Lamp -> batched meshes
+NO_LAMP = Vec4(0, 0, 0, 0)
 
-# Room 4: Bedroom (North-East) - This is where the bed is
-room_walls.append(create_wall((15, wall_height/2, 10), (wall_thickness, wall_height, 20), scary=True))
-room_walls.append(create_wall((22.5, wall_height/2, 20), (15, wall_height, wall_thickness), scary=True))
+def add_static(entity, material, lamp=-1, baked=False):
+    """Register a wall or prop for batching (and culling). The batch group's
+    rooms, lamp and shader are tagged on it, so they come back with the
+    scene cache before the entity itself exists."""
+    group = material
+    tags = {}
+    if room_graph is not None:
+        rooms = add_culled(entity)
+        group = f'{material} {sorted(rooms)}'
+        tags['rooms'] = ' '.join(str(room) for room in sorted(rooms))
+    if baked:
+        group = f'{group} baked'
+        tags['shader'] = 'baked'
+    if lamp >= 0:
+        group = f'{group} lamp {lamp}'
+        tags['lamp'] = str(lamp)
+        lamp_entities.setdefault(lamp, []).append(entity)
+    static_batcher.add(group, [entity], **tags)
 
-# Room 5: Bathroom (Center-North)
-room_walls.append(create_wall((0, wall_height/2, 20), (10, wall_height, wall_thickness), scary=True))
-room_walls.append(create_wall((5, wall_height/2, 25), (wall_thickness, wall_height, 10), scary=True))
+def add_culled(entity):
+    x, z = entity.x, entity.z
+    half_x, half_z = entity.scale_x / 2, entity.scale_z / 2
+    rooms = room_graph.rooms_touching((x - half_x, z - half_z, x + half_x, z + half_z))
+    cull_groups.setdefault(rooms, []).append(entity)
+    return rooms
 
-# Room 6: Basement Stairs area (Center)
-room_walls.append(create_wall((0, wall_height/2, 5), (8, wall_height, wall_thickness), scary=True))
-room_walls.append(create_wall((-4, wall_height/2, 0), (wall_thickness, wall_height, 10), scary=True))
+# Streamed levels create walls and props as the player gets near (see below)
+walls = []
+props = []
 
-# Long Hallway
-room_walls.append(create_wall((5, wall_height/2, -5), (wall_thickness, wall_height, 30), scary=True))
+def build_house():
+    """Walls, floor and ceiling tiles and props, yielding after each one"""
+    for i, wall in enumerate(level.walls):
+        walls.append(make_wall(wall, i))
+        add_static(walls[-1], 'wall_texture', lightmap.wall_light(i) if lightmap else -1, baked=lightmap is not None)
+        yield
+    if lightmap:
+        # Floor and ceiling in tiles, so each tile follows its own lamp and room
+        floor_repeat = (20 / house_width, 20 / house_depth)
+        for key, tint in (('floor', color.rgb(30, 25, 20)), ('ceiling', color.rgb(20, 18, 15))):
+            for index, center, size in lightmap.tiles(key):
+                tile = make_baked(lightmap.tile_model(index, center, size, floor_repeat), center, size, 'white_cube', tint)
+                add_static(tile, 'white_cube', lightmap.light(index), baked=True)
+                yield
+    if not INSTANCED_PROPS:
+        for prop in level.props:
+            props.append(make_prop(prop))
+            add_static(props[-1], prop.batch or 'white_cube')
+            yield
 
-# ============================================================================
-# BED IN BEDROOM - Using bed.png texture
-# ============================================================================
-bed = Entity(
-    model='cube',
-    position=(22, 0.5, 22),
-    scale=(4, 1, 6),
-    texture=bed_texture,
-    texture_scale=(1, 1),
-    collider='box'
-)
+def finish_house():
+    """The house's entities are all in: give them their lamps and rooms"""
+    global visible_rooms
+    for light in lights:
+        update_lamp(light)
+    # Culling hasn't seen the new entities, have it apply again
+    visible_rooms = None
 
-# Bed frame
-bed_headboard = Entity(
-    model='cube',
-    position=(22, 1.5, 24.5),
-    scale=(4, 2, 0.3),
-    texture=bed_texture,
-    color=color.rgb(80, 60, 40)
-)
+def scene_cache_path():
+    """Where the batched house is cached, by everything that goes into it"""
+    key = [level.floor_bounds(), level.wall_height, level.walls, level.props, level.rooms,
+           lightmap is not None, room_graph is not None, INSTANCED_PROPS]
+    digest = hashlib.sha1(json.dumps(key).encode())
+    # And the code that builds it
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ('Scream.py', 'static_batching.py', 'lightmap.py'):
+        with open(os.path.join(here, name), 'rb') as f:
+            digest.update(f.read())
+    return os.path.join(here, '.cache', 'scenes', f'{digest.hexdigest()[:16]}.bam')
 
-# Pillow
-pillow = Entity(
-    model='cube',
-    position=(22, 1.1, 23.5),
-    scale=(2, 0.3, 1),
-    color=color.rgb(200, 200, 200)
-)
+if INSTANCED_PROPS:
+    for prop in level.props:
+        make_instanced_prop(prop)
 
 # ============================================================================
-# CREEPY FURNITURE AND OBJECTS
+# STATIC GEOMETRY BATCHING - Fewer draw calls for everything that never moves
 # ============================================================================
-# Old chairs
-for pos in [(-20, 0.5, -20), (-18, 0.5, -22), (18, 0.5, -18)]:
-    Entity(model='cube', position=pos, scale=(1, 1, 1), color=color.rgb(60, 40, 30), collider='box')
+# From the scene cache if it's there: the merged meshes are all the first
+# frame needs to draw the house, the entities behind them come after it
+scene_path = scene_cache_path() if SCENE_CACHE and STATIC_BATCHING and not STREAMING else None
+live_textures = [texture._texture for texture in level_textures.values()]
+if lightmap:
+    live_textures.append(lightmap.texture)
+scene_cached = scene_path is not None and static_batcher.load(scene_path, live_textures)
+if scene_cached:
+    deferred.defer(build_house())
+    deferred.defer(finish_house)
+else:
+    if not STREAMING:
+        for step in build_house():
+            pass
+    static_batcher.build()
+    if scene_path:
+        static_batcher.save(scene_path)
+static_batcher.set_batched(STATIC_BATCHING)
+for group, tags in static_batcher.tags.items():
+    node = static_batcher.nodes[group]
+    if 'rooms' in tags:
+        cull_nodes.setdefault(frozenset(int(room) for room in tags['rooms'].split()), []).append(node)
+    if 'lamp' in tags:
+        lamp_nodes.setdefault(int(tags['lamp']), []).append(node)
+    if 'shader' in tags:
+        # Back on for a cached scene, whose copies lost theirs
+        node.set_shader(baked_shader())
+        node.set_shader_input('lamp', NO_LAMP)
+startup.phase('house')
 
-# Creepy paintings on walls (using wall texture for horror effect)
-paintings = []
-painting_positions = [
-    ((-29.5, 4, -10), (0.1, 3, 2)),
-    ((-29.5, 4, 10), (0.1, 3, 2)),
-    ((29.5, 4, -10), (0.1, 3, 2)),
-    ((0, 4, 29.5), (3, 2, 0.1)),
-]
-for pos, scale in painting_positions:
-    p = Entity(
-        model='cube',
-        position=pos,
-        scale=scale,
-        texture=wall_texture,
-        color=color.rgb(100, 80, 70)
-    )
-    paintings.append(p)
+def update_lamp(light):
+    """Hand a lamp's phase, base intensity and on/off to its baked surfaces"""
+    lamp = Vec4(light.phase, light.base_intensity, light.is_on, 0)
+    # Above the copies' own input from build()
+    for node in lamp_nodes.get(light.index, ()):
+        node.set_shader_input('lamp', lamp, 1)
+    for entity in lamp_entities.get(light.index, ()):
+        entity.model.set_shader_input('lamp', lamp)
 
-# Broken mirror
-mirror = Entity(
-    model='cube',
-    position=(10, 4, -29.5),
-    scale=(4, 3, 0.1),
-    color=color.rgb(150, 150, 160),
-    collider='box'
-)
+def report_batching():
+    """Print draw calls and average frame time for the current batching mode"""
+    draw_calls, vertices = count_draw_calls()
+    avg_ms = sum(frame_times) / len(frame_times) * 1000 if frame_times else 0
+    mode = 'batched' if static_batcher.batched else 'unbatched'
+    print(f'[{mode}] draw calls: {draw_calls} | vertices: {vertices} | avg frame: {avg_ms:.2f} ms')
+    if streamer:
+        report_streaming()
 
 # ============================================================================
 # FLICKERING LIGHTS PLACEMENT
 # ============================================================================
-light_positions = [
-    (-20, 7, -20),  # Entrance
-    (20, 7, -20),   # Living room
-    (-20, 7, 20),   # Kitchen
-    (22, 7, 22),    # Bedroom
-    (0, 7, 22),     # Bathroom
-    (0, 7, 0),      # Center
-    (-10, 7, -10),  # Hallway 1
-    (10, 7, 10),    # Hallway 2
-]
-
-for pos in light_positions:
-    light = FlickeringLight(position=pos, intensity=0.8, flicker_speed=random.uniform(0.05, 0.2))
+def make_light(i):
+    light = FlickeringLight(i, position=level.light_positions[i], intensity=0.8, flicker_speed=render_rng.uniform(0.05, 0.2))
     lights.append(light)
+    light_manager.register(light)
+    update_lamp(light)
+    return light
+
+def remove_light(light):
+    light_manager.unregister(light)
+    lights.remove(light)
+    bulbs.remove(light.bulb)
+    light.bulb = None
+    destroy(light)
+
+if not STREAMING:
+    for i in range(len(level.light_positions)):
+        light = make_light(i)
+        if room_graph:
+            x, z = light.light_position.x, light.light_position.z
+            cull_groups.setdefault(room_graph.rooms_touching((x, z, x, z)), []).append(light)
+    startup.phase('lights')
+
+# ============================================================================
+# ROOM STREAMING - Big generated houses only build the rooms near the player
+# ============================================================================
+streamer = None
+if STREAMING:
+    streamer = ChunkStreamer(level, make_wall, make_prop, make_light, remove_light, batched=STATIC_BATCHING)
+    # Everything in reach of the start is there for the first frame
+    streamer.update(level.player_start[0], level.player_start[2], budget_ms=float('inf'))
+    startup.phase('streaming')
+
+def report_streaming():
+    stats = streamer.stats
+    print(f'STREAMING: {stats["chunks"]}/{len(streamer.chunks)} chunks | {stats["entities"]} walls/props, '
+          f'{stats["lights"]} lights resident | {len(scene.entities)} scene entities | '
+          f'{stats["loads"]} loads, {stats["unloads"]} unloads | peak memory {stats["peak_mb"]:.0f} MB')
 
 # Main ambient light (very dim)
 ambient = AmbientLight(color=color.rgb(15, 12, 10))
@@ -271,125 +586,108 @@ class Ghost(Entity):
             texture=ghost_texture,
             scale=(3, 4),
             billboard=True,
-            position=(20, 2, 20),
+            position=level.ghost_start,
             collider='sphere',
             **kwargs
         )
-        self.speed = 2.0
-        self.chase_speed = 4.5
-        self.is_chasing = False
-        self.patrol_points = [
-            Vec3(-20, 2, -20),
-            Vec3(20, 2, -20),
-            Vec3(20, 2, 20),
-            Vec3(-20, 2, 20),
-            Vec3(0, 2, 0),
-            Vec3(-10, 2, 15),
-            Vec3(15, 2, -10),
-        ]
-        self.current_patrol = 0
-        self.detection_range = 15
-        self.kill_range = 1.5
         self.visible = True
-        self.teleport_timer = 0
-        self.teleport_interval = random.uniform(8, 15)
-        self.alpha = 0.9
-        self.last_seen_player_pos = None
-        self.aggression = 0  # Increases over time
-        
-    def update(self):
-        global game_over, sanity, ghost_seen_timer, ambient_fear, heartbeat_intensity
-        
-        if game_over or game_won:
-            return
-            
-        player_distance = distance(self.position, player.position)
-        
-        # Increase aggression over time
-        self.aggression += time.dt * 0.01
-        
-        # Detection logic
-        if player_distance < self.detection_range:
-            # Check line of sight (simplified)
-            self.is_chasing = True
-            self.last_seen_player_pos = player.position
-            ghost_seen_timer += time.dt
-            
-            # Decrease sanity when ghost is visible and close
-            sanity_drain = (self.detection_range - player_distance) * 0.5 * time.dt
-            sanity = max(0, sanity - sanity_drain)
-            
-            # Increase ambient fear
-            ambient_fear = min(1, ambient_fear + time.dt * 0.1)
-            heartbeat_intensity = min(1, (self.detection_range - player_distance) / self.detection_range)
-        else:
-            self.is_chasing = False
-            ghost_seen_timer = max(0, ghost_seen_timer - time.dt * 0.5)
-            ambient_fear = max(0, ambient_fear - time.dt * 0.05)
-            heartbeat_intensity = max(0, heartbeat_intensity - time.dt * 0.3)
-        
-        # Movement
-        if self.is_chasing:
-            direction = (player.position - self.position).normalized()
-            move_speed = self.chase_speed + self.aggression
-            self.position += direction * move_speed * time.dt
-            self.position.y = 2  # Keep ghost at proper height
-        else:
-            # Patrol behavior
-            target = self.patrol_points[self.current_patrol]
-            direction = (target - self.position).normalized()
-            self.position += direction * self.speed * time.dt
-            self.position.y = 2
-            
-            if distance(self.position, target) < 2:
-                self.current_patrol = (self.current_patrol + 1) % len(self.patrol_points)
-        
-        # Random teleportation (psychological horror element)
-        self.teleport_timer += time.dt
-        if self.teleport_timer > self.teleport_interval:
-            self.teleport_timer = 0
-            self.teleport_interval = random.uniform(5, 12) - self.aggression
-            # Teleport to a random location, sometimes closer to player
-            if random.random() < 0.3 + self.aggression * 0.1:
-                # Teleport near player (scary!)
-                angle = random.uniform(0, 360)
-                dist = random.uniform(8, 15)
-                new_x = player.position.x + math.cos(math.radians(angle)) * dist
-                new_z = player.position.z + math.sin(math.radians(angle)) * dist
-                new_x = max(-28, min(28, new_x))
-                new_z = max(-28, min(28, new_z))
-                self.position = Vec3(new_x, 2, new_z)
-            else:
-                # Random teleport
-                self.position = random.choice(self.patrol_points)
-        
-        # Ghost visual effects
-        self.alpha = 0.7 + math.sin(time.time() * 3) * 0.2
-        self.color = color.rgba(255, 255, 255, int(self.alpha * 255))
-        
-        # Kill player if too close
-        if player_distance < self.kill_range:
-            trigger_death()
+        # Movement, detection and teleports happen in sim.ghost, the main
+        # update loop places this entity between ticks. Its pulse is in
+        # the shader.
+        self.set_shader(ghost_shader(max(MAX_ACTIVE_LIGHTS, 1)))
 
 ghost = Ghost()
 
+# ============================================================================
+# GHOST SWARM - Nightmare mode, drawn through a fixed pool of billboards
+# ============================================================================
+# sim.swarm moves every ghost; each frame the pool is handed to the ghosts
+# closest to the player, so the entity count doesn't grow with the swarm.
+# The main Ghost entity above is always ghost 0.
+ghost_pool = []
+if sim.swarm:
+    for i in range(min(GHOST_POOL_SIZE, sim.swarm.count - 1)):
+        ghost_pool.append(Entity(model='quad', texture=ghost_texture, scale=(3, 4), billboard=True, y=ghost.y))
+        ghost_pool[-1].set_shader(ghost.get_shader())
+
+def update_swarm(alpha):
+    swarm = sim.swarm
+    for entity, i in zip(ghost_pool, swarm.nearest(sim.player.x, sim.player.z, len(ghost_pool))):
+        entity.x = lerp(swarm.prev_x[i], swarm.x[i], alpha)
+        entity.z = lerp(swarm.prev_z[i], swarm.z[i], alpha)
+
 # ============================================================================
 # PLAYER SETUP
 # ============================================================================
-player = FirstPersonController(
-    position=(-25, 2, -25),
-    speed=5,
-    mouse_sensitivity=Vec2(50, 50)
-)
-player.cursor.visible = False
-player.gravity = 1
+# The controller is only the camera rig - walking, sprinting and mouse look
+# are fed to sim.player and copied back every frame
+if BENCHMARK:
+    player = CameraRig(position=level.player_start)
+else:
+    player = FirstPersonController(
+        position=level.player_start,
+        speed=0,
+        mouse_sensitivity=Vec2(0, 0)
+    )
+    player.cursor.visible = False
+    player.gravity = 1
+
+hud = ReactiveHUD(REACTIVE_HUD)
+startup.phase('actors')
 
-# Sprint functionality
-sprint_speed = 8
-normal_speed = 5
-stamina = 100
-stamina_regen = 15
-stamina_drain = 25
+flythrough = None
+if BENCHMARK:
+    flythrough = FlythroughBenchmark(
+        player,
+        level.benchmark_route,
+        frames=BENCHMARK_FRAMES,
+        out_path=BENCHMARK_OUT,
+        settings={'static_batching': STATIC_BATCHING, 'max_active_lights': MAX_ACTIVE_LIGHTS,
+                  'level': level.name, 'streaming': STREAMING, 'room_culling': culling_enabled,
+                  'baked_lighting': lightmap is not None, 'instanced_props': INSTANCED_PROPS},
+        stats={'hud': hud.stats, 'audio': audio.stats, 'startup': startup.phases, 'streaming': streamer.stats} if streamer
+        else {'hud': hud.stats, 'audio': audio.stats, 'startup': startup.phases}
+    )
+
+def read_controls(mouse_dx, mouse_dy):
+    """Keyboard state plus collected mouse movement as simulation input"""
+    return PlayerInput(
+        held_keys['w'] - held_keys['s'],
+        held_keys['d'] - held_keys['a'],
+        bool(held_keys['shift']),
+        mouse_dx,
+        mouse_dy
+    )
+
+def next_controls():
+    """Input for the next tick - live (and recorded if asked) or from the replay.
+    Returns None when the replay has run out."""
+    global look_x, look_y, restart_pending
+    if replay_player:
+        if replay_player.finished:
+            return None
+        controls, restart = replay_player.next()
+        if restart:
+            restart_game()
+        return controls
+    controls = read_controls(look_x, look_y)
+    look_x = look_y = 0
+    if recorder:
+        controls = recorder.record(controls, restart_pending)
+        restart_pending = False
+    return controls
+
+def finish_replay():
+    global replay_done
+    if replay_done:
+        return
+    replay_done = True
+    report = timing_report(replay_frame_times, replay_tick_times, sim)
+    write_report(REPORT_PATH, report)
+    print(f'REPLAY: {report["ticks"]} ticks in {report["frames"]} frames | '
+          f'frame p50 {report["frame"]["p50_ms"]:.2f} ms, p95 {report["frame"]["p95_ms"]:.2f} ms, '
+          f'p99 {report["frame"]["p99_ms"]:.2f} ms -> {REPORT_PATH}')
+    application.quit()
 
 # ============================================================================
 # UI ELEMENTS
@@ -475,21 +773,65 @@ vignette = Entity(
     z=10
 )
 
-# Screen flash for scares
+# Screen flash for scares, only enabled while it's showing
 screen_flash = Entity(
     parent=camera.ui,
     model='quad',
     scale=(2, 1),
-    color=color.rgba(255, 0, 0, 0),
-    z=5
+    color=color.rgba(255, 0, 0, 50),
+    z=5,
+    enabled=False
 )
 
+# Debug overlays (F3, F4), built after the first frame or on the key press
+light_stats_text = None
+profile_text = None
+light_stats = None
+
+def build_debug_text():
+    global light_stats_text, profile_text, light_stats
+    if light_stats_text is not None:
+        return
+    # Light manager stats (F3)
+    light_stats_text = Text(
+        text='',
+        parent=camera.ui,
+        position=(0.45, 0.47),
+        scale=0.8,
+        color=color.rgb(150, 150, 150),
+        enabled=False
+    )
+
+    # Profiler overlay (F4)
+    profile_text = Text(
+        text='',
+        parent=camera.ui,
+        position=(0.45, 0.43),
+        scale=0.7,
+        font='VeraMono.ttf',
+        color=color.rgb(150, 150, 150),
+        enabled=False
+    )
+    light_stats = hud.field(light_stats_text, 'text')
+
+deferred.defer(build_debug_text)
+
+# Everything update_hud() and the F3 overlay change per frame, rounded to
+# what can be seen: a pixel of bar, a few steps of alpha, 2% of volume
+sanity_width = hud.field(sanity_bar, 'scale_x', step=0.001)
+stamina_width = hud.field(stamina_bar, 'scale_x', step=0.001)
+vignette_alpha = hud.field(vignette, 'color', step=2, convert=lambda alpha: color.rgba(0, 0, 0, alpha))
+vignette_pulse = hud.field(vignette, 'scale', step=0.001, convert=lambda pulse: Vec2(2 + pulse, 1 + pulse))
+warning_message = hud.field(warning_text, 'text')
+warning_alpha = hud.field(warning_text, 'color', step=4, convert=lambda alpha: color.rgba(255, 0, 0, alpha))
+startup.phase('ui')
+
 # ============================================================================
 # EXIT DOOR - Goal of the game
 # ============================================================================
 exit_door = Entity(
     model='cube',
-    position=(-29.5, 2, 0),
+    position=level.exit_door,
     scale=(0.5, 4, 3),
     color=color.rgb(100, 70, 40),
     collider='box'
@@ -504,47 +846,36 @@ exit_sign = Text(
 )
 
 # ============================================================================
-# GAME FUNCTIONS
+# OVERLAYS - Jumpscare, death and win screens, created once and reused
 # ============================================================================
-def trigger_death():
-    global game_over
-    if game_over:
+# Dying or winning only shows these and restarting hides them again, so a
+# session of any number of restarts keeps the same entities. Nobody sees
+# them at the start, so they're built after the first frame (or on the
+# first death or win, if that's sooner).
+jumpscare = None
+death_overlays = ()
+win_overlays = ()
+
+def build_overlays():
+    global jumpscare, score_text, death_overlays, win_overlays
+    if jumpscare is not None:
         return
-    game_over = True
-    player.enabled = False
-    
-    # Stop breathing and play scream jumpscare
-    breathing_audio.stop()
-    scream_audio.play()
-    
-    # JUMPSCARE - Ghost face fills screen
     jumpscare = Entity(
         parent=camera.ui,
         model='quad',
         texture=ghost_texture,
         scale=(1.5, 1.5),
         position=(0, 0),
-        z=0
+        z=0,
+        enabled=False
     )
-    
-    # Flash red screen rapidly for jumpscare effect
-    for i in range(5):
-        invoke(setattr, jumpscare, 'color', color.red, delay=i*0.1)
-        invoke(setattr, jumpscare, 'color', color.white, delay=i*0.1 + 0.05)
-    
-    # Remove jumpscare after a moment and show death screen
-    invoke(destroy, jumpscare, delay=1.5)
-    
-    # Death screen (delayed to show after jumpscare)
-    invoke(show_death_screen, delay=1.5)
-
-def show_death_screen():
     death_screen = Entity(
         parent=camera.ui,
         model='quad',
         scale=(2, 1),
         color=color.rgba(100, 0, 0, 200),
-        z=1
+        z=1,
+        enabled=False
     )
     death_text = Text(
         text='YOU DIED',
@@ -552,7 +883,8 @@ def show_death_screen():
         position=(0, 0.1),
         origin=(0, 0),
         scale=5,
-        color=color.white
+        color=color.white,
+        enabled=False
     )
     restart_text = Text(
         text='Press R to Restart',
@@ -560,23 +892,16 @@ def show_death_screen():
         position=(0, -0.1),
         origin=(0, 0),
         scale=2,
-        color=color.rgb(200, 200, 200)
+        color=color.rgb(200, 200, 200),
+        enabled=False
     )
-
-def trigger_win():
-    global game_won
-    if game_won:
-        return
-    game_won = True
-    player.enabled = False
-    
-    # Win screen
     win_screen = Entity(
         parent=camera.ui,
         model='quad',
         scale=(2, 1),
         color=color.rgba(0, 50, 0, 200),
-        z=1
+        z=1,
+        enabled=False
     )
     win_text = Text(
         text='YOU ESCAPED!',
@@ -584,116 +909,519 @@ def trigger_win():
         position=(0, 0.1),
         origin=(0, 0),
         scale=4,
-        color=color.white
+        color=color.white,
+        enabled=False
     )
     score_text = Text(
-        text=f'Sanity Remaining: {int(sanity)}%',
+        text='',
         parent=camera.ui,
         position=(0, -0.1),
         origin=(0, 0),
         scale=2,
-        color=color.rgb(200, 200, 200)
+        color=color.rgb(200, 200, 200),
+        enabled=False
     )
+    death_overlays = (death_screen, death_text, restart_text)
+    win_overlays = (win_screen, win_text, score_text)
+
+deferred.defer(build_overlays)
+startup.phase('overlays')
+
+# Delayed steps of the death sequence, cancelled by a restart
+overlay_events = []
+
+def show_overlays(entities):
+    for entity in entities:
+        entity.enabled = True
+
+def hide_overlays():
+    build_overlays()
+    for event in overlay_events:
+        event.cancel()
+    overlay_events.clear()
+    for entity in (jumpscare,) + death_overlays + win_overlays:
+        entity.enabled = False
+
+# ============================================================================
+# GAME FUNCTIONS
+# ============================================================================
+def trigger_death():
+    build_overlays()
+    player.enabled = False
+    
+    # Stop breathing and play scream jumpscare
+    breathing_audio.stop()
+    scream_audio.play()
+    
+    # JUMPSCARE - Ghost face fills screen
+    jumpscare.color = color.red
+    jumpscare.enabled = True
+    
+    # Flash red screen rapidly for jumpscare effect
+    for i in range(5):
+        if i:
+            overlay_events.append(effects.invoke(setattr, jumpscare, 'color', color.red, delay=i*0.1))
+        overlay_events.append(effects.invoke(setattr, jumpscare, 'color', color.white, delay=i*0.1 + 0.05))
+    
+    # Hide jumpscare after a moment and show death screen
+    overlay_events.append(effects.invoke(setattr, jumpscare, 'enabled', False, delay=1.5))
+    
+    # Death screen (delayed to show after jumpscare)
+    overlay_events.append(effects.invoke(show_death_screen, delay=1.5))
+
+def show_death_screen():
+    show_overlays(death_overlays)
+
+def trigger_win():
+    build_overlays()
+    player.enabled = False
+    
+    # Win screen
+    score_text.text = f'Sanity Remaining: {int(sim.sanity)}%'
+    show_overlays(win_overlays)
 
 def restart_game():
-    global game_over, game_won, sanity, stamina, ambient_fear
-    game_over = False
-    game_won = False
-    sanity = 100
-    stamina = 100
-    ambient_fear = 0
+    global previous_positions, restart_pending
+    sim.reset()
+    # The next recorded tick tells the replay to restart here too
+    restart_pending = True
+    previous_positions = (sim.player.x, sim.player.z, sim.ghost.x, sim.ghost.z)
     
     # Reset positions
-    player.position = Vec3(-25, 2, -25)
+    player.position = Vec3(*level.player_start)
     player.enabled = True
-    ghost.position = Vec3(20, 2, 20)
-    ghost.aggression = 0
+    ghost.position = Vec3(*level.ghost_start)
     
     # Restart breathing audio
     scream_audio.stop()
     breathing_audio.play()
     
     # Clear UI elements
-    for entity in camera.ui.children:
-        if hasattr(entity, 'text') and entity.text in ['YOU DIED', 'YOU ESCAPED!', 'Press R to Restart']:
-            destroy(entity)
+    hide_overlays()
+
+def show_hallucination():
+    """Hallucination effect - screen flashes"""
+    screen_flash.enabled = True
+    effects.invoke(setattr, screen_flash, 'enabled', False, delay=0.1)
+
+# What the renderer does for each simulation event
+event_handlers = {
+    'death': trigger_death,
+    'win': trigger_win,
+    'hallucination': show_hallucination,
+}
+
+# ============================================================================
+# SOAK TEST - Die or win, restart, repeat (--soak N)
+# ============================================================================
+# Every restart has to leave the scene as it found it. The counts are taken
+# after a warm up, once caches have settled, and checked again after the
+# last restart. Entity and sequence counts must match exactly. Resident
+# memory moves by up to ~10 MB either way as frames are rendered, so it is
+# compared as the median of the first and last quarter of the restarts after
+# the warm up, with a margin.
+SOAK_WARMUP = 50
+SOAK_MEMORY_MB = 16
+soak_restarts = 0
+soak_frames = 0
+soak_baseline = None
+soak_memory = []
+
+def update_soak():
+    """One frame of the soak test: end the game, linger a few frames, restart"""
+    global soak_restarts, soak_frames, soak_baseline
+    if not (sim.game_over or sim.game_won):
+        # Alternate deaths, straight through to the death screen, and wins
+        if soak_restarts % 2:
+            sim.game_won = True
+            trigger_win()
+        else:
+            sim.game_over = True
+            trigger_death()
+            show_death_screen()
+        # Restart at varying points of the jumpscare
+        soak_frames = soak_restarts % 5
+        return
+    if soak_frames > 0:
+        soak_frames -= 1
+        return
+    restart_game()
+    soak_restarts += 1
+    if soak_restarts == SOAK_WARMUP:
+        soak_baseline = (len(scene.entities), len(application.sequences))
+    if soak_restarts > SOAK_WARMUP:
+        soak_memory.append(memory_mb() or 0)
+    # Stop counting once done, the quit takes effect a frame later
+    if soak_restarts != max(SOAK, SOAK_WARMUP + 4):
+        return
+    entities, sequences = len(scene.entities), len(application.sequences)
+    start_entities, start_sequences = soak_baseline
+    quarter = len(soak_memory) // 4
+    start_memory = statistics.median(soak_memory[:quarter])
+    memory = statistics.median(soak_memory[-quarter:])
+    print(f'SOAK: {soak_restarts} restarts | entities {start_entities} -> {entities} | '
+          f'sequences {start_sequences} -> {sequences} | memory {start_memory:.1f} -> {memory:.1f} MB')
+    if entities != start_entities or sequences > start_sequences or memory - start_memory > SOAK_MEMORY_MB:
+        sys.exit('SOAK: failed, restarts are leaking')
+    print('SOAK: passed')
+    application.quit()
 
 # ============================================================================
 # INPUT HANDLING
 # ============================================================================
 def input(key):
-    if key == 'r' and (game_over or game_won):
+    if key == 'r' and (sim.game_over or sim.game_won) and not replay_player:
         restart_game()
     if key == 'escape':
         application.quit()
+    if key == 'f2':
+        # Compare batched vs unbatched static geometry
+        report_batching()
+        static_batcher.toggle()
+        if streamer:
+            streamer.set_batched(static_batcher.batched)
+        frame_times.clear()
+    if key == 'f5' and room_graph:
+        toggle_culling()
+    if key == 'f3':
+        build_debug_text()
+        light_stats_text.enabled = not light_stats_text.enabled
+    if key == 'f6':
+        hud.set_reactive(not hud.reactive)
+        print(f'HUD: {"reactive" if hud.reactive else "eager"} updates')
+    if key == 'f4':
+        # The overlay turns profiling on; it stays on if --profile was given
+        build_debug_text()
+        profile_text.enabled = not profile_text.enabled
+        profiler.set_enabled(PROFILE or profile_text.enabled)
 
 # ============================================================================
 # MAIN UPDATE LOOP
 # ============================================================================
 def update():
-    global sanity, stamina, flicker_timer, ambient_fear
+    profiler.end_frame(time.dt)
     
-    if game_over or game_won:
+    # What the first frame did without, once it's out
+    if not deferred.done and 'first_frame' in startup_times:
+        run_deferred(DEFERRED_LOADING_MS if loading_screen else DEFERRED_PLAYING_MS)
+    if loading_screen and not finish_loading():
         return
+    if STARTUP_REPORT and deferred.done:
+        write_startup_report()
+    # Not while deferred work still takes its share of the frame
+    if QUALITY == 'auto' and deferred.done:
+        update_quality()
+    animation_dt = animation_step()
     
-    # Sprint mechanics
-    if held_keys['shift'] and stamina > 0:
-        player.speed = sprint_speed
-        stamina = max(0, stamina - stamina_drain * time.dt)
-    else:
-        player.speed = normal_speed
-        stamina = min(100, stamina + stamina_regen * time.dt)
+    # Rolling frame time window for the batching comparison
+    frame_times.append(time.dt)
+    if len(frame_times) > 120:
+        frame_times.pop(0)
+    
+    if streamer:
+        streamer.update(player.x, player.z)
+    update_lights(animation_dt)
+    if profile_text and profile_text.enabled:
+        update_profile_overlay()
+    effects.advance(time.dt)
+    
+    if SOAK:
+        update_soak()
+        return
+    
+    # The benchmark drives the camera itself, the game doesn't run
+    if flythrough:
+        flythrough.update()
+        return
+    
+    # A replay keeps ticking after a death, its next tick is the restart
+    if (sim.game_over or sim.game_won) and not replay_player:
+        return
+    
+    if not step_simulation():
+        return
+    
+    # Draw player and ghost between the last two ticks
+    alpha = sim_clock.alpha
+    player_x, player_z, ghost_x, ghost_z = previous_positions
+    player.x = lerp(player_x, sim.player.x, alpha)
+    player.z = lerp(player_z, sim.player.z, alpha)
+    ghost.x = lerp(ghost_x, sim.ghost.x, alpha)
+    ghost.z = lerp(ghost_z, sim.ghost.z, alpha)
+    if ghost_pool:
+        update_swarm(alpha)
+    
+    # Mouse look shows up right away, even before the next tick uses it
+    player.rotation_y = sim.player.yaw + look_x * sim.mouse_sensitivity
+    player.camera_pivot.rotation_x = clamp(sim.player.pitch - look_y * sim.mouse_sensitivity, -90, 90)
     
+    if animation_dt:
+        update_hud()
+
+def late_update(task):
+    """Runs after update() and every entity has moved, before the frame is drawn"""
+    # Culling from this frame's camera, or rooms pop in a frame late
+    if culling_enabled:
+        update_culling()
+    # After this frame's triggers, so a sound played this frame counts as on time
+    audio.update(time.dt)
+    # Instance buffers go to the GPU once everything has moved
+    bulbs.flush()
+    for model in prop_models.values():
+        model.flush()
+    return task.cont
+
+application.base.taskMgr.add(late_update, 'late_update', sort=1)
+
+def finish_loading():
+    """Apply finished assets; True once everything is in and the game can start"""
+    global loading_screen
+    if 'first_frame' not in startup_times:
+        startup_times['first_frame'] = time.perf_counter() - launch_time
+        startup.phase('run')
+        print(f'STARTUP: {startup.report()} | scene {"from cache" if scene_cached else "built"}')
+    assets.poll()
+    loading_screen.progress = assets.progress
+    if not assets.ready:
+        return False
+    # Runs that time frames start with everything built
+    if not deferred.done and (BENCHMARK or SOAK or replay_player):
+        run_deferred(float('inf'))
+    loading_screen.finish()
+    loading_screen = None
+    startup_times['interactive'] = time.perf_counter() - launch_time
+    print(f'STARTUP: first frame {startup_times["first_frame"]:.2f} s | interactive {startup_times["interactive"]:.2f} s | '
+          f'{assets.loaded} assets ({assets.cache_hits} textures from cache), {len(assets.missing)} missing')
+    for path in assets.missing:
+        print(f'STARTUP: missing {path}, using a placeholder')
+    return True
+
+def run_deferred(budget_ms):
+    if not deferred.run(budget_ms):
+        return
+    startup_times['deferred_done'] = time.perf_counter() - launch_time
+    stats = deferred.stats
+    print(f'STARTUP: deferred {stats["jobs"]} jobs ({stats["steps"]} steps) done at {startup_times["deferred_done"]:.2f} s | '
+          f'{stats["ms"]:.0f} ms over {stats["frames"]} frames, slowest {stats["slowest_ms"]:.1f} ms')
+
+def write_startup_report():
+    """--startup-report: everything is built, save the timings and quit"""
+    report = dict(startup_times, phases=startup.phases, deferred=deferred.stats, scene_cached=scene_cached)
+    report.setdefault('deferred_done', startup_times['interactive'])
+    with open(STARTUP_REPORT, 'w') as f:
+        json.dump(report, f, indent=1)
+    application.quit()
+
+def update_lights(dt):
+    # Hand the PointLight pool to the lights nearest the camera, at the
+    # quality level's animation rate (dt is 0 on the frames in between)
+    update_light_states()
+    if not dt:
+        return
+    light_manager.update(camera.world_position, camera.forward, dt)
+    if light_stats_text and light_stats_text.enabled:
+        stats = light_manager.stats
+        text = f'LIGHTS {stats["active"]}/{light_manager.max_active} (fading {stats["fading"]}) of {stats["candidates"]}'
+        if room_graph:
+            text += (f'\nROOMS {len(room_graph.rects) - cull_stats["rooms"]}/{len(room_graph.rects)} visible | '
+                     f'culled {cull_stats["objects"]} objects, {cull_stats["lights"]} lights')
+        if streamer:
+            stats = streamer.stats
+            text += f'\nCHUNKS {stats["chunks"]} | {stats["entities"]} props | {len(scene.entities)} entities | {stats["peak_mb"]:.0f} MB'
+        text += f'\nTRIGGERS {len(sim.triggers.volumes)} volumes | room {sim.player_room or "-"}'
+        stats = hud.stats
+        text += (f'\nHUD {stats["writes_per_second"]:.0f} writes/s, {stats["writes_per_frame"]:.1f} per frame '
+                 f'({"reactive" if hud.reactive else "eager"})')
+        stats = audio.stats
+        if stats['latency_ms'] is None:
+            text += '\nAUDIO nothing played yet'
+        else:
+            text += f'\nAUDIO last play heard after {stats["latency_ms"]:.1f} ms, {stats["latency_frames"]} frames (max {stats["max_latency_frames"]})'
+        text += f' | {stats["volume_writes"]} volume writes'
+        stats = governor.stats
+        text += (f'\nQUALITY {stats["level"]} ({"auto" if QUALITY == "auto" else "fixed"}) | '
+                 f'p90 {stats["p90_ms"]:.1f} ms for {TARGET_FPS} fps | {len(governor.decisions)} changes')
+        light_stats.set(text)
+
+def update_light_states():
+    """Switch the lights sim turned off or on since last frame"""
+    states = sim.lights
+    for light in lights:
+        is_on = states[light.index].is_on
+        if is_on != light.is_on:
+            light.switch(is_on)
+
+def update_culling():
+    """Switch rooms on and off when the set the camera can see changes"""
+    global visible_rooms
+    lens = camera.perspective_lens
+    half_fov = view_half_angle(lens.get_hfov(), lens.get_vfov(), camera.world_rotation_x)
+    position = camera.world_position
+    rooms = room_graph.visible_rooms(position.x, position.z, camera.world_rotation_y, half_fov)
+    if rooms != visible_rooms:
+        visible_rooms = rooms
+        apply_culling(rooms)
+
+def apply_culling(rooms):
+    """Enable everything seen from the given rooms (all of it for None)"""
+    culled_objects = 0
+    culled_lights = 0
+    for group_rooms, entities in cull_groups.items():
+        seen = rooms is None or not group_rooms.isdisjoint(rooms)
+        for entity in entities:
+            entity.enabled = seen
+        for node in cull_nodes.get(group_rooms, ()):
+            if seen:
+                node.unstash()
+            else:
+                node.stash()
+        if not seen:
+            lights_here = sum(isinstance(entity, FlickeringLight) for entity in entities)
+            culled_lights += lights_here
+            culled_objects += len(entities) - lights_here
+    cull_stats['rooms'] = len(room_graph.rects) - len(rooms) if rooms is not None else 0
+    cull_stats['objects'] = culled_objects
+    cull_stats['lights'] = culled_lights
+
+def toggle_culling():
+    global culling_enabled, visible_rooms
+    culling_enabled = not culling_enabled
+    visible_rooms = None
+    apply_culling(None)
+    print(f'ROOM CULLING: {"on" if culling_enabled else "off"}')
+
+def step_simulation():
+    """Advance the game rules in fixed ticks, however long this frame was.
+    Returns False once a replay has run out."""
+    global previous_positions, look_x, look_y
+    if replay_player:
+        # Skip the first frame, it carries the loading time
+        if replay_tick_times:
+            replay_frame_times.append(time.dt)
+    else:
+        look_x += mouse.velocity[0]
+        look_y += mouse.velocity[1]
+    for i in range(sim_clock.advance(time.dt)):
+        controls = next_controls()
+        if controls is None:
+            finish_replay()
+            return False
+        previous_positions = (sim.player.x, sim.player.z, sim.ghost.x, sim.ghost.z)
+        tick_start = time.perf_counter()
+        events = sim.step(sim_clock.dt, controls)
+        if replay_player:
+            replay_tick_times.append(time.perf_counter() - tick_start)
+        if 'teleport' in events:
+            # Don't slide the ghost across the house
+            previous_positions = previous_positions[:2] + (sim.ghost.x, sim.ghost.z)
+        for event in events:
+            if event in event_handlers:
+                event_handlers[event]()
+        if sim.game_over or sim.game_won:
+            break
+    return True
+
+def update_hud():
     # Update UI
-    sanity_bar.scale_x = 0.3 * (sanity / 100)
-    stamina_bar.scale_x = 0.3 * (stamina / 100)
+    sanity_width.set(0.3 * (sim.sanity / 100))
+    stamina_width.set(0.3 * (sim.stamina / 100))
     
     # Sanity effects
-    if sanity < 50:
+    if sim.sanity < 50:
         # Screen distortion at low sanity
-        vignette.color = color.rgba(0, 0, 0, int(150 + (50 - sanity) * 2))
-    if sanity < 30:
-        # Hallucination effect - screen flashes
-        if random.random() < 0.01:
-            screen_flash.color = color.rgba(255, 0, 0, 50)
-            invoke(setattr, screen_flash, 'color', color.rgba(255, 0, 0, 0), delay=0.1)
-    if sanity <= 0:
-        trigger_death()
+        vignette_alpha.set(int(150 + (50 - sim.sanity) * 2))
     
     # Warning when ghost is close
-    ghost_dist = distance(ghost.position, player.position)
+    if sim.swarm:
+        ghost_dist = sim.swarm.nearest_distance
+    else:
+        ghost_dist = math.hypot(sim.ghost.x - sim.player.x, sim.ghost.z - sim.player.z)
     if ghost_dist < 10:
-        warning_text.text = '! ! !'
-        warning_text.color = color.rgba(255, 0, 0, int(255 * (1 - ghost_dist/10)))
-        # Increase breathing intensity when ghost is near
-        breathing_audio.volume = min(1.0, 0.4 + (10 - ghost_dist) * 0.06)
+        warning_message.set('! ! !')
+        warning_alpha.set(int(255 * (1 - ghost_dist/10)))
     else:
-        warning_text.text = ''
-        # Normal breathing volume
-        breathing_audio.volume = 0.4
+        warning_message.set('')
+    # Breathing gets louder as the ghost closes in; the audio engine ramps
+    # to it and skips changes too small to hear
+    breathing_audio.volume = 0.4 + 0.6 * attenuation(ghost_dist, 0, 10)
     
     # Heartbeat visual effect
-    if heartbeat_intensity > 0.3:
-        pulse = math.sin(time.time() * 8) * heartbeat_intensity * 0.02
-        vignette.scale = Vec2(2 + pulse, 1 + pulse)
-    
-    # Check for exit
-    if distance(player.position, exit_door.position) < 3:
-        trigger_win()
-    
-    # Ambient sanity drain (psychological pressure)
-    sanity = max(0, sanity - 0.1 * time.dt * (1 + ambient_fear))
-    
-    # Random creepy events
-    if random.random() < 0.001:
-        # Random light flicker burst
-        for light in lights:
-            light.is_on = False
-            light.off_duration = random.uniform(0.5, 2)
-    
-    # Keep player in bounds
-    player.position.x = max(-29, min(29, player.position.x))
-    player.position.z = max(-29, min(29, player.position.z))
+    if sim.heartbeat_intensity > 0.3:
+        pulse = math.sin(time.time() * 8) * sim.heartbeat_intensity * 0.02
+        vignette_pulse.set(pulse)
+    hud.end_frame()
+
+def update_profile_overlay():
+    """Refresh the F4 overlay a few times a second, not every frame"""
+    global profile_overlay_timer
+    profile_overlay_timer -= time.dt
+    if profile_overlay_timer > 0:
+        return
+    profile_overlay_timer = 0.25
+    lines = [f'{name:<7} avg {avg:6.2f} max {peak:6.2f} ms' for name, (avg, peak) in profiler.summary(1).items()]
+    profile_text.text = '\n'.join(lines)
+
+loading_screen = LoadingScreen()
+
+# ============================================================================
+# QUALITY - Held to the frame rate on slow machines (--quality, quality.py)
+# ============================================================================
+resolution = ResolutionScaler(application.base, camera.display_region)
+animation_interval = 0
+animation_wait = 0
+animation_pending = 0
+
+def apply_quality(level):
+    global animation_interval
+    light_manager.set_max_active(MAX_ACTIVE_LIGHTS if level.lights is None else min(level.lights, MAX_ACTIVE_LIGHTS))
+    resolution.set_scale(level.resolution)
+    vignette.enabled = level.overlays
+    # The ghost's opaque and see-through parts in two passes, or all in one
+    mode = TransparencyAttrib.M_dual if level.overlays else TransparencyAttrib.M_alpha
+    for entity in [ghost] + ghost_pool:
+        entity.model.set_transparency(mode)
+    animation_interval = 1 / level.animation_hz
+
+def update_quality():
+    changes = len(governor.decisions)
+    governor.update(time.dt)
+    if len(governor.decisions) > changes:
+        print(f'QUALITY: {governor.describe(governor.decisions[-1])}')
+
+def animation_step():
+    """Seconds to animate lights and the HUD by this frame, 0 if it's not time yet"""
+    global animation_wait, animation_pending
+    animation_pending += time.dt
+    animation_wait -= time.dt
+    if animation_wait > 0.001:
+        return 0
+    animation_wait = max(0, animation_wait + animation_interval)
+    dt = animation_pending
+    animation_pending = 0
+    return dt
+
+governor = QualityGovernor(apply_quality, target_fps=TARGET_FPS, level=None if QUALITY == 'auto' else level_index(QUALITY))
+if flythrough:
+    flythrough.settings['quality'] = QUALITY
+    flythrough.stats['quality'] = governor.stats
+
+# ============================================================================
+# PROFILER - Subsystem timings (--profile to capture, F4 for the overlay)
+# ============================================================================
+# sim includes ghost (sim.step_ghost), lights/ghost also cover their entities
+profiler = FrameProfiler(['lights', 'ghost', 'sim', 'hud', 'invoke', 'streaming', 'culling'], hitch_ms=HITCH_MS)
+profiler.instrument(globals(), 'update_lights', 'lights')
+profiler.instrument(sim, 'step_ghost', 'ghost')
+profiler.instrument(globals(), 'update_swarm', 'ghost')
+profiler.instrument(globals(), 'step_simulation', 'sim')
+profiler.instrument(globals(), 'update_hud', 'hud')
+profiler.instrument(globals(), 'update_culling', 'culling')
+profiler.instrument_callbacks(globals(), 'invoke', 'invoke')
+profiler.instrument_callbacks(effects, 'invoke', 'invoke')
+if streamer:
+    profiler.instrument(streamer, 'update', 'streaming')
+profiler.set_enabled(PROFILE)
+profile_overlay_timer = 0
 
 # ============================================================================
 # START GAME
@@ -704,6 +1432,19 @@ print("=" * 50)
 print("OBJECTIVE: Find the EXIT and escape the house!")
 print("WARNING: Avoid the ghost at all costs!")
 print("CONTROLS: WASD to move, SHIFT to sprint, R to restart")
+print("DEBUG: F2 to toggle static batching and print draw calls")
+print(f"DEBUG: F3 to show light stats ({MAX_ACTIVE_LIGHTS} active lights, --lights N to change)")
+print("DEBUG: F4 for the profiler overlay (--profile to capture hitches to CSV/JSON)")
+print("DEBUG: F6 to switch between reactive and every-frame HUD updates (write counts on F3)")
+print(f"DEBUG: quality {QUALITY} (--quality auto|lowest|low|medium|high, --target-fps {TARGET_FPS})")
+print(f"DEBUG: seed {sim.seed} (--seed N, --record FILE, --replay FILE)")
+if sim.swarm:
+    print(f"DEBUG: nightmare mode, {sim.swarm.count} ghosts ({len(ghost_pool) + 1} drawn)")
+if room_graph:
+    print(f"DEBUG: F5 to toggle room culling ({len(room_graph.rects)} rooms, {room_graph.portal_count} doorways)")
+if streamer:
+    report_streaming()
 print("=" * 50)
+startup.phase('setup')
 
 app.run()
@@ -0,0 +1,136 @@
+from ursina import *
+from panda3d.core import Texture as PandaTexture, Filename, AudioManager
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+
+
+# Asset pipeline: textures and audio load in the background.
+# texture() returns right away with a placeholder, a small solid color
+# texture. Image files are decoded on worker threads and copied into the
+# placeholder's Panda texture on the main thread, so everything already
+# using it (batched copies included) picks up the real image. Decoded
+# textures are written to a .txo cache (Panda's native format, no PNG
+# decoding) keyed by path, size and modification time. sound() loads a bare
+# AudioSound on a worker thread, either decoding the whole clip into memory
+# or opening it for streaming, and hands it to a callback once it's in.
+# Missing files keep their placeholder, or never call back.
+
+class AssetLoader:
+    def __init__(self, cache_dir='.cache/textures', workers=2):
+        self.cache_dir = Path(self.resolve(cache_dir))
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending_textures = []
+        self.pending_sounds = []
+        self.queued = 0
+        self.loaded = 0
+        self.cache_hits = 0
+        self.missing = []
+
+    def resolve(self, path):
+        """Paths are relative to the game folder, like ursina's own loaders"""
+        return os.path.normpath(os.path.join(str(application.asset_folder), path))
+
+    def texture(self, path, placeholder=color.rgb(90, 90, 90)):
+        """A texture that shows the placeholder color until the file is loaded"""
+        target = PandaTexture(os.path.basename(path))
+        target.setup_2d_texture(2, 2, PandaTexture.T_unsigned_byte, PandaTexture.F_rgba)
+        # RAM images are stored BGRA
+        pixel = bytes(int(c * 255) for c in (placeholder[2], placeholder[1], placeholder[0], placeholder[3]))
+        target.set_ram_image(pixel * 4)
+        texture = Texture(target)
+        texture._cached_image = None  # ursina only sets this when loading from a file
+
+        full_path = self.resolve(path)
+        if not os.path.isfile(full_path):
+            self.missing.append(path)
+            return texture
+        self.queued += 1
+        self.pending_textures.append((self.executor.submit(self.read_texture, full_path), texture, path))
+        return texture
+
+    def read_texture(self, path):
+        """Worker thread: decode from the cache if possible, else the file (and cache it)"""
+        cache_path = self.cache_path(path)
+        loaded = PandaTexture()
+        if cache_path.exists() and loaded.read(Filename.from_os_specific(str(cache_path))):
+            return loaded, True
+        if not loaded.read(Filename.from_os_specific(path)):
+            return None, False
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            loaded.write(Filename.from_os_specific(str(cache_path)))
+        except OSError:
+            pass  # Read-only install, just don't cache
+        return loaded, False
+
+    def cache_path(self, path):
+        stat = os.stat(path)
+        key = hashlib.sha1(f'{path}:{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()[:16]
+        return self.cache_dir / f'{Path(path).stem}_{key}.txo'
+
+    def sound(self, path, callback, stream=False):
+        """Load a bare AudioSound, fully decoded unless stream; callback(clip) is
+        called on the main thread once it's in"""
+        full_path = self.resolve(path)
+        if not os.path.isfile(full_path):
+            self.missing.append(path)
+            return
+        manager = base.sfxManagerList[0]
+        mode = AudioManager.SM_stream if stream else AudioManager.SM_sample
+        self.queued += 1
+        future = self.executor.submit(manager.get_sound, Filename.from_os_specific(full_path), False, mode)
+        self.pending_sounds.append((future, callback))
+
+    def poll(self):
+        """Main thread: hand finished textures to their placeholders and sounds to their callbacks"""
+        for item in [item for item in self.pending_sounds if item[0].done()]:
+            self.pending_sounds.remove(item)
+            future, callback = item
+            self.loaded += 1
+            callback(future.result())
+        for item in [item for item in self.pending_textures if item[0].done()]:
+            self.pending_textures.remove(item)
+            future, texture, path = item
+            self.loaded += 1
+            loaded, from_cache = future.result()
+            if loaded is None:
+                self.missing.append(path)
+                continue
+            self.cache_hits += from_cache
+            target = texture._texture
+            target.setup_texture(loaded.get_texture_type(), loaded.get_x_size(), loaded.get_y_size(),
+                                 loaded.get_z_size(), loaded.get_component_type(), loaded.get_format())
+            target.set_ram_image(loaded.get_ram_image())
+            texture.filtering = texture.filtering
+
+    @property
+    def ready(self):
+        return not self.pending_textures and not self.pending_sounds
+
+    @property
+    def progress(self):
+        return self.loaded / self.queued if self.queued else 1
+
+
+class LoadingScreen(Entity):
+    """Black screen with a progress bar, shown until the assets are in"""
+    def __init__(self, **kwargs):
+        super().__init__(parent=camera.ui, model='quad', scale=(2, 1), color=color.black, z=-5, **kwargs)
+        self.label = Text(text='LOADING', parent=camera.ui, position=(0, 0.05), origin=(0, 0), scale=2,
+                          color=color.rgb(150, 0, 0), z=-6)
+        self.bar = Entity(parent=camera.ui, model='quad', scale=(0, 0.01), position=(-0.3, -0.05),
+                          origin=(-0.5, 0), color=color.rgb(150, 0, 0), z=-6)
+
+    @property
+    def progress(self):
+        return self.bar.scale_x / 0.6
+
+    @progress.setter
+    def progress(self, value):
+        self.bar.scale_x = 0.6 * value
+
+    def finish(self):
+        destroy(self.label)
+        destroy(self.bar)
+        destroy(self)
@@ -0,0 +1,142 @@
+from panda3d.core import AudioManager, AudioSound, Filename
+import sys
+import time
+
+
+# Audio engine: preloaded one-shots, streamed loops, coalesced volume.
+# Short effects that have to land on the frame they're triggered, like the
+# scream, are decoded into memory while the game loads, so play() only has
+# to start a source. Long loops are streamed from disk instead. Game code
+# sets a sound's volume as often as it likes: the engine ramps the real
+# volume towards it at ramp_speed per second and only hands it to the clip
+# once it has moved by threshold or arrived. Every play() is timed until the
+# clip reports its playback position moving, which is the trigger to output
+# latency in stats, in milliseconds and in frames: 0 when the sound was
+# already running by the end of the frame that played it, 1 by the next.
+
+class Sound:
+    def __init__(self, engine, volume=1.0, loop=False):
+        self.engine = engine
+        self.clip = None
+        self.loop = loop
+        self.target = volume
+        self.level = volume     # Ramped volume
+        self.written = None     # Last volume given to the clip
+        self.wanted = False     # Playing, or would be if the clip were in
+        self.triggered = None   # (time, frame) of a play() not yet heard
+
+    @property
+    def volume(self):
+        return self.target
+
+    @volume.setter
+    def volume(self, value):
+        self.target = value
+        self.engine.stats['volume_sets'] += 1
+
+    def loaded(self, clip):
+        self.clip = clip
+        clip.set_loop(self.loop)
+        self.level = self.target
+        self.engine.write_volume(self)
+        # A one-shot that missed its moment stays quiet, a loop catches up
+        if self.loop and self.wanted:
+            self.play()
+
+    def play(self):
+        self.wanted = True
+        if self.clip is None:
+            return
+        self.clip.set_time(0)
+        self.clip.play()
+        self.triggered = (time.perf_counter(), self.engine.frame)
+
+    def stop(self):
+        self.wanted = False
+        self.triggered = None
+        if self.clip is not None:
+            self.clip.stop()
+
+
+class AudioEngine:
+    def __init__(self, assets=None, threshold=0.01, ramp_speed=2.0, volume_scale=1.0):
+        """assets is an AssetLoader to load through; volume_scale is applied on
+        top of every volume (ursina's Audio uses 0.5)"""
+        self.assets = assets
+        self.threshold = threshold
+        self.ramp_speed = ramp_speed
+        self.volume_scale = volume_scale
+        self.sounds = []
+        self.frame = 0
+        self.stats = {'sounds': 0, 'volume_sets': 0, 'volume_writes': 0,
+                      'latency_ms': None, 'latency_frames': None, 'max_latency_frames': 0}
+
+    def one_shot(self, path, volume=1.0):
+        """A short effect, decoded into memory so it starts the moment it's played"""
+        return self.add(path, volume, loop=False, stream=False)
+
+    def loop(self, path, volume=1.0, autoplay=True):
+        """A long looping sound, streamed from disk"""
+        sound = self.add(path, volume, loop=True, stream=True)
+        sound.wanted = autoplay
+        return sound
+
+    def add(self, path, volume, loop, stream):
+        sound = Sound(self, volume, loop)
+        self.sounds.append(sound)
+        self.stats['sounds'] = len(self.sounds)
+        if self.assets is not None:
+            self.assets.sound(path, sound.loaded, stream=stream)
+        return sound
+
+    def write_volume(self, sound):
+        sound.clip.set_volume(sound.level * self.volume_scale)
+        sound.written = sound.level
+        self.stats['volume_writes'] += 1
+
+    def update(self, dt):
+        """Once a frame, after the game has set its volumes and triggered its sounds"""
+        self.frame += 1
+        step = self.ramp_speed * dt
+        now = time.perf_counter()
+        for sound in self.sounds:
+            if sound.clip is None:
+                continue
+            if sound.level != sound.target:
+                sound.level += max(-step, min(step, sound.target - sound.level))
+                if abs(sound.level - sound.written) >= self.threshold or sound.level == sound.target:
+                    self.write_volume(sound)
+            if sound.triggered and sound.clip.status() == AudioSound.PLAYING and sound.clip.get_time() > 0:
+                start, frame = sound.triggered
+                sound.triggered = None
+                self.stats['latency_ms'] = (now - start) * 1000
+                self.stats['latency_frames'] = self.frame - 1 - frame
+                self.stats['max_latency_frames'] = max(self.stats['max_latency_frames'], self.stats['latency_frames'])
+
+
+def attenuation(distance, near, far):
+    """1 up to near, falling off linearly to 0 at far"""
+    if distance <= near:
+        return 1.0
+    if distance >= far:
+        return 0.0
+    return (far - distance) / (far - near)
+
+
+# python audio_engine.py [FILE] - load time and time to first output, preloaded vs streamed
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else '../../scream.mp3'
+    manager = AudioManager.create_AudioManager()
+    for name, mode in (('preloaded', AudioManager.SM_sample), ('streamed', AudioManager.SM_stream)):
+        start = time.perf_counter()
+        clip = manager.get_sound(Filename.from_os_specific(path), False, mode)
+        loaded = time.perf_counter()
+        clip.play()
+        # Poll like a 1000 fps game loop until the playback position moves
+        while clip.get_time() <= 0 and time.perf_counter() - loaded < 1:
+            manager.update()
+            time.sleep(0.001)
+        heard = time.perf_counter()
+        print(f'{name:<10} load {(loaded - start) * 1000:6.1f} ms | play to output {(heard - loaded) * 1000:6.2f} ms'
+              f'{"" if clip.get_time() > 0 else " (never started)"}')
+        clip.stop()
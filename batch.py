@@ -0,0 +1,511 @@
+import math
+import random
+import sys
+import time
+
+import numpy as np
+
+from simulation import PlayerInput, Simulation
+from swarm import downhill_table, grid_cells, lines_of_sight
+from triggers import REST_SLACK
+
+
+# Many games at once as NumPy arrays, for soak tests and balance runs. Same
+# rules as Simulation.step for every game (one ghost each): the player's
+# move and wall slide, triggers, sanity, fear, detection and ghost steering
+# are whole-array operations over the games. Only what's rare runs game by
+# game in Python: random events, teleports, room changes, deaths and wins.
+# Each game has its own ghost and event streams, seeded like Simulation's,
+# so a game plays out like Simulation(seed) given the same input, apart
+# from rounding (distances are sqrt(dx * dx + dz * dz) here, hypot() there).
+# Lights only matter to the renderer and aren't simulated.
+#
+# Per game and tick that's well under a microsecond once there are a
+# thousand or so games, against 10-20 for Simulation.step. To keep it there
+# the rare cases work on index arrays of just the games they apply to (in
+# sight, searching), walls are only tested once a player leaves the disc
+# around where they were last clear of them, and triggers only once it
+# leaves its rest radius, as in TriggerSystem. Search steering uses one
+# downhill table per sighting cell, kept across ticks and games.
+
+# Player discs are shrunk by this much so rounding can't carry a player into a wall
+CLEARANCE_SLACK = 1e-6
+MAX_SEARCH_TABLES = 1024
+
+# Per game state, saved and put back for games that have ended
+STATE = ('time', 'game_over', 'game_won', 'sanity', 'stamina', 'ghost_seen_timer', 'ambient_fear',
+         'heartbeat_intensity', 'player_room', 'player_x', 'player_z', 'player_yaw', 'player_pitch',
+         'player_speed', 'ghost_x', 'ghost_z', 'ghost_chasing', 'ghost_searching', 'seen_x', 'seen_z',
+         'aggression', 'patrol', 'teleport_timer', 'teleport_interval', 'hallucinating',
+         'next_hallucination', 'next_light_burst', 'inside', 'rest_x', 'rest_z', 'rest')
+
+
+class SimulationBatch:
+    def __init__(self, seeds, level=None, nav_cell_size=1.0):
+        """One game per seed (None for a random one). Rules, tunables and
+        level data are read from self.rules, a Simulation of the same level."""
+        count = len(seeds)
+        self.count = count
+        self.rules = rules = Simulation(seed=seeds[0] if count else None, nav_cell_size=nav_cell_size, level=level)
+        level = rules.level
+        grid = self.grid = rules.nav_grid
+        centers = [grid.cell_center(i) for i in range(grid.cols * grid.rows)]
+        self.center_x = np.array([c[0] for c in centers])
+        self.center_z = np.array([c[1] for c in centers])
+        self.patrol_x = np.array([p[0] for p in rules.patrol_points])
+        self.patrol_z = np.array([p[1] for p in rules.patrol_points])
+        self.next_cells = np.stack([downhill_table(flow.distance, grid) for flow in rules.patrol_flows])
+        self.walls = np.array(rules.wall_index.boxes, dtype=float).reshape(-1, 4)
+        self.solids = np.array(rules.solid_index.boxes, dtype=float).reshape(-1, 4)
+        # Trigger volumes in Simulation's order: the exit sphere, then the rooms
+        self.room_names = [room.name for room in level.rooms]
+        rooms = np.array([room.rect for room in level.rooms], dtype=float).reshape(-1, 4)
+        self.rooms = rooms
+        self.light_count = len(level.light_positions)
+        # Search steering: a table row per sighting cell, -1 until needed
+        self.search_rows = np.full(grid.cols * grid.rows, -1, dtype=np.int64)
+        self.search_tables = np.zeros((0, grid.cols * grid.rows), dtype=np.int64)
+        self.search_count = 0
+
+        self.time = np.zeros(count)
+        self.game_over = np.zeros(count, dtype=bool)
+        self.game_won = np.zeros(count, dtype=bool)
+        self.sanity = np.zeros(count)
+        self.stamina = np.zeros(count)
+        self.ghost_seen_timer = np.zeros(count)
+        self.ambient_fear = np.zeros(count)
+        self.heartbeat_intensity = np.zeros(count)
+        self.player_room = np.full(count, -1, dtype=np.int64)  # Index into room_names
+        self.player_x = np.zeros(count)
+        self.player_z = np.zeros(count)
+        self.player_yaw = np.zeros(count)
+        self.player_pitch = np.zeros(count)
+        self.player_speed = np.zeros(count)
+        self.ghost_x = np.zeros(count)
+        self.ghost_z = np.zeros(count)
+        self.ghost_chasing = np.zeros(count, dtype=bool)
+        self.ghost_searching = np.zeros(count, dtype=bool)  # Lost sight, heading for seen_x, seen_z
+        self.seen_x = np.zeros(count)
+        self.seen_z = np.zeros(count)
+        self.aggression = np.zeros(count)
+        self.patrol = np.zeros(count, dtype=np.int64)
+        self.teleport_timer = np.zeros(count)
+        self.teleport_interval = np.zeros(count)
+        self.hallucinating = np.zeros(count, dtype=bool)
+        self.next_hallucination = np.full(count, math.inf)
+        self.next_light_burst = np.full(count, math.inf)
+        self.inside = np.zeros((count, 1 + len(rooms)), dtype=bool)
+        # Where each player can't touch a wall: center and squared radius
+        self.free_x = np.zeros(count)
+        self.free_z = np.zeros(count)
+        self.free = np.zeros(count)
+        # Where each player last queried the triggers: center and squared rest radius
+        self.rest_x = np.zeros(count)
+        self.rest_z = np.zeros(count)
+        self.rest = np.zeros(count)
+        self.events = [[] for i in range(count)]  # Since each game's reset
+        self.stats = {'ticks': 0, 'wall_tests': 0, 'search_tables': 0}
+
+        self.seeds = [None] * count
+        self.ghost_rngs = [None] * count
+        self.event_rngs = [None] * count
+        for game, seed in enumerate(seeds):
+            self.reseed(game, seed)
+            self.reset(game)
+
+    def reseed(self, game, seed=None):
+        """Simulation.reseed() for one game; reset(game) after"""
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seeds[game] = seed
+        self.ghost_rngs[game] = random.Random(f'{seed}:ghost')
+        self.event_rngs[game] = random.Random(f'{seed}:events')
+
+    def reset(self, game):
+        """Simulation.reset() for one game"""
+        rules = self.rules
+        level = rules.level
+        self.time[game] = 0
+        self.game_over[game] = False
+        self.game_won[game] = False
+        self.sanity[game] = 100
+        self.stamina[game] = 100
+        self.ghost_seen_timer[game] = 0
+        self.ambient_fear[game] = 0
+        self.heartbeat_intensity[game] = 0
+        self.player_room[game] = -1
+        self.inside[game] = False
+        self.rest[game] = 0
+        self.player_x[game] = level.player_start[0]
+        self.player_z[game] = level.player_start[2]
+        self.player_yaw[game] = 0
+        self.player_pitch[game] = 0
+        self.player_speed[game] = rules.normal_speed
+        self.free[game] = 0
+        self.ghost_x[game] = level.ghost_start[0]
+        self.ghost_z[game] = level.ghost_start[2]
+        self.ghost_chasing[game] = False
+        self.ghost_searching[game] = False
+        self.aggression[game] = 0
+        self.patrol[game] = 0
+        self.teleport_timer[game] = 0
+        self.teleport_interval[game] = self.ghost_rngs[game].uniform(8, 15)
+        self.hallucinating[game] = False
+        self.next_hallucination[game] = math.inf
+        rate = rules.light_burst_rate
+        self.next_light_burst[game] = self.event_rngs[game].expovariate(rate) if rate > 0 else math.inf
+        self.events[game] = []
+
+    def step(self, dt, controls):
+        """Simulation.step(dt, controls) for every game. controls is a
+        PlayerInput of arrays (or scalars for all games). Games that have
+        ended stay as they are until reset()."""
+        rules = self.rules
+        self.stats['ticks'] += 1
+        # Every game steps as an array, and the ones that ended are put back
+        # afterwards; Python side effects (events, rolls) skip them
+        ended = self.game_over | self.game_won
+        frozen = []
+        if ended.any():
+            self.freeze(frozen, ended.nonzero()[0])
+        self.time += dt
+        self.step_player(dt, controls)
+
+        # Rules - sanity runs out before anything else happens
+        dying = ~ended & (self.sanity <= 0)
+        if dying.any():
+            games = dying.nonzero()[0]
+            self.game_over[games] = True
+            for game in games.tolist():
+                self.events[game].append('death')
+            self.freeze(frozen, games)
+            ended |= dying
+        self.step_triggers(ended)
+        won = ~ended & self.game_won
+        if won.any():
+            self.freeze(frozen, won.nonzero()[0])
+            ended |= won
+        self.sanity = np.maximum(0, self.sanity - rules.ambient_sanity_drain * dt * (1 + self.ambient_fear))
+        np.clip(self.player_x, rules.min_x, rules.max_x, out=self.player_x)
+        np.clip(self.player_z, rules.min_z, rules.max_z, out=self.player_z)
+
+        self.step_events(ended)
+        self.step_ghost(dt, ended)
+        for games, saved in frozen:
+            for name, values in zip(STATE, saved):
+                getattr(self, name)[games] = values
+
+    def freeze(self, frozen, games):
+        frozen.append((games, [getattr(self, name)[games] for name in STATE]))
+
+    def step_player(self, dt, controls):
+        rules = self.rules
+        forward, strafe, sprint, mouse_dx, mouse_dy = (np.asarray(value) for value in controls)
+        self.player_yaw += mouse_dx * rules.mouse_sensitivity
+        if mouse_dy.any():
+            self.player_pitch = np.clip(self.player_pitch - mouse_dy * rules.mouse_sensitivity, -90, 90)
+
+        # Sprint mechanics
+        sprinting = sprint & (self.stamina > 0)
+        self.player_speed = np.where(sprinting, rules.sprint_speed, rules.normal_speed)
+        self.stamina = np.where(sprinting, np.maximum(0, self.stamina - rules.stamina_drain * dt),
+                                np.minimum(100, self.stamina + rules.stamina_regen * dt))
+
+        moving = np.broadcast_to((forward != 0) | (strafe != 0), (self.count,)).nonzero()[0]
+        if not len(moving):
+            return
+        if forward.ndim:
+            forward = forward[moving]
+        if strafe.ndim:
+            strafe = strafe[moving]
+        yaw = np.radians(self.player_yaw[moving])
+        sin_yaw = np.sin(yaw)
+        cos_yaw = np.cos(yaw)
+        # Same axes as ursina's forward/right for rotation_y
+        dx = sin_yaw * forward + cos_yaw * strafe
+        dz = cos_yaw * forward - sin_yaw * strafe
+        length = np.sqrt(dx * dx + dz * dz)
+        moved = length != 0
+        if not moved.all():
+            moving, dx, dz, length = moving[moved], dx[moved], dz[moved], length[moved]
+        step = self.player_speed[moving] * dt / length
+        x = self.player_x[moving]
+        z = self.player_z[moving]
+        new_x = x + dx * step
+        new_z = z + dz * step
+
+        # Inside its free disc a move can't touch a wall, outside it's tested
+        fx = new_x - self.free_x[moving]
+        fz = new_z - self.free_z[moving]
+        test = (fx * fx + fz * fz >= self.free[moving]).nonzero()[0]
+        if len(test):
+            self.stats['wall_tests'] += len(test)
+            radius = rules.player_radius
+            distance = self.wall_distance(new_x[test], new_z[test])
+            clear = (distance >= radius * radius).all(axis=1)
+            # Clear: a new disc around here, as far as the nearest box allows
+            games = moving[test[clear]]
+            self.free_x[games] = new_x[test[clear]]
+            self.free_z[games] = new_z[test[clear]]
+            clearance = np.maximum(np.sqrt(distance[clear].min(axis=1, initial=math.inf)) - radius - CLEARANCE_SLACK, 0)
+            self.free[games] = clearance * clearance
+            # Blocked - try one axis at a time so the player slides along walls
+            blocked = test[~clear]
+            if len(blocked):
+                slide_x = (self.wall_distance(new_x[blocked], z[blocked]) >= radius * radius).all(axis=1)
+                slide_z = ~slide_x & (self.wall_distance(x[blocked], new_z[blocked]) >= radius * radius).all(axis=1)
+                new_x[blocked] = np.where(slide_x, new_x[blocked], x[blocked])
+                new_z[blocked] = np.where(slide_z, new_z[blocked], z[blocked])
+        self.player_x[moving] = new_x
+        self.player_z[moving] = new_z
+
+    def wall_distance(self, x, z):
+        """Squared distance from every (x, z) to every solid box, as WallIndex.overlaps() measures it"""
+        boxes = self.solids
+        x = x[:, None]
+        z = z[:, None]
+        px = np.minimum(np.maximum(x, boxes[:, 0]), boxes[:, 2]) - x
+        pz = np.minimum(np.maximum(z, boxes[:, 1]), boxes[:, 3]) - z
+        return px * px + pz * pz
+
+    def step_triggers(self, ended):
+        """TriggerSystem.update() with the exit and the rooms, which also
+        only queries players that left their rest radius"""
+        rules = self.rules
+        x = self.player_x
+        z = self.player_z
+        dx = x - self.rest_x
+        dz = z - self.rest_z
+        query = (dx * dx + dz * dz >= self.rest).nonzero()[0]
+        if not len(query):
+            return
+        x = x[query]
+        z = z[query]
+        dx = x - rules.exit_x
+        dz = z - rules.exit_z
+        exit_distance = np.sqrt(dx * dx + dz * dz)
+        rooms = self.rooms
+        x = x[:, None]
+        z = z[:, None]
+        in_room = (rooms[:, 0] <= x) & (x <= rooms[:, 2]) & (rooms[:, 1] <= z) & (z <= rooms[:, 3])
+        now = np.empty((len(query), self.inside.shape[1]), dtype=bool)
+        now[:, 0] = dx * dx + dz * dz < rules.exit_range * rules.exit_range
+        now[:, 1:] = in_room
+        entered = now & ~self.inside[query]
+        self.inside[query] = now
+
+        # Rest radius: the nearest volume edge
+        outside_x = np.maximum(np.maximum(rooms[:, 0] - x, x - rooms[:, 2]), 0)
+        outside_z = np.maximum(np.maximum(rooms[:, 1] - z, z - rooms[:, 3]), 0)
+        inside_edge = np.minimum(np.minimum(x - rooms[:, 0], rooms[:, 2] - x), np.minimum(z - rooms[:, 1], rooms[:, 3] - z))
+        edge = np.where(in_room, inside_edge, np.sqrt(outside_x * outside_x + outside_z * outside_z))
+        radius = np.minimum(edge.min(axis=1, initial=math.inf), np.abs(exit_distance - rules.exit_range)) - REST_SLACK
+        self.rest_x[query] = x[:, 0]
+        self.rest_z[query] = z[:, 0]
+        self.rest[query] = np.where(radius > 0, radius * radius, 0)
+
+        for i in (entered.any(axis=1) & ~ended[query]).nonzero()[0].tolist():
+            # Entered in the order they were added: the exit first
+            game = query[i]
+            events = self.events[game]
+            for volume in entered[i].nonzero()[0].tolist():
+                if volume == 0:
+                    self.game_won[game] = True
+                    events.append('win')
+                else:
+                    self.player_room[game] = volume - 1
+                    events.append('room')
+
+    def step_events(self, ended):
+        """The hallucination and light burst processes, due by now"""
+        rules = self.rules
+        time = self.time
+        due = (self.next_hallucination <= time) | (self.next_light_burst <= time)
+        for game in (due & ~ended).nonzero()[0].tolist():
+            rng = self.event_rngs[game]
+            now = time[game]
+            events = self.events[game]
+            while True:
+                hallucination = self.next_hallucination[game]
+                light_burst = self.next_light_burst[game]
+                if min(hallucination, light_burst) > now:
+                    break
+                if hallucination <= light_burst:
+                    self.next_hallucination[game] = hallucination + rng.expovariate(rules.hallucination_rate)
+                    events.append('hallucination')
+                else:
+                    self.next_light_burst[game] = light_burst + rng.expovariate(rules.light_burst_rate)
+                    for light in range(self.light_count):
+                        rng.uniform(0.5, 2)
+                    events.append('light_burst')
+        # Sanity effects - hallucination flashes at low sanity
+        hallucinating = self.sanity < 30
+        for game in ((hallucinating != self.hallucinating) & ~ended).nonzero()[0].tolist():
+            rate = rules.hallucination_rate if hallucinating[game] else 0
+            self.hallucinating[game] = hallucinating[game]
+            self.next_hallucination[game] = time[game] + self.event_rngs[game].expovariate(rate) if rate > 0 else math.inf
+
+    def step_ghost(self, dt, ended):
+        rules = self.rules
+        count = self.count
+        px = self.player_x
+        pz = self.player_z
+        x = self.ghost_x
+        z = self.ghost_z
+        dx = px - x
+        dz = pz - z
+        distance = np.sqrt(dx * dx + dz * dz)
+
+        # Increase aggression over time
+        self.aggression += dt * rules.aggression_rate
+
+        # Detection - in range and no wall in between. Most ghosts see
+        # nothing, so everything calms down and the few that see are redone.
+        detection_range = rules.detection_range
+        seen = (distance < detection_range).nonzero()[0]
+        if len(seen):
+            seen = seen[lines_of_sight(self.walls, x[seen], z[seen], px[seen, None], pz[seen, None])]
+        chasing = np.zeros(count, dtype=bool)
+        chasing[seen] = True
+        self.ghost_chasing = chasing
+        seen_timer = self.ghost_seen_timer[seen] + dt
+        fear = np.minimum(1, self.ambient_fear[seen] + dt * 0.1)
+        self.ghost_seen_timer = np.maximum(0, self.ghost_seen_timer - dt * 0.5)
+        self.ambient_fear = np.maximum(0, self.ambient_fear - dt * 0.05)
+        self.heartbeat_intensity = np.maximum(0, self.heartbeat_intensity - dt * 0.3)
+        if len(seen):
+            closeness = detection_range - distance[seen]
+            self.seen_x[seen] = px[seen]
+            self.seen_z[seen] = pz[seen]
+            self.ghost_seen_timer[seen] = seen_timer
+            self.sanity[seen] = np.maximum(0, self.sanity[seen] - closeness * rules.sight_sanity_drain * dt)
+            self.ambient_fear[seen] = fear
+            self.heartbeat_intensity[seen] = np.minimum(1, closeness / detection_range)
+
+        # Patrollers follow their patrol point's flow field, searchers
+        # player_flow to the last sighting, or straight at the target when
+        # the field has no step; chasers head straight for the player
+        searching = self.ghost_searching
+        searching[seen] = True
+        searchers = (searching & ~chasing).nonzero()[0]
+        cells = grid_cells(self.grid, x, z)
+        target_x = self.patrol_x[self.patrol]
+        target_z = self.patrol_z[self.patrol]
+        next_cell = self.next_cells[self.patrol, cells]
+        if len(searchers):
+            target_x[searchers] = self.seen_x[searchers]
+            target_z[searchers] = self.seen_z[searchers]
+            rows = self.search_table_rows(target_x[searchers], target_z[searchers])
+            next_cell[searchers] = self.search_tables[rows, cells[searchers]]
+        aim_x = self.center_x[next_cell]
+        aim_z = self.center_z[next_cell]
+        no_flow = ((next_cell < 0) | ((aim_x == x) & (aim_z == z))).nonzero()[0]
+        aim_x[no_flow] = target_x[no_flow]
+        aim_z[no_flow] = target_z[no_flow]
+        aim_x[seen] = px[seen]
+        aim_z[seen] = pz[seen]
+        dx = aim_x - x
+        dz = aim_z - z
+        length = np.sqrt(dx * dx + dz * dz)
+        moving = length > 0
+        speed = np.full(count, rules.ghost_speed * dt)
+        fast = searching.nonzero()[0]
+        speed[fast] = (rules.chase_speed + self.aggression[fast]) * dt
+        self.ghost_x = x + np.divide(dx, length, out=np.zeros(count), where=moving) * speed
+        self.ghost_z = z + np.divide(dz, length, out=np.zeros(count), where=moving) * speed
+        dx = self.ghost_x - target_x
+        dz = self.ghost_z - target_z
+        target_distance = np.sqrt(dx * dx + dz * dz)
+        arrived = (~searching & (target_distance < 2)).nonzero()[0]
+        self.patrol[arrived] = (self.patrol[arrived] + 1) % len(self.patrol_x)
+        searching[searchers[target_distance[searchers] < rules.search_radius]] = False
+
+        # Random teleportation
+        self.teleport_timer += dt
+        for game in ((self.teleport_timer > self.teleport_interval) & ~ended).nonzero()[0].tolist():
+            self.teleport_ghost(game)
+
+        # Kill player if too close
+        for game in ((distance < rules.kill_range) & ~ended).nonzero()[0].tolist():
+            self.game_over[game] = True
+            self.events[game].append('death')
+
+    def search_table_rows(self, x, z):
+        """Row of search_tables steering toward each (x, z), like player_flow aimed there"""
+        raw = grid_cells(self.grid, x, z)
+        rows = self.search_rows[raw]
+        if (rows < 0).any():
+            flow = self.rules.player_flow
+            for cell in np.unique(raw[rows < 0]).tolist():
+                if self.search_count == MAX_SEARCH_TABLES:
+                    self.search_rows[:] = -1
+                    self.search_count = 0
+                if self.search_count == len(self.search_tables):
+                    grown = np.zeros((max(16, 2 * self.search_count), len(self.search_rows)), dtype=np.int64)
+                    grown[:self.search_count] = self.search_tables[:self.search_count]
+                    self.search_tables = grown
+                # Flow fields only depend on the cell, so its center stands in
+                flow.update(*self.grid.cell_center(cell))
+                self.search_tables[self.search_count] = downhill_table(flow.distance, self.grid)
+                self.search_rows[cell] = self.search_count
+                self.search_count += 1
+                self.stats['search_tables'] += 1
+            rows = self.search_rows[raw]
+        return rows
+
+    def teleport_ghost(self, game):
+        """Simulation.teleport_ghost(), with the same rolls"""
+        rules = self.rules
+        rng = self.ghost_rngs[game]
+        aggression = self.aggression[game]
+        self.teleport_timer[game] = 0
+        self.teleport_interval[game] = rng.uniform(5, 12) - aggression
+        if rng.random() < 0.3 + aggression * 0.1:
+            angle = rng.uniform(0, 360)
+            dist = rng.uniform(8, 15)
+            new_x = self.player_x[game] + math.cos(math.radians(angle)) * dist
+            new_z = self.player_z[game] + math.sin(math.radians(angle)) * dist
+            new_x = max(rules.min_x + 1, min(rules.max_x - 1, new_x))
+            new_z = max(rules.min_z + 1, min(rules.max_z - 1, new_z))
+            self.ghost_x[game], self.ghost_z[game] = rules.nav_grid.nearest_free(new_x, new_z)
+        else:
+            self.ghost_x[game], self.ghost_z[game] = rng.choice(rules.patrol_points)
+        self.events[game].append('teleport')
+
+
+def soak(sim_seconds, games=2048, dt=1 / 60, seed=1):
+    """Back to back games with wandering bots, restarting on death or
+    escape, games at a time. Returns a stats dict."""
+    batch = SimulationBatch(range(seed, seed + games))
+    bot = np.random.default_rng(seed)
+    ticks = int(sim_seconds / games / dt)
+    finished = 0
+    events = 0
+    next_seed = seed + games
+    start = time.perf_counter()
+    for tick in range(ticks):
+        if tick % 30 == 0:
+            controls = PlayerInput(1, bot.integers(-1, 2, games), bot.random(games) < 0.3, bot.uniform(-0.5, 0.5, games), 0)
+        batch.step(dt, controls)
+        ended = batch.game_over | batch.game_won
+        if ended.any():
+            for game in ended.nonzero()[0].tolist():
+                finished += 1
+                events += len(batch.events[game])
+                batch.reseed(game, next_seed)
+                batch.reset(game)
+                next_seed += 1
+    elapsed = time.perf_counter() - start
+    events += sum(len(game_events) for game_events in batch.events)
+    simulated = ticks * dt * games
+    return {'sim_seconds': simulated, 'wall_seconds': elapsed, 'speed': simulated / elapsed,
+            'games': finished, 'events_per_minute': events / simulated * 60}
+
+
+# python batch.py [SIM_SECONDS] - simulated seconds per wall second at 60 Hz, by games per batch
+if __name__ == '__main__':
+    sim_seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f'{"games":>6} {"sim s / wall s":>15} {"finished":>9} {"events/min":>11}')
+    for games in (64, 256, 1024, 2048, 4096):
+        result = soak(sim_seconds, games)
+        print(f'{games:>6} {result["speed"]:>15.0f} {result["games"]:>9} {result["events_per_minute"]:>11.1f}')
@@ -0,0 +1,125 @@
+from ursina import *
+from static_batching import count_draw_calls
+from replay import percentile
+import json
+import math
+
+
+# Rendering benchmark: scripted camera flythrough, frame times to JSON.
+# Started with `python Scream.py --benchmark`. The scene renders into an
+# offscreen buffer while the camera flies the level's benchmark_route at a
+# constant speed, reaching the end after a fixed number of frames. The game
+# rules don't run, so every run draws the same frames. Frame time
+# percentiles, draw calls and vertices (all and in view) are written to
+# JSON, overall and per room.
+
+class CameraRig(Entity):
+    """Stands in for the FirstPersonController offscreen, where the mouse can't be locked"""
+    def __init__(self, height=2, **kwargs):
+        super().__init__(**kwargs)
+        self.camera_pivot = Entity(parent=self, y=height)
+        camera.parent = self.camera_pivot
+        camera.position = (0, 0, 0)
+        camera.rotation = (0, 0, 0)
+        camera.fov = 90
+
+
+class FlythroughBenchmark:
+    def __init__(self, rig, route, frames=1800, warmup=60, out_path='benchmark.json', settings=None, stats=None):
+        self.rig = rig
+        self.names = [name for name, point in route]
+        self.points = [Vec3(point[0], 0, point[2]) for name, point in route]
+        self.lengths = [distance(a, b) for a, b in zip(self.points, self.points[1:])]
+        self.total_length = sum(self.lengths)
+        self.frames = frames
+        self.warmup = warmup
+        self.out_path = out_path
+        self.settings = settings or {}
+        # Counters the game keeps updating (e.g. streaming), saved as they are at the end
+        self.stats = stats
+        self.frame = 0
+        self.frame_times = []
+        self.room_times = {}
+        self.room_draw_calls = {}
+        self.skip_frame = False
+        self.done = False
+
+    def point_at(self, travelled):
+        """Position and room name at a distance along the route"""
+        for i, length in enumerate(self.lengths):
+            if travelled <= length:
+                return lerp(self.points[i], self.points[i + 1], travelled / length), self.names[i]
+            travelled -= length
+        return self.points[-1], self.names[-2]
+
+    def update(self):
+        if self.done:
+            return
+        # Loading hitches and shader compiles land in the first frames, and
+        # the frame after a draw call count pays for walking the scene
+        measured = self.frame >= self.warmup and not self.skip_frame
+        self.skip_frame = False
+        if measured:
+            self.frame_times.append(time.dt)
+        progress = self.frame / self.frames
+        travelled = progress * self.total_length
+        position, room = self.point_at(travelled)
+        look_at, _ = self.point_at(min(self.total_length, travelled + 3))
+        self.rig.position = position
+        if look_at != position:
+            self.rig.rotation_y = math.degrees(math.atan2(look_at.x - position.x, look_at.z - position.z))
+
+        if measured:
+            self.room_times.setdefault(room, []).append(time.dt)
+        if self.frame >= self.warmup and room not in self.room_draw_calls:
+            self.room_draw_calls[room] = count_draw_calls(in_view=True)
+            self.skip_frame = True
+
+        self.frame += 1
+        if self.frame >= self.frames:
+            self.finish()
+
+    def finish(self):
+        self.done = True
+        report = self.report()
+        with open(self.out_path, 'w') as f:
+            json.dump(report, f, indent=1)
+        frame = report['frame_ms']
+        print(f'BENCHMARK: {report["frames"]} frames | p50 {frame["p50"]:.2f} ms, p95 {frame["p95"]:.2f} ms, '
+              f'p99 {frame["p99"]:.2f} ms | draw calls {report["draw_calls"]} | '
+              f'vertices {report["vertices"]} -> {self.out_path}')
+        application.quit()
+
+    def report(self):
+        draw_calls, vertices = count_draw_calls()
+        report = {
+            'settings': self.settings,
+            'frames': len(self.frame_times),
+            'frame_ms': summarize(self.frame_times),
+            'draw_calls': draw_calls,
+            'vertices': vertices,
+            'rooms': {},
+        }
+        if self.stats is not None:
+            report['stats'] = dict(self.stats)
+        for room, times in self.room_times.items():
+            in_view_calls, in_view_vertices = self.room_draw_calls[room]
+            report['rooms'][room] = {
+                'frames': len(times),
+                'frame_ms': summarize(times),
+                'draw_calls_in_view': in_view_calls,
+                'vertices_in_view': in_view_vertices,
+            }
+        return report
+
+
+def summarize(frame_times):
+    """Mean, percentiles and max of frame times, in ms"""
+    ms = [t * 1000 for t in frame_times]
+    return {
+        'mean': sum(ms) / len(ms) if ms else 0,
+        'p50': percentile(ms, 50),
+        'p95': percentile(ms, 95),
+        'p99': percentile(ms, 99),
+        'max': max(ms) if ms else 0,
+    }
@@ -0,0 +1,13 @@
+import sys
+
+
+# Command line flags shared by the game (Scream.py) and the tools (tuner.py)
+
+def arg_value(name, default):
+    """Read the value following a command line flag, e.g. --lights 6, as
+    default's type; default when the flag or its value is missing"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return type(default)(sys.argv[index + 1])
+    return default
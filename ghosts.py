@@ -0,0 +1,182 @@
+import math
+
+
+# A few ghosts at once (nightmare mode), stepped one by one: GhostSwarm's
+# rules in plain Python, below SWARM_MIN_GHOSTS (simulation.py). Every
+# ghost in sight drains sanity, fear and the heartbeat follow the group,
+# and only ghost 0 raises 'teleport'. Ghosts that lose sight of the player
+# search where any of them saw it last, so they share one player_flow.
+# State is kept in lists laid out like GhostSwarm's arrays, so the renderer
+# reads either the same way, and both reset and teleport with the same
+# random rolls in the same order.
+# Ghost 0 is mirrored into sim.ghost after every step.
+
+class GhostGroup:
+    def __init__(self, sim, count):
+        self.sim = sim
+        self.count = count
+        self.x = [0.0] * count
+        self.z = [0.0] * count
+        # Positions before the latest step, for interpolation
+        self.prev_x = [0.0] * count
+        self.prev_z = [0.0] * count
+        self.patrol = [0] * count
+        self.chasing = [False] * count
+        self.searching = [False] * count  # Lost sight, heading for last_seen
+        self.last_seen = None
+        self.aggression = [0.0] * count
+        self.teleport_timer = [0.0] * count
+        self.teleport_interval = [0.0] * count
+        self.teleported = [False] * count
+        self.nearest_distance = math.inf
+
+    def reset(self):
+        """Ghost 0 is sim.ghost, the rest spread over the patrol points"""
+        sim = self.sim
+        ghost = sim.ghost
+        rng = sim.ghost_rng
+        count = self.count
+        self.speed = ghost.speed
+        self.chase_speed = ghost.chase_speed
+        self.detection_range = ghost.detection_range
+        self.kill_range = ghost.kill_range
+        self.x[0], self.z[0] = ghost.x, ghost.z
+        self.teleport_interval[0] = ghost.teleport_interval
+        for i in range(1, count):
+            px, pz = rng.choice(sim.patrol_points)
+            self.x[i], self.z[i] = sim.nav_grid.nearest_free(px + rng.uniform(-3, 3), pz + rng.uniform(-3, 3))
+            self.patrol[i] = rng.randrange(len(sim.patrol_points))
+            self.teleport_interval[i] = rng.uniform(8, 15)
+        self.patrol[0] = ghost.current_patrol
+        # Slice assignments, so the swarm's arrays reset the same way
+        self.prev_x[:] = self.x
+        self.prev_z[:] = self.z
+        self.chasing[:] = [False] * count
+        self.searching[:] = [False] * count
+        self.last_seen = None
+        self.aggression[:] = [0] * count
+        self.teleport_timer[:] = [0] * count
+        self.teleported[:] = [False] * count
+
+    def nearest(self, x, z, count, skip_first=True):
+        """Indices of the count ghosts closest to (x, z), nearest first"""
+        gx, gz = self.x, self.z
+        others = range(1 if skip_first else 0, self.count)
+        return sorted(others, key=lambda i: (gx[i] - x) ** 2 + (gz[i] - z) ** 2)[:count]
+
+    def step(self, dt):
+        sim = self.sim
+        player = sim.player
+        px, pz = player.x, player.z
+        x, z = self.x, self.z
+        count = self.count
+        chasing = self.chasing
+        searching = self.searching
+        aggression = self.aggression
+        self.prev_x[:] = x
+        self.prev_z[:] = z
+        self.teleported[:] = [False] * count
+        distance = [math.hypot(px - gx, pz - gz) for gx, gz in zip(x, z)]
+        self.nearest_distance = min(distance)
+
+        # Detection - in range and no wall in between
+        detection_range = self.detection_range
+        in_range = [i for i in range(count) if distance[i] < detection_range]
+        chasing[:] = [False] * count
+        for i, visible in zip(in_range, sim.wall_index.visible_from([(x[i], z[i]) for i in in_range], px, pz)):
+            chasing[i] = visible
+        seen = [distance[i] for i in in_range if chasing[i]]
+        if seen:
+            self.last_seen = (px, pz)
+            sim.ghost_seen_timer += dt
+            sim.sanity = max(0, sim.sanity - sum((detection_range - d) * sim.sight_sanity_drain * dt for d in seen))
+            sim.ambient_fear = min(1, sim.ambient_fear + dt * 0.1)
+            sim.heartbeat_intensity = min(1, (detection_range - min(seen)) / detection_range)
+        else:
+            sim.ghost_seen_timer = max(0, sim.ghost_seen_timer - dt * 0.5)
+            sim.ambient_fear = max(0, sim.ambient_fear - dt * 0.05)
+            sim.heartbeat_intensity = max(0, sim.heartbeat_intensity - dt * 0.3)
+
+        # Chasers head straight for the player, searchers follow player_flow
+        # to the last sighting and patrollers their patrol point's flow field,
+        # or go straight at the target when the field has no step
+        patrol_points = sim.patrol_points
+        player_flow = sim.player_flow
+        for i in range(count):
+            aggression[i] += dt * sim.aggression_rate
+            gx, gz = x[i], z[i]
+            if chasing[i]:
+                searching[i] = True
+                target_x, target_z = px, pz
+                step = None
+                distance_i = (self.chase_speed + aggression[i]) * dt
+            elif searching[i]:
+                target_x, target_z = self.last_seen
+                player_flow.update(target_x, target_z)
+                step = player_flow.direction(gx, gz)
+                distance_i = (self.chase_speed + aggression[i]) * dt
+            else:
+                target_x, target_z = patrol_points[self.patrol[i]]
+                step = sim.patrol_flows[self.patrol[i]].direction(gx, gz)
+                distance_i = self.speed * dt
+            if step is None:
+                dx = target_x - gx
+                dz = target_z - gz
+                length = math.sqrt(dx * dx + dz * dz)
+                step = (dx / length, dz / length) if length > 0 else (0, 0)
+            x[i] = gx + step[0] * distance_i
+            z[i] = gz + step[1] * distance_i
+            if chasing[i]:
+                continue
+            if searching[i]:
+                if math.hypot(x[i] - target_x, z[i] - target_z) < sim.search_radius:
+                    searching[i] = False
+            elif math.hypot(x[i] - target_x, z[i] - target_z) < 2:
+                self.patrol[i] = (self.patrol[i] + 1) % len(patrol_points)
+
+        # Random teleportation
+        timer = self.teleport_timer
+        for i in range(count):
+            timer[i] += dt
+            if timer[i] > self.teleport_interval[i]:
+                self.teleport(i)
+
+        # Kill player if any ghost was too close
+        if min(distance) < self.kill_range:
+            sim.die()
+        self.mirror()
+
+    def teleport(self, i):
+        """Same rolls, in the same order, as the single ghost's teleport"""
+        sim = self.sim
+        rng = sim.ghost_rng
+        player = sim.player
+        self.teleport_timer[i] = 0
+        self.teleport_interval[i] = rng.uniform(5, 12) - self.aggression[i]
+        if rng.random() < 0.3 + self.aggression[i] * 0.1:
+            angle = rng.uniform(0, 360)
+            dist = rng.uniform(8, 15)
+            new_x = player.x + math.cos(math.radians(angle)) * dist
+            new_z = player.z + math.sin(math.radians(angle)) * dist
+            new_x = max(sim.min_x + 1, min(sim.max_x - 1, new_x))
+            new_z = max(sim.min_z + 1, min(sim.max_z - 1, new_z))
+            self.x[i], self.z[i] = sim.nav_grid.nearest_free(new_x, new_z)
+        else:
+            self.x[i], self.z[i] = rng.choice(sim.patrol_points)
+        # Don't slide across the house
+        self.prev_x[i] = self.x[i]
+        self.prev_z[i] = self.z[i]
+        self.teleported[i] = True
+        if i == 0:
+            sim.events.append('teleport')
+
+    def mirror(self):
+        ghost = self.sim.ghost
+        ghost.x = float(self.x[0])
+        ghost.z = float(self.z[0])
+        ghost.is_chasing = bool(self.chasing[0])
+        ghost.last_seen_player_pos = self.last_seen if self.searching[0] else None
+        ghost.aggression = float(self.aggression[0])
+        ghost.current_patrol = int(self.patrol[0])
+        ghost.teleport_timer = float(self.teleport_timer[0])
+        ghost.teleport_interval = float(self.teleport_interval[0])
@@ -0,0 +1,69 @@
+import time
+
+
+# Reactive HUD: UI attributes are only written when their value changes.
+# Writing a HUD attribute is not free: setting Text.text rebuilds the glyph
+# geometry, colors and scales go through Panda, and every color.rgba() makes
+# a new Color. Each UI attribute the game updates per frame gets a Field
+# instead. A Field rounds the incoming value to its step (a bar doesn't need
+# to move by less than a pixel) and only writes to the entity, through the
+# optional convert function, when the rounded value differs from the one
+# already shown. ReactiveHUD counts the writes so the saving can be measured;
+# with reactive=False every set() writes, like the per-frame code did.
+
+class Field:
+    def __init__(self, hud, target, attribute, step=0, convert=None):
+        self.hud = hud
+        self.target = target
+        self.attribute = attribute
+        self.step = step
+        self.convert = convert
+        self.value = None
+
+    def set(self, value):
+        if self.step:
+            value = round(value / self.step) * self.step
+        if value == self.value and self.hud.reactive:
+            return
+        self.value = value
+        setattr(self.target, self.attribute, self.convert(value) if self.convert else value)
+        self.hud.writes += 1
+
+
+class ReactiveHUD:
+    def __init__(self, reactive=True):
+        self.reactive = reactive
+        self.fields = []
+        self.writes = 0
+        self.frames = 0
+        self.window_start = time.perf_counter()
+        self.window_writes = 0
+        self.window_frames = 0
+        self.stats = {'writes_per_second': 0, 'writes_per_frame': 0, 'total_writes': 0}
+
+    def field(self, target, attribute, step=0, convert=None):
+        """Watch target.attribute; returns the Field to set() each frame"""
+        field = Field(self, target, attribute, step, convert)
+        self.fields.append(field)
+        return field
+
+    def set_reactive(self, value):
+        self.reactive = value
+        # Forget what is shown so the next set() writes either way
+        for field in self.fields:
+            field.value = None
+
+    def end_frame(self):
+        """Roll the write counters over once a second"""
+        self.frames += 1
+        now = time.perf_counter()
+        if now - self.window_start < 1:
+            return
+        writes = self.writes - self.window_writes
+        frames = self.frames - self.window_frames
+        self.stats['writes_per_second'] = writes / (now - self.window_start)
+        self.stats['writes_per_frame'] = writes / max(1, frames)
+        self.stats['total_writes'] = self.writes
+        self.window_start = now
+        self.window_writes = self.writes
+        self.window_frames = self.frames
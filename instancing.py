@@ -0,0 +1,300 @@
+from ursina import *
+from panda3d.core import Shader as PandaShader, Texture as PandaTexture, GeomEnums, BoundingBox, Point3
+from array import array
+import math
+import sys
+import time
+
+from shader_effects import FLICKER_GLSL, FLICKER_PEAK, LIGHTING_GLSL
+
+
+# GPU instancing: one draw call for every copy of a model.
+# Copies of one model (chairs, candles, frames, the light bulbs) each cost an
+# Entity and a draw call, and static batching merges them into a mesh that
+# can't move. An InstancedModel keeps one copy of the geometry and has the
+# GPU draw it once per instance in a single call. Each instance's position,
+# rotation around y, scale, color and texture tiling are 16 floats in a
+# buffer texture that the vertex shader reads by gl_InstanceID. Adding,
+# moving, recoloring or removing an instance only edits those floats;
+# flush() uploads the buffer once a frame if anything changed. Removing
+# moves the last instance into the hole, so handles, not slots, name them.
+#
+# The shader lights instances the way fixed-function lighting lights
+# everything else: ambient plus Lambert from each point light with Panda's
+# attenuation. An instance can also flicker, its size pulsing with the
+# lamps' flicker (see shader_effects.py) without any uploads. Colliders
+# need a node of their own, so an instance that blocks the player gets an
+# invisible Entity with a box collider, moved along with it.
+
+FLOATS = 16  # Per instance: position + rotation y, scale + flicker, color, texture scale + flicker phase
+
+VERTEX_SHADER = '''
+#version 140
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat4 p3d_ModelViewMatrix;
+uniform mat3 p3d_NormalMatrix;
+uniform samplerBuffer instances;
+in vec4 p3d_Vertex;
+in vec3 p3d_Normal;
+in vec2 p3d_MultiTexCoord0;
+out vec2 uv;
+out vec4 tint;
+out vec3 view_position;
+out vec3 view_normal;
+''' + FLICKER_GLSL + '''
+void main() {
+    int base = gl_InstanceID * 4;
+    vec4 placement = texelFetch(instances, base);
+    vec4 sizing = texelFetch(instances, base + 1);
+    tint = texelFetch(instances, base + 2);
+    vec4 tiling = texelFetch(instances, base + 3);
+    vec3 scale = sizing.xyz;
+    if (sizing.w != 0.0) {
+        scale *= 1.0 + flicker(tiling.z) * sizing.w;
+    }
+    float s = sin(placement.w);
+    float c = cos(placement.w);
+    mat3 rotation = mat3(c, 0, -s, 0, 1, 0, s, 0, c);
+    vec4 vertex = vec4(rotation * (p3d_Vertex.xyz * scale) + placement.xyz, 1);
+    gl_Position = p3d_ModelViewProjectionMatrix * vertex;
+    view_position = (p3d_ModelViewMatrix * vertex).xyz;
+    view_normal = p3d_NormalMatrix * (rotation * (p3d_Normal / max(abs(scale), 1e-4)));
+    uv = p3d_MultiTexCoord0 * tiling.xy;
+}
+'''
+
+FRAGMENT_SHADER = '''
+#version 140
+#define MAX_LIGHTS {max_lights}
+uniform sampler2D p3d_Texture0;
+uniform vec4 p3d_ColorScale;
+in vec2 uv;
+in vec4 tint;
+in vec3 view_position;
+in vec3 view_normal;
+out vec4 fragment_color;
+{lighting}
+void main() {{
+    vec4 color = texture(p3d_Texture0, uv) * tint * p3d_ColorScale;
+    if ({lit}) {{
+        color.rgb *= lighting(view_position, view_normal);
+    }}
+    fragment_color = color;
+}}
+'''
+
+shaders = {}
+
+def instancing_shader(lit, max_lights):
+    key = (lit, max_lights)
+    if key not in shaders:
+        fragment = FRAGMENT_SHADER.format(max_lights=max_lights, lit='true' if lit else 'false', lighting=LIGHTING_GLSL)
+        shaders[key] = PandaShader.make(PandaShader.SL_GLSL, VERTEX_SHADER, fragment)
+    return shaders[key]
+
+
+class InstancedModel(Entity):
+    def __init__(self, model='cube', lit=True, capacity=16, max_lights=8, **kwargs):
+        """max_lights is how many point lights the shader adds up, at least
+        the LightManager's pool"""
+        super().__init__(model=model, **kwargs)
+        self.count = 0
+        self.slots = {}       # Handle -> slot in the buffer
+        self.handles = []     # Slot -> handle
+        self.colliders = {}   # Handle -> collider Entity
+        self.next_handle = 0
+        self.instance_data = array('f', bytes(capacity * FLOATS * 4))
+        self.instance_buffer = PandaTexture('instances')
+        self.instance_buffer.setup_buffer_texture(capacity * 4, PandaTexture.T_float, PandaTexture.F_rgba32, GeomEnums.UH_dynamic)
+        self.dirty = True
+        self.stats = {'instances': 0, 'uploads': 0}
+
+        # Bounds of the geometry around the origin, grown to cover every
+        # instance, or the whole group is culled with the origin copy
+        low, high = self.model.get_tight_bounds()
+        self.model_radius = max((high - low).length() / 2, 1e-3)
+        self.extent = None
+        self.model.node().set_final(True)
+
+        self.model.set_shader(instancing_shader(lit, max_lights))
+        self.model.set_shader_input('instances', self.instance_buffer)
+        # An instance count of 0 means a plain single draw, so hide instead
+        self.model.hide()
+
+    def add(self, position, scale=1, rotation_y=0, color=color.white, texture_scale=(1, 1), collider=False,
+            flicker=0, phase=0):
+        """Add an instance; returns its handle. A flicker above 0 scales the
+        instance by 1 + flicker * the lamp flicker at phase, on the GPU."""
+        if (self.count + 1) * FLOATS > len(self.instance_data):
+            self.grow()
+        handle = self.next_handle
+        self.next_handle += 1
+        slot = self.count
+        self.count += 1
+        self.slots[handle] = slot
+        self.handles.append(handle)
+        if not isinstance(scale, (tuple, list, Vec3)):
+            scale = (scale, scale, scale)
+        i = slot * FLOATS
+        self.instance_data[i:i + FLOATS] = array('f', (
+            position[0], position[1], position[2], math.radians(rotation_y),
+            scale[0], scale[1], scale[2], flicker,
+            color[0], color[1], color[2], color[3],
+            texture_scale[0], texture_scale[1], phase, 0))
+        self.cover(slot)
+        if collider:
+            self.colliders[handle] = Entity(parent=self, position=position, scale=scale, rotation_y=rotation_y, collider='box')
+        self.dirty = True
+        return handle
+
+    def move(self, handle, position=None, rotation_y=None, scale=None):
+        i = self.slots[handle] * FLOATS
+        data = self.instance_data
+        if position is not None:
+            data[i], data[i + 1], data[i + 2] = position[0], position[1], position[2]
+        if rotation_y is not None:
+            data[i + 3] = math.radians(rotation_y)
+        if scale is not None:
+            if not isinstance(scale, (tuple, list, Vec3)):
+                scale = (scale, scale, scale)
+            data[i + 4], data[i + 5], data[i + 6] = scale[0], scale[1], scale[2]
+        self.cover(i // FLOATS)
+        collider = self.colliders.get(handle)
+        if collider is not None:
+            collider.position = Vec3(data[i], data[i + 1], data[i + 2])
+            collider.rotation_y = math.degrees(data[i + 3])
+            collider.scale = Vec3(data[i + 4], data[i + 5], data[i + 6])
+        self.dirty = True
+
+    def recolor(self, handle, color):
+        i = self.slots[handle] * FLOATS + 8
+        self.instance_data[i:i + 4] = array('f', (color[0], color[1], color[2], color[3]))
+        self.dirty = True
+
+    def set_flicker(self, handle, flicker, phase=None):
+        i = self.slots[handle] * FLOATS
+        self.instance_data[i + 7] = flicker
+        if phase is not None:
+            self.instance_data[i + 14] = phase
+        self.cover(i // FLOATS)
+        self.dirty = True
+
+    def remove(self, handle):
+        slot = self.slots.pop(handle)
+        last = self.count - 1
+        if slot != last:
+            moved = self.handles[last]
+            self.instance_data[slot * FLOATS:(slot + 1) * FLOATS] = self.instance_data[last * FLOATS:(last + 1) * FLOATS]
+            self.handles[slot] = moved
+            self.slots[moved] = slot
+        self.handles.pop()
+        self.count = last
+        collider = self.colliders.pop(handle, None)
+        if collider is not None:
+            destroy(collider)
+        self.dirty = True
+
+    def grow(self):
+        capacity = len(self.instance_data) // FLOATS * 2
+        self.instance_data.extend(bytes(len(self.instance_data) * 4))
+        self.instance_buffer.setup_buffer_texture(capacity * 4, PandaTexture.T_float, PandaTexture.F_rgba32, GeomEnums.UH_dynamic)
+
+    def cover(self, slot):
+        """Grow the bounds to take in an instance (they never shrink)"""
+        i = slot * FLOATS
+        data = self.instance_data
+        reach = self.model_radius * max(abs(data[i + 4]), abs(data[i + 5]), abs(data[i + 6]))
+        reach *= 1 + abs(data[i + 7]) * FLICKER_PEAK
+        low = (data[i] - reach, data[i + 1] - reach, data[i + 2] - reach)
+        high = (data[i] + reach, data[i + 1] + reach, data[i + 2] + reach)
+        extent = self.extent
+        if extent is None:
+            self.extent = [*low, *high]
+        elif min(low[0] - extent[0], low[1] - extent[1], low[2] - extent[2],
+                 extent[3] - high[0], extent[4] - high[1], extent[5] - high[2]) >= 0:
+            return
+        else:
+            self.extent = [min(low[0], extent[0]), min(low[1], extent[1]), min(low[2], extent[2]),
+                           max(high[0], extent[3]), max(high[1], extent[4]), max(high[2], extent[5])]
+        self.model.node().set_bounds(BoundingBox(Point3(*self.extent[:3]), Point3(*self.extent[3:])))
+
+    def flush(self):
+        """Upload the instances if anything changed; once a frame, before drawing"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        size = self.count * FLOATS * 4
+        image = self.instance_buffer.modify_ram_image()
+        memoryview(image)[:size] = memoryview(self.instance_data).cast('B')[:size]
+        self.model.set_instance_count(self.count)
+        if self.count:
+            self.model.show()
+        else:
+            self.model.hide()
+        self.stats['instances'] = self.count
+        self.stats['uploads'] += 1
+
+
+# python instancing.py [COUNT] - 10k props, one Entity each vs one InstancedModel
+if __name__ == '__main__':
+    from static_batching import count_draw_calls
+    count = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 10000
+    frames = 100
+    app = Ursina(size=(1280, 720))
+    window.color = color.black
+    AmbientLight(color=color.rgb(40, 40, 40))
+    PointLight(position=(0, 10, 0), color=color.rgb(255, 200, 150))
+    camera.position = (0, 120, -120)
+    camera.rotation_x = 45
+    side = int(math.ceil(math.sqrt(count)))
+    placements = [((i % side - side / 2) * 1.5, 0.5, (i // side - side / 2) * 1.5) for i in range(count)]
+    colors = [color.hsv(i % 360, 0.5, 0.8) for i in range(count)]
+
+    def measure(animate):
+        # A few frames first, for shader compiles and uploads
+        for i in range(5):
+            animate(i)
+            app.step()
+        start = time.perf_counter()
+        update_time = 0
+        for i in range(frames):
+            update_start = time.perf_counter()
+            animate(i)
+            update_time += time.perf_counter() - update_start
+            app.step()
+        return (time.perf_counter() - start) / frames * 1000, update_time / frames * 1000
+
+    print(f'{count} props, {frames} frames each')
+    print(f'{"":<10} {"build ms":>9} {"draws":>6} {"static ms":>10} {"moving ms":>10} {"updates ms":>11}')
+
+    start = time.perf_counter()
+    entities = [Entity(model='cube', position=p, color=c) for p, c in zip(placements, colors)]
+    build = (time.perf_counter() - start) * 1000
+    draws = count_draw_calls()[0]
+    static_ms = measure(lambda frame: None)[0]
+
+    def spin_entities(frame):
+        for e in entities:
+            e.rotation_y = frame
+    moving_ms, update_ms = measure(spin_entities)
+    print(f'{"entities":<10} {build:>9.0f} {draws:>6} {static_ms:>10.2f} {moving_ms:>10.2f} {update_ms:>11.2f}')
+    for e in entities:
+        destroy(e)
+
+    start = time.perf_counter()
+    props = InstancedModel('cube', capacity=count)
+    handles = [props.add(p, color=c) for p, c in zip(placements, colors)]
+    props.flush()
+    build = (time.perf_counter() - start) * 1000
+    draws = count_draw_calls()[0]
+
+    def flush_only(frame):
+        props.flush()
+    static_ms = measure(flush_only)[0]
+
+    def spin_instances(frame):
+        for handle in handles:
+            props.move(handle, rotation_y=frame)
+        props.flush()
+    moving_ms, update_ms = measure(spin_instances)
+    print(f'{"instanced":<10} {build:>9.0f} {draws:>6} {static_ms:>10.2f} {moving_ms:>10.2f} {update_ms:>11.2f}')
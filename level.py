@@ -0,0 +1,318 @@
+from collections import namedtuple
+from functools import partial
+import gc
+import hashlib
+import json
+import marshal
+import os
+import struct
+import sys
+import time
+
+
+# Levels are written by hand as JSON (see levels/house.json): outer and room
+# walls, props, lights, patrol points, spawns, the exit door and the room
+# rectangles the floor is split into (for portal culling). JSON is compiled
+# into a flat little endian binary, and the first load saves the result as
+# marshal data next to the other caches (.cache/levels), keyed by the file's
+# size and modification time. After that, loading is one marshal.loads(),
+# about what importing the level as a .pyc would cost.
+#
+# Every load goes through the compiled bytes, so all paths give the exact
+# same (float32) numbers and a replay can't tell them apart.
+
+Wall = namedtuple('Wall', 'room position scale')
+Prop = namedtuple('Prop', 'name position scale texture texture_scale color collider solid batch')
+Room = namedtuple('Room', 'name rect')  # rect is (min_x, min_z, max_x, max_z)
+
+DEFAULT_LEVEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels', 'house.json')
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'levels')
+
+MAGIC = b'SLVL'
+VERSION = 2
+HEADER = struct.Struct('<4sB')
+COUNT = struct.Struct('<I')
+SETTINGS = struct.Struct('<H4f9f')     # name, width, depth, wall height/thickness, 3 spawns
+WALL = struct.Struct('<H6f')           # room (NONE for outer walls), position, scale
+PROP = struct.Struct('<HHH3f3f2f4BB')  # name, texture, batch, position, scale, texture scale, rgba, flags
+POINT = struct.Struct('<3f')
+WAYPOINT = struct.Struct('<H3f')       # name, position
+ROOM = struct.Struct('<H4f')           # name, min x, min z, max x, max z
+NONE = 0xFFFF
+
+COLLIDER = 1
+SOLID = 2
+
+
+class Level:
+    def __init__(self, name, size, wall_height, wall_thickness, player_start, ghost_start, exit_door,
+                 outer_walls, room_walls, props, light_positions, patrol_points, benchmark_route, rooms=(),
+                 digest=None):
+        self.name = name
+        self.house_width, self.house_depth = size
+        self.wall_height = wall_height
+        self.wall_thickness = wall_thickness
+        self.player_start = player_start
+        self.ghost_start = ghost_start
+        self.exit_door = exit_door
+        self.outer_walls = outer_walls
+        self.room_walls = room_walls
+        self.props = props
+        self.light_positions = light_positions
+        self.patrol_points = patrol_points
+        self.benchmark_route = benchmark_route
+        self.rooms = list(rooms)
+        self.digest = digest  # Hash of the compiled level, to tell levels apart (replays)
+
+    @property
+    def walls(self):
+        return self.outer_walls + self.room_walls
+
+    def floor_bounds(self):
+        """(min_x, max_x, min_z, max_z) of the house floor"""
+        return (-self.house_width / 2, self.house_width / 2, -self.house_depth / 2, self.house_depth / 2)
+
+    def wall_rects(self):
+        """Every wall as a top-down box: (center_x, center_z, size_x, size_z)"""
+        return [(w.position[0], w.position[2], w.scale[0], w.scale[2]) for w in self.walls]
+
+    def solid_rects(self):
+        """Walls plus solid props, for player collision"""
+        return self.wall_rects() + [(p.position[0], p.position[2], p.scale[0], p.scale[2]) for p in self.props if p.solid]
+
+
+# Compiler: JSON -> binary
+def compile_level(data):
+    """Level JSON (already parsed) -> bytes"""
+    strings = []
+    index = {}
+
+    def string(value):
+        if value is None:
+            return NONE
+        if value not in index:
+            index[value] = len(strings)
+            strings.append(value)
+        return index[value]
+
+    # Sections first so the string table is complete before it's written
+    body = [SETTINGS.pack(string(data['name']), *data['size'], data['wall_height'], data['wall_thickness'],
+                          *data['player_start'], *data['ghost_start'], *data['exit_door'])]
+    walls = [WALL.pack(NONE, *w['position'], *w['scale']) for w in data['outer_walls']]
+    walls += [WALL.pack(string(w['room']), *w['position'], *w['scale']) for w in data['room_walls']]
+    body += [COUNT.pack(len(walls))] + walls
+    props = []
+    for p in data['props']:
+        flags = (COLLIDER if p.get('collider') else 0) | (SOLID if p.get('solid') else 0)
+        red, green, blue, alpha = (list(p.get('color', (255, 255, 255))) + [255])[:4]
+        props.append(PROP.pack(string(p['name']), string(p.get('texture')), string(p.get('batch')),
+                               *p['position'], *p['scale'], *p.get('texture_scale', (0, 0)),
+                               red, green, blue, alpha, flags))
+    body += [COUNT.pack(len(props))] + props
+    for points in (data['lights'], data['patrol_points']):
+        body += [COUNT.pack(len(points))] + [POINT.pack(*point) for point in points]
+    route = data.get('benchmark_route', [])
+    body += [COUNT.pack(len(route))] + [WAYPOINT.pack(string(name), *point) for name, point in route]
+    rooms = data.get('rooms', [])
+    body += [COUNT.pack(len(rooms))] + [ROOM.pack(string(room['name']), *room['rect']) for room in rooms]
+
+    table = [struct.pack('<H', len(strings))]
+    for value in strings:
+        encoded = value.encode()
+        table.append(struct.pack('<B', len(encoded)) + encoded)
+    return HEADER.pack(MAGIC, VERSION) + b''.join(table) + b''.join(body)
+
+
+def read_compiled(data):
+    """bytes -> Level, one pass over the buffer"""
+    magic, version = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'not a version {VERSION} compiled level')
+    offset = HEADER.size
+    count, = struct.unpack_from('<H', data, offset)
+    offset += 2
+    strings = []
+    for i in range(count):
+        length = data[offset]
+        strings.append(data[offset + 1:offset + 1 + length].decode())
+        offset += 1 + length
+
+    def section(record):
+        nonlocal offset
+        count, = COUNT.unpack_from(data, offset)
+        start = offset + COUNT.size
+        offset = start + count * record.size
+        return record.iter_unpack(data[start:offset])
+
+    settings = SETTINGS.unpack_from(data, offset)
+    offset += SETTINGS.size
+    name, width, depth, wall_height, wall_thickness = settings[:5]
+    outer_walls = []
+    room_walls = []
+    for room, x, y, z, sx, sy, sz in section(WALL):
+        if room == NONE:
+            outer_walls.append(Wall(None, (x, y, z), (sx, sy, sz)))
+        else:
+            room_walls.append(Wall(strings[room], (x, y, z), (sx, sy, sz)))
+    props = []
+    for (prop_name, texture, batch, x, y, z, sx, sy, sz, tu, tv, red, green, blue, alpha, flags) in section(PROP):
+        props.append(Prop(strings[prop_name], (x, y, z), (sx, sy, sz),
+                          strings[texture] if texture != NONE else None,
+                          (tu, tv) if tu or tv else None,
+                          (red, green, blue, alpha),
+                          bool(flags & COLLIDER), bool(flags & SOLID),
+                          strings[batch] if batch != NONE else None))
+    lights = list(section(POINT))
+    patrol_points = list(section(POINT))
+    route = [(strings[waypoint], (x, y, z)) for waypoint, x, y, z in section(WAYPOINT)]
+    rooms = [Room(strings[room], tuple(rect)) for room, *rect in section(ROOM)]
+    return Level(strings[name], (width, depth), wall_height, wall_thickness,
+                 settings[5:8], settings[8:11], settings[11:14],
+                 outer_walls, room_walls, props, lights, patrol_points, route, rooms,
+                 hashlib.sha1(data).hexdigest()[:16])
+
+
+# Cache: a compiled level as marshal data.
+# marshal is what a .pyc is made of: tuples, floats and strings load straight
+# into objects with no decoding step in Python. Equal values are written once
+# and referenced after that (most walls share a height and a thickness), and
+# the collector is held off while thousands of tuples come in at once.
+
+def level_tuple(level):
+    """Level -> nested plain tuples, for marshal"""
+    fields = (level.name, (level.house_width, level.house_depth), level.wall_height, level.wall_thickness,
+              tuple(level.player_start), tuple(level.ghost_start), tuple(level.exit_door),
+              tuple(map(tuple, level.outer_walls)), tuple(map(tuple, level.room_walls)),
+              tuple(map(tuple, level.props)), tuple(map(tuple, level.light_positions)),
+              tuple(map(tuple, level.patrol_points)), tuple(level.benchmark_route),
+              tuple((room.name, tuple(room.rect)) for room in level.rooms), level.digest)
+    return shared(fields, {})
+
+
+def shared(value, seen):
+    """value with every repeated number, string or tuple in it the same object"""
+    if type(value) is tuple:
+        value = tuple([shared(item, seen) for item in value])
+    return seen.setdefault((type(value), value), value)
+
+
+def tuple_level(fields):
+    """level_tuple() -> Level"""
+    (name, size, wall_height, wall_thickness, player_start, ghost_start, exit_door,
+     outer_walls, room_walls, props, lights, patrol_points, route, rooms, digest) = fields
+    return Level(name, size, wall_height, wall_thickness, player_start, ghost_start, exit_door,
+                 list(map(WALL_TUPLE, outer_walls)), list(map(WALL_TUPLE, room_walls)),
+                 list(map(PROP_TUPLE, props)), list(lights), list(patrol_points), list(route),
+                 map(ROOM_TUPLE, rooms), digest)
+
+
+# Namedtuples straight from their fields, without a Python call per item
+WALL_TUPLE = partial(tuple.__new__, Wall)
+PROP_TUPLE = partial(tuple.__new__, Prop)
+ROOM_TUPLE = partial(tuple.__new__, Room)
+
+
+def cache_path(path, cache_dir=CACHE_DIR):
+    stat = os.stat(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    # marshal's format can change between Python versions, like a .pyc's
+    python = f'{sys.version_info[0]}{sys.version_info[1]}'
+    return os.path.join(cache_dir, f'{name}_{stat.st_size}_{stat.st_mtime_ns}_v{VERSION}_py{python}.lvl')
+
+
+def load_level(path=DEFAULT_LEVEL, cache_dir=CACHE_DIR):
+    """Load a level JSON through its cache, compiling it first if needed"""
+    cached = cache_path(path, cache_dir)
+    if os.path.exists(cached):
+        with open(cached, 'rb') as f:
+            data = f.read()
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            return tuple_level(marshal.loads(data))
+        finally:
+            if collecting:
+                gc.enable()
+    with open(path) as f:
+        level = read_compiled(compile_level(json.load(f)))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cached, 'wb') as f:
+            f.write(marshal.dumps(level_tuple(level)))
+    except OSError:
+        pass  # Read-only install, compile again next time
+    return level
+
+
+# python level.py [LEVEL.json] - loading the level tiled 12x12: JSON, the cache, Python literals
+if __name__ == '__main__':
+    import marshal
+    import tempfile
+
+    with open(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LEVEL) as f:
+        base = json.load(f)
+    tiles = 12
+    width, depth = base['size']
+
+    def shifted(point, ox, oz):
+        return [point[0] + ox, point[1], point[2] + oz]
+
+    # The house tiled into a tiles x tiles mansion
+    big = dict(base, name='mansion', size=[width * tiles, depth * tiles],
+               outer_walls=[], room_walls=[], props=[], lights=[], patrol_points=[], benchmark_route=[])
+    for i in range(tiles):
+        for j in range(tiles):
+            ox = (i - (tiles - 1) / 2) * width
+            oz = (j - (tiles - 1) / 2) * depth
+            for w in base['outer_walls']:
+                big['room_walls'].append(dict(room='outer', position=shifted(w['position'], ox, oz), scale=w['scale']))
+            for w in base['room_walls']:
+                big['room_walls'].append(dict(w, position=shifted(w['position'], ox, oz)))
+            for p in base['props']:
+                big['props'].append(dict(p, position=shifted(p['position'], ox, oz)))
+            big['lights'] += [shifted(p, ox, oz) for p in base['lights']]
+            big['patrol_points'] += [shifted(p, ox, oz) for p in base['patrol_points']]
+
+    # The same data as a Python module of literals, like the old house layout
+    source = '\n'.join([
+        f'room_walls = {[(tuple(w["position"]), tuple(w["scale"])) for w in big["room_walls"]]!r}',
+        f'props = {[(p["name"], tuple(p["position"]), tuple(p["scale"]), p.get("texture"), tuple(p.get("color", (255, 255, 255)))) for p in big["props"]]!r}',
+        f'light_positions = {[tuple(p) for p in big["lights"]]!r}',
+        f'patrol_points = {[tuple(p) for p in big["patrol_points"]]!r}',
+    ])
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'mansion.json')
+        with open(path, 'w') as f:
+            json.dump(big, f)
+        cache = os.path.join(folder, 'cache')
+
+        def timed(label, func, repeat=10):
+            start = time.perf_counter()
+            for i in range(repeat):
+                result = func()
+            print(f'{label:<28} {(time.perf_counter() - start) / repeat * 1000:8.2f} ms')
+            return result
+
+        def python_literals():
+            namespace = {}
+            exec(compile(source, 'mansion_layout.py', 'exec'), namespace)
+            return namespace
+
+        # What importing it costs once the .pyc exists
+        bytecode = marshal.dumps(compile(source, 'mansion_layout.py', 'exec'))
+
+        def python_pyc():
+            namespace = {}
+            exec(marshal.loads(bytecode), namespace)
+            return namespace
+
+        print(f'{len(big["room_walls"])} walls, {len(big["props"])} props, {len(big["lights"])} lights | '
+              f'json {os.path.getsize(path) // 1024} KB, python {len(source) // 1024} KB')
+        timed('python literals (compile)', python_literals)
+        timed('python literals (.pyc)', python_pyc)
+        timed('json parse only', lambda: json.load(open(path)))
+        timed('json + compile (cold)', lambda: read_compiled(compile_level(json.load(open(path)))))
+        level = load_level(path, cache)
+        print(f'{"cache size":<28} {os.path.getsize(cache_path(path, cache)) // 1024:8} KB')
+        timed('cache (warm)', lambda: load_level(path, cache))
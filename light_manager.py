@@ -0,0 +1,96 @@
+from ursina import *
+from panda3d.core import PointLight as PandaPointLight
+
+
+# Light manager: only the N most relevant lights get a real PointLight.
+# Every FlickeringLight keeps its emissive bulb, but per-pixel lighting is
+# limited to a small pool of point lights. Each frame the lights are ranked
+# by distance from the viewer (lights behind the camera count as further
+# away) and the pool is handed to the top N. A light that loses its slot
+# fades out before the slot is given to the next one, so nothing pops.
+
+class LightManager:
+    def __init__(self, max_active=4, fade_speed=3.0, behind_penalty=4.0):
+        self.max_active = max_active
+        self.fade_speed = fade_speed
+        self.behind_penalty = behind_penalty
+        self.lights = []
+        self.free_slots = []
+        self.pool_size = 0
+        self.stats = {'active': 0, 'fading': 0, 'candidates': 0}
+        self.set_max_active(max_active)
+
+    def set_max_active(self, value):
+        """Change N; lights over the new limit fade out on the next updates"""
+        self.max_active = max(0, int(value))
+        while self.pool_size < self.max_active:
+            self.free_slots.append(scene.attach_new_node(PandaPointLight('managed_point_light')))
+            self.pool_size += 1
+
+    def register(self, light):
+        light.slot = None
+        light.fade = 0
+        self.lights.append(light)
+
+    def unregister(self, light):
+        """Stop managing a light, handing its slot back right away"""
+        if light.slot is not None:
+            self.release(light)
+        self.lights.remove(light)
+
+    def rank(self, viewer_position, view_forward):
+        """Return enabled lights ordered from most to least relevant"""
+        def score(light):
+            offset = light.light_position - viewer_position
+            dist_sq = offset.x * offset.x + offset.y * offset.y + offset.z * offset.z
+            if offset.x * view_forward.x + offset.y * view_forward.y + offset.z * view_forward.z < 0:
+                dist_sq *= self.behind_penalty
+            # Current holders get a small bonus so lights don't thrash at equal distance
+            if light.slot is not None:
+                dist_sq *= 0.8
+            return dist_sq
+        # Disabled (culled) lights aren't candidates, a slot they hold fades out
+        return sorted([light for light in self.lights if light.enabled], key=score)
+
+    def update(self, viewer_position, view_forward, dt):
+        ranked = self.rank(viewer_position, view_forward)
+        candidates = len(ranked)
+        ranked = ranked[:self.max_active]
+        wanted = set(ranked)
+        active = 0
+        fading = 0
+
+        for light in self.lights:
+            if light.slot is None:
+                continue
+            if light in wanted:
+                light.fade = min(1, light.fade + dt * self.fade_speed)
+            else:
+                light.fade -= dt * self.fade_speed
+                if light.fade <= 0:
+                    self.release(light)
+                    continue
+                fading += 1
+            active += 1
+
+        for light in ranked:
+            if light.slot is None and self.free_slots and active < self.max_active:
+                light.slot = self.free_slots.pop()
+                light.slot.set_pos(light.light_position)
+                render.set_light(light.slot)
+                light.fade = 0
+                active += 1
+
+        for light in self.lights:
+            if light.slot is not None:
+                light.slot.node().set_color(light.light_color * light.fade)
+
+        self.stats['active'] = active
+        self.stats['fading'] = fading
+        self.stats['candidates'] = candidates
+
+    def release(self, light):
+        render.clear_light(light.slot)
+        self.free_slots.append(light.slot)
+        light.slot = None
+        light.fade = 0
@@ -0,0 +1,414 @@
+from collections import namedtuple
+import hashlib
+import json
+import math
+import os
+import struct
+import sys
+import time
+
+from panda3d.core import (Geom, GeomNode, GeomTriangles, GeomVertexArrayFormat, GeomVertexData,
+                          GeomVertexFormat, GeomVertexWriter, InternalName, NodePath, SamplerState,
+                          Texture, TextureStage)
+
+from visibility import WallIndex
+
+
+# Lightmaps: static lighting baked on the CPU, cached per level.
+# The walls, floor and ceiling never move and neither do the lamps, so their
+# lighting only has to be worked out once. Every surface (the four sides of
+# each wall, the floor and ceiling in tiles) gets a patch of texels in one
+# atlas texture. A texel is the ambient light plus every lamp in range that
+# faces it, falling off with distance, unless a wall is in the way (walls
+# are full height, so that is the same top-down line of sight test as the
+# ghost's). The atlas is cached under .cache/lightmaps, keyed by a hash of
+# everything that affects it: the walls, the lamps and the bake settings.
+#
+# Surfaces get models with a second set of texture coordinates into the
+# atlas, and the atlas goes on its own texture stage on top of the usual
+# texture, so the geometry needs no real time lights at all. Each patch also
+# records the lamp that lights it most, so a shader can dim or brighten
+# everything a lamp lights with its flicker (see shader_effects.py).
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'lightmaps')
+
+MAGIC = b'SLMP'
+VERSION = 1
+HEADER = struct.Struct('<4sBHHI')      # magic, version, atlas width, height, patch count
+PATCH = struct.Struct('<HHHHh')        # x, y, width, height in texels, brightest lamp (-1 for none)
+
+# Patches have a one texel border copied from their edge, so filtering
+# never blends in a neighbouring patch
+PADDING = 1
+
+# The four sides of a wall: name, outward normal
+WALL_SIDES = (('east', (1, 0, 0)), ('west', (-1, 0, 0)), ('north', (0, 0, 1)), ('south', (0, 0, -1)))
+
+Surface = namedtuple('Surface', 'key origin u_axis v_axis normal width height')
+Patch = namedtuple('Patch', 'x y width height light')
+
+
+class BakeSettings:
+    def __init__(self, texels_per_unit=1.0, tile_size=10, light_color=(255, 200, 150), intensity=0.8,
+                 ambient=(15, 12, 10), light_range=25):
+        self.texels_per_unit = texels_per_unit
+        self.tile_size = tile_size
+        self.light_color = light_color
+        self.intensity = intensity
+        self.ambient = ambient
+        self.light_range = light_range
+
+    def key(self):
+        return [self.texels_per_unit, self.tile_size, list(self.light_color), self.intensity,
+                list(self.ambient), self.light_range]
+
+
+def surfaces(level, settings):
+    """Every lightmapped surface: floor and ceiling tiles, then four sides per wall"""
+    min_x, max_x, min_z, max_z = level.floor_bounds()
+    tile = settings.tile_size
+    result = []
+    for key, y, normal in (('floor', 0, (0, 1, 0)), ('ceiling', level.wall_height, (0, -1, 0))):
+        z = min_z
+        while z < max_z:
+            x = min_x
+            while x < max_x:
+                result.append(Surface((key, x, z), (x, y, z), (1, 0, 0), (0, 0, 1), normal,
+                                      min(tile, max_x - x), min(tile, max_z - z)))
+                x += tile
+            z += tile
+    for i, wall in enumerate(level.walls):
+        (cx, cy, cz), (sx, sy, sz) = wall.position, wall.scale
+        for side, normal in WALL_SIDES:
+            if normal[0]:
+                x = cx + normal[0] * sx / 2
+                result.append(Surface(('wall', i, side), (x, cy - sy / 2, cz - sz / 2), (0, 0, 1), (0, 1, 0),
+                                      normal, sz, sy))
+            else:
+                z = cz + normal[2] * sz / 2
+                result.append(Surface(('wall', i, side), (cx - sx / 2, cy - sy / 2, z), (1, 0, 0), (0, 1, 0),
+                                      normal, sx, sy))
+    return result
+
+
+def texel_size(surface, settings):
+    return (max(2, math.ceil(surface.width * settings.texels_per_unit)),
+            max(2, math.ceil(surface.height * settings.texels_per_unit)))
+
+
+def pack(sizes):
+    """Shelf pack (width, height) rectangles; returns positions and the atlas size"""
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+    area = sum((w + 2 * PADDING) * (h + 2 * PADDING) for w, h in sizes)
+    widest = max(w for w, h in sizes) + 2 * PADDING
+    width = 1 << math.ceil(math.log2(max(widest, math.sqrt(area * 1.2))))
+    positions = [None] * len(sizes)
+    x = y = shelf = 0
+    for i in order:
+        w, h = sizes[i][0] + 2 * PADDING, sizes[i][1] + 2 * PADDING
+        if x + w > width:
+            x = 0
+            y += shelf
+            shelf = 0
+        positions[i] = (x, y)
+        x += w
+        shelf = max(shelf, h)
+    height = 1 << math.ceil(math.log2(max(1, y + shelf)))
+    return positions, width, height
+
+
+def bake(level, settings=None):
+    """Light every surface of the level; returns a Lightmap"""
+    settings = settings or BakeSettings()
+    found = surfaces(level, settings)
+    sizes = [texel_size(surface, settings) for surface in found]
+    positions, width, height = pack(sizes)
+    pixels = bytearray(width * height * 3)
+    index = WallIndex(level.wall_rects(), level.floor_bounds())
+    lamps = [tuple(position) for position in level.light_positions]
+    light_range = settings.light_range
+    scale = settings.intensity / 255
+    lr, lg, lb = (c * scale for c in settings.light_color)
+    ar, ag, ab = (c / 255 for c in settings.ambient)
+
+    patches = []
+    for surface, (tw, th), (px, py) in zip(found, sizes, positions):
+        ox, oy, oz = surface.origin
+        ux, uy, uz = surface.u_axis
+        vx, vy, vz = surface.v_axis
+        nx, ny, nz = surface.normal
+        # Only lamps in front of the surface and in range of some part of it
+        reach = light_range + math.hypot(surface.width, surface.height)
+        center = (ox + (ux * surface.width + vx * surface.height) / 2, oy + (uy * surface.width + vy * surface.height) / 2,
+                  oz + (uz * surface.width + vz * surface.height) / 2)
+        near = [(i, lamp) for i, lamp in enumerate(lamps)
+                if (lamp[0] - ox) * nx + (lamp[1] - oy) * ny + (lamp[2] - oz) * nz > 0
+                and math.dist(lamp, center) < reach]
+        totals = [0.0] * len(near)
+        for t in range(th):
+            v = (t + 0.5) / th * surface.height
+            row = (py + PADDING + t) * width
+            for s in range(tw):
+                u = (s + 0.5) / tw * surface.width
+                x = ox + ux * u + vx * v
+                y = oy + uy * u + vy * v
+                z = oz + uz * u + vz * v
+                light = 0.0
+                for n, (i, (lx, ly, lz)) in enumerate(near):
+                    dx, dy, dz = lx - x, ly - y, lz - z
+                    distance = math.sqrt(dx * dx + dy * dy + dz * dz)
+                    if distance >= light_range:
+                        continue
+                    facing = (dx * nx + dy * ny + dz * nz) / distance
+                    if facing <= 0:
+                        continue
+                    # Start just off the surface, or its own wall blocks the ray
+                    if not index.line_of_sight(x + nx * 0.05, z + nz * 0.05, lx, lz):
+                        continue
+                    falloff = 1 - distance / light_range
+                    amount = facing * falloff * falloff
+                    totals[n] += amount
+                    light += amount
+                offset = (row + px + PADDING + s) * 3
+                # Panda wants BGR
+                pixels[offset] = min(255, int((ab + lb * light) * 255))
+                pixels[offset + 1] = min(255, int((ag + lg * light) * 255))
+                pixels[offset + 2] = min(255, int((ar + lr * light) * 255))
+        brightest = max(range(len(near)), key=totals.__getitem__) if near and max(totals) > 0 else None
+        patches.append(Patch(px, py, tw, th, near[brightest][0] if brightest is not None else -1))
+        pad(pixels, width, px, py, tw, th)
+    return Lightmap(width, height, bytes(pixels), found, patches)
+
+
+def pad(pixels, width, px, py, tw, th):
+    """Copy a patch's edge texels into its border"""
+    def copy(from_x, from_y, to_x, to_y):
+        a = ((from_y * width) + from_x) * 3
+        b = ((to_y * width) + to_x) * 3
+        pixels[b:b + 3] = pixels[a:a + 3]
+    x0, y0 = px + PADDING, py + PADDING
+    x1, y1 = x0 + tw - 1, y0 + th - 1
+    for y in range(y0, y1 + 1):
+        copy(x0, y, x0 - 1, y)
+        copy(x1, y, x1 + 1, y)
+    for x in range(x0 - 1, x1 + 2):
+        copy(x, y0, x, y0 - 1)
+        copy(x, y1, x, y1 + 1)
+
+
+# The baked atlas and models that use it
+class Lightmap:
+    def __init__(self, width, height, pixels, surfaces, patches):
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+        self.surfaces = surfaces
+        self.patches = patches
+        self.by_key = {surface.key: i for i, surface in enumerate(surfaces)}
+        self.stage = TextureStage('lightmap')
+        self.stage.set_texcoord_name('lightmap')
+        self.stage.set_mode(TextureStage.M_modulate)
+        self.stage.set_sort(10)
+        self._texture = None
+
+    @property
+    def texture(self):
+        if self._texture is None:
+            texture = Texture('lightmap')
+            texture.setup_2d_texture(self.width, self.height, Texture.T_unsigned_byte, Texture.F_rgb)
+            texture.set_ram_image(self.pixels)
+            texture.set_minfilter(SamplerState.FT_linear)
+            texture.set_magfilter(SamplerState.FT_linear)
+            texture.set_wrap_u(SamplerState.WM_clamp)
+            texture.set_wrap_v(SamplerState.WM_clamp)
+            self._texture = texture
+        return self._texture
+
+    def apply(self, entity):
+        """Put the atlas on an entity with a model from this lightmap, after its
+        texture is set (ursina turns every other texture off when setting one)"""
+        entity.model.set_texture(self.stage, self.texture, 1)
+
+    def atlas_uv(self, index, s, t):
+        """Atlas coordinates of a point on a surface, s and t from 0 to 1"""
+        patch = self.patches[index]
+        return ((patch.x + PADDING + s * patch.width) / self.width,
+                (patch.y + PADDING + t * patch.height) / self.height)
+
+    def model(self, name, indices, position, scale, repeat):
+        """Surfaces as a model for an entity at position with scale, in the unit
+        space of ursina's own models. The usual texture repeats `repeat` times per
+        world unit along each surface, the atlas goes on the second UVs."""
+        faces = []
+        for i in indices:
+            surface = self.surfaces[i]
+            corners = []
+            uvs = []
+            atlas = []
+            for s, t in ((0, 0), (1, 0), (1, 1), (0, 1)):
+                point = [surface.origin[k] + surface.u_axis[k] * s * surface.width + surface.v_axis[k] * t * surface.height
+                         for k in range(3)]
+                corners.append(tuple((point[k] - position[k]) / scale[k] for k in range(3)))
+                along = sum(point[k] * surface.u_axis[k] for k in range(3))
+                up = sum(point[k] * surface.v_axis[k] for k in range(3))
+                uvs.append((along * repeat[0], up * repeat[1]))
+                atlas.append(self.atlas_uv(i, s, t))
+            faces.append((corners, surface.normal, uvs, atlas))
+        return faces_model(name, faces)
+
+    def wall_model(self, index, wall):
+        """The four sides of a wall, its texture repeating every 2 units"""
+        indices = [self.by_key[('wall', index, side)] for side, normal in WALL_SIDES]
+        return self.model(f'wall {index}', indices, wall.position, wall.scale, (0.5, 0.5))
+
+    def tiles(self, key):
+        """(surface index, center, size) of each 'floor' or 'ceiling' tile"""
+        for i, surface in enumerate(self.surfaces):
+            if surface.key[0] == key:
+                x, y, z = surface.origin
+                yield i, (x + surface.width / 2, y, z + surface.height / 2), (surface.width, 1, surface.height)
+
+    def tile_model(self, index, center, size, repeat):
+        return self.model(f'{self.surfaces[index].key[0]} tile', [index], center, size, repeat)
+
+    def light(self, index):
+        """The lamp that lights a surface most, or -1"""
+        return self.patches[index].light
+
+    def wall_light(self, index):
+        """The lamp that lights most of a wall's sides, or -1"""
+        totals = {}
+        for side, normal in WALL_SIDES:
+            patch = self.patches[self.by_key[('wall', index, side)]]
+            if patch.light >= 0:
+                totals[patch.light] = totals.get(patch.light, 0) + patch.width * patch.height
+        return max(totals, key=totals.get) if totals else -1
+
+    def to_bytes(self):
+        header = HEADER.pack(MAGIC, VERSION, self.width, self.height, len(self.patches))
+        return header + b''.join(PATCH.pack(*patch) for patch in self.patches) + self.pixels
+
+    @classmethod
+    def from_bytes(cls, data, surfaces):
+        magic, version, width, height, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or count != len(surfaces):
+            raise ValueError(f'not a version {VERSION} lightmap for this level')
+        offset = HEADER.size
+        patches = [Patch(*PATCH.unpack_from(data, offset + i * PATCH.size)) for i in range(count)]
+        offset += count * PATCH.size
+        return cls(width, height, data[offset:offset + width * height * 3], surfaces, patches)
+
+
+# One vertex format for every lightmapped model: position, normal, the usual
+# texture coordinates and the atlas coordinates
+_format = None
+
+def vertex_format():
+    global _format
+    if _format is None:
+        array = GeomVertexArrayFormat()
+        array.add_column(InternalName.get_vertex(), 3, Geom.NT_float32, Geom.C_point)
+        array.add_column(InternalName.get_normal(), 3, Geom.NT_float32, Geom.C_normal)
+        array.add_column(InternalName.get_texcoord(), 2, Geom.NT_float32, Geom.C_texcoord)
+        array.add_column(InternalName.get_texcoord_name('lightmap'), 2, Geom.NT_float32, Geom.C_texcoord)
+        _format = GeomVertexFormat.register_format(GeomVertexFormat(array))
+    return _format
+
+
+def faces_model(name, faces):
+    """A NodePath of quads: (corners, normal, uvs, atlas uvs) each, corners going round
+    the quad either way"""
+    data = GeomVertexData(name, vertex_format(), Geom.UH_static)
+    data.set_num_rows(len(faces) * 4)
+    vertex = GeomVertexWriter(data, InternalName.get_vertex())
+    normal = GeomVertexWriter(data, InternalName.get_normal())
+    texcoord = GeomVertexWriter(data, InternalName.get_texcoord())
+    lightmap = GeomVertexWriter(data, InternalName.get_texcoord_name('lightmap'))
+    triangles = GeomTriangles(Geom.UH_static)
+    for i, (corners, face_normal, uvs, atlas) in enumerate(faces):
+        for corner, uv, atlas_uv in zip(corners, uvs, atlas):
+            vertex.add_data3(*corner)
+            normal.add_data3(*face_normal)
+            texcoord.add_data2(*uv)
+            lightmap.add_data2(*atlas_uv)
+        a, b, c, d = range(i * 4, i * 4 + 4)
+        if facing_winding(corners, face_normal):
+            triangles.add_vertices(a, b, c)
+            triangles.add_vertices(a, c, d)
+        else:
+            triangles.add_vertices(a, c, b)
+            triangles.add_vertices(a, d, c)
+    geom = Geom(data)
+    geom.add_primitive(triangles)
+    node = GeomNode(name)
+    node.add_geom(geom)
+    return NodePath(node)
+
+
+def facing_winding(corners, normal):
+    """True if corners already wind the way Panda treats as front facing, seen from
+    the normal side. ursina's space is left handed, so that is clockwise."""
+    (ax, ay, az), (bx, by, bz), (cx, cy, cz) = corners[:3]
+    ux, uy, uz = bx - ax, by - ay, bz - az
+    vx, vy, vz = cx - ax, cy - ay, cz - az
+    cross = (uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx)
+    return sum(cross[k] * normal[k] for k in range(3)) < 0
+
+
+# Bake once per level and settings
+def level_hash(level, settings):
+    """Hash of everything the lighting depends on"""
+    data = [VERSION, settings.key(), level.floor_bounds(), level.wall_height,
+            [[list(w.position), list(w.scale)] for w in level.walls], [list(p) for p in level.light_positions]]
+    return hashlib.sha1(json.dumps(data).encode()).hexdigest()[:16]
+
+
+def cache_path(level, settings, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f'{level_hash(level, settings)}_v{VERSION}.lmp')
+
+
+def load_lightmap(level, settings=None, cache_dir=CACHE_DIR):
+    """The level's lightmap from the cache, baking (and caching) it first if needed.
+    Returns (lightmap, baked) with baked False for a cache hit."""
+    settings = settings or BakeSettings()
+    cached = cache_path(level, settings, cache_dir)
+    if os.path.exists(cached):
+        with open(cached, 'rb') as f:
+            try:
+                return Lightmap.from_bytes(f.read(), surfaces(level, settings)), False
+            except (ValueError, struct.error):
+                pass  # Stale or damaged, bake again
+    lightmap = bake(level, settings)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cached, 'wb') as f:
+            f.write(lightmap.to_bytes())
+    except OSError:
+        pass  # Read-only install, just don't cache
+    return lightmap, True
+
+
+# python lightmap.py [LEVEL.json | mansion SEED ROOMS] - bake time, atlas size, cache load time
+if __name__ == '__main__':
+    from level import load_level, DEFAULT_LEVEL
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'mansion':
+        from procgen import mansion_level
+        rooms = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+        level = mansion_level(int(sys.argv[2]) if len(sys.argv) > 2 else 1, rooms, rooms)
+    else:
+        level = load_level(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LEVEL)
+
+    settings = BakeSettings()
+    start = time.perf_counter()
+    lightmap = bake(level, settings)
+    elapsed = time.perf_counter() - start
+    texels = sum(patch.width * patch.height for patch in lightmap.patches)
+    lit = sum(patch.light >= 0 for patch in lightmap.patches)
+    print(f'{level.name}: {len(lightmap.surfaces)} surfaces ({lit} lit), {texels} texels in a '
+          f'{lightmap.width}x{lightmap.height} atlas, baked in {elapsed:.2f} s')
+    data = lightmap.to_bytes()
+    start = time.perf_counter()
+    Lightmap.from_bytes(data, surfaces(level, settings))
+    print(f'cache: {len(data) // 1024} KB, loaded in {(time.perf_counter() - start) * 1000:.1f} ms '
+          f'(hash {level_hash(level, settings)})')
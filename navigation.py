@@ -0,0 +1,216 @@
+from collections import deque
+import math
+import time
+
+
+# Navigation: occupancy grid and cached flow fields for ghost pathing.
+# The wall layout is rasterized into a grid once at startup. A FlowField
+# stores the BFS step distance from every free cell to one target cell and
+# is only rebuilt when the target moves into a different cell. Steering an
+# agent is then a lookup of its cell's downhill neighbour (worked out from
+# the 8 neighbours the first time it is asked), no matter how many agents
+# follow the same field.
+
+# Neighbour offsets (dx, dz) - straight moves first so ties prefer them
+NEIGHBOURS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+UNKNOWN = -2
+
+
+class NavGrid:
+    def __init__(self, walls, bounds, cell_size=1.0, agent_radius=0.5):
+        """walls are top-down boxes (center_x, center_z, size_x, size_z)"""
+        self.min_x, self.max_x, self.min_z, self.max_z = bounds
+        self.cell_size = cell_size
+        self.cols = max(1, int(math.ceil((self.max_x - self.min_x) / cell_size)))
+        self.rows = max(1, int(math.ceil((self.max_z - self.min_z) / cell_size)))
+        self.blocked = bytearray(self.cols * self.rows)
+        for wall in walls:
+            self.block_rect(wall, agent_radius)
+        # Finished BFS distances by target cell, shared by every FlowField
+        # on this grid so a cell the player returns to is never searched twice
+        self.field_cache = {}
+        self.max_cached_fields = 4096
+
+    def block_rect(self, wall, padding):
+        """Mark every cell whose center lies inside the (padded) box"""
+        cx, cz, sx, sz = wall
+        x0 = cx - sx / 2 - padding
+        x1 = cx + sx / 2 + padding
+        z0 = cz - sz / 2 - padding
+        z1 = cz + sz / 2 + padding
+        col0 = max(0, int(math.ceil((x0 - self.min_x) / self.cell_size - 0.5)))
+        col1 = min(self.cols - 1, int(math.floor((x1 - self.min_x) / self.cell_size - 0.5)))
+        row0 = max(0, int(math.ceil((z0 - self.min_z) / self.cell_size - 0.5)))
+        row1 = min(self.rows - 1, int(math.floor((z1 - self.min_z) / self.cell_size - 0.5)))
+        for row in range(row0, row1 + 1):
+            start = row * self.cols
+            self.blocked[start + col0:start + col1 + 1] = b'\x01' * (col1 - col0 + 1)
+
+    def cell(self, x, z):
+        """Index of the cell containing (x, z), clamped to the grid"""
+        col = int((x - self.min_x) / self.cell_size)
+        row = int((z - self.min_z) / self.cell_size)
+        col = 0 if col < 0 else self.cols - 1 if col >= self.cols else col
+        row = 0 if row < 0 else self.rows - 1 if row >= self.rows else row
+        return row * self.cols + col
+
+    def cell_center(self, index):
+        row, col = divmod(index, self.cols)
+        return (self.min_x + (col + 0.5) * self.cell_size, self.min_z + (row + 0.5) * self.cell_size)
+
+    def nearest_free(self, x, z):
+        """Center of the closest unblocked cell, for snapping spawns and teleports"""
+        start = self.cell(x, z)
+        if not self.blocked[start]:
+            return (x, z)
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            index = queue.popleft()
+            if not self.blocked[index]:
+                return self.cell_center(index)
+            row, col = divmod(index, self.cols)
+            for dc, dr in NEIGHBOURS[:4]:
+                c, r = col + dc, row + dr
+                if 0 <= c < self.cols and 0 <= r < self.rows:
+                    neighbour = r * self.cols + c
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        queue.append(neighbour)
+        return (x, z)
+
+
+class FlowField:
+    def __init__(self, grid):
+        self.grid = grid
+        self.distance = [-1] * (grid.cols * grid.rows)
+        # Downhill neighbour of each cell, filled in lazily as agents ask
+        self.next_cell = [UNKNOWN] * (grid.cols * grid.rows)
+        self.target_cell = None
+        self.rebuilds = 0
+
+    def update(self, x, z):
+        """Retarget the field, rebuilding only if the target changed cell"""
+        cell = self.grid.cell(x, z)
+        if self.grid.blocked[cell]:
+            # Targets touching a wall path to the nearest open cell instead
+            cell = self.grid.cell(*self.grid.nearest_free(x, z))
+        if cell == self.target_cell:
+            return False
+        self.rebuild(cell)
+        return True
+
+    def rebuild(self, target):
+        grid = self.grid
+        self.target_cell = target
+        self.next_cell = [UNKNOWN] * (grid.cols * grid.rows)
+        cached = grid.field_cache.get(target)
+        if cached is not None:
+            self.distance = cached
+            return
+        cols = grid.cols
+        rows = grid.rows
+        blocked = grid.blocked
+        distance = [-1] * (cols * rows)
+        self.rebuilds += 1
+        distance[target] = 0
+        queue = deque([target])
+        pop = queue.popleft
+        push = queue.append
+        while queue:
+            index = pop()
+            next_distance = distance[index] + 1
+            col = index % cols
+            if col > 0:
+                n = index - 1
+                if distance[n] < 0 and not blocked[n]:
+                    distance[n] = next_distance
+                    push(n)
+            if col < cols - 1:
+                n = index + 1
+                if distance[n] < 0 and not blocked[n]:
+                    distance[n] = next_distance
+                    push(n)
+            if index >= cols:
+                n = index - cols
+                if distance[n] < 0 and not blocked[n]:
+                    distance[n] = next_distance
+                    push(n)
+            n = index + cols
+            if n < cols * rows and distance[n] < 0 and not blocked[n]:
+                distance[n] = next_distance
+                push(n)
+        self.distance = distance
+        if len(grid.field_cache) >= grid.max_cached_fields:
+            grid.field_cache.clear()
+        grid.field_cache[target] = distance
+
+    def direction(self, x, z):
+        """Unit (dx, dz) toward the target, or None when there is no path
+        (agent is on the target cell, inside a wall or cut off)"""
+        grid = self.grid
+        index = grid.cell(x, z)
+        best_cell = self.next_cell[index]
+        if best_cell == UNKNOWN:
+            best_cell = self.next_cell[index] = self.downhill(index)
+        if best_cell < 0:
+            return None
+        tx, tz = grid.cell_center(best_cell)
+        dx = tx - x
+        dz = tz - z
+        length = math.sqrt(dx * dx + dz * dz)
+        if length == 0:
+            return None
+        return (dx / length, dz / length)
+
+    def downhill(self, index):
+        """Neighbour cell closest to the target, or -1 if there is none"""
+        grid = self.grid
+        cols = grid.cols
+        distance = self.distance
+        best = distance[index]
+        if best <= 0:
+            return -1
+        row, col = divmod(index, cols)
+        best_cell = -1
+        for dc, dr in NEIGHBOURS:
+            c, r = col + dc, row + dr
+            if not (0 <= c < cols and 0 <= r < grid.rows):
+                continue
+            d = distance[r * cols + c]
+            if d < 0 or d >= best:
+                continue
+            # No cutting corners past a wall
+            if dc and dr and (distance[row * cols + c] < 0 or distance[r * cols + col] < 0):
+                continue
+            best = d
+            best_cell = r * cols + c
+        return best_cell
+
+
+# python navigation.py - flow field rebuild time against grid resolution
+if __name__ == '__main__':
+    from level import load_level
+    level = load_level()
+
+    print(f'{"cell size":>10} {"grid":>10} {"build ms":>10} {"rebuild ms":>11} {"lookup us":>10}')
+    for cell_size in (2.0, 1.0, 0.5, 0.25):
+        start = time.perf_counter()
+        grid = NavGrid(level.wall_rects(), level.floor_bounds(), cell_size=cell_size)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        field = FlowField(grid)
+        targets = [(-25, -25), (25, 25), (-20, 20), (20, -20), (0, 0)]
+        start = time.perf_counter()
+        for tx, tz in targets:
+            grid.field_cache.clear()
+            field.rebuild(grid.cell(tx, tz))
+        rebuild_ms = (time.perf_counter() - start) * 1000 / len(targets)
+
+        lookups = 10000
+        start = time.perf_counter()
+        for i in range(lookups):
+            field.direction(-25 + (i % 50), 25 - (i % 50))
+        lookup_us = (time.perf_counter() - start) * 1e6 / lookups
+
+        print(f'{cell_size:>10} {f"{grid.cols}x{grid.rows}":>10} {build_ms:>10.2f} {rebuild_ms:>11.2f} {lookup_us:>10.2f}')
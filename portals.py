@@ -0,0 +1,203 @@
+import math
+import random
+import sys
+import time
+
+
+# Room graph: portal visibility between the rooms of a level.
+# The floor is split into rectangular rooms (level.rooms). Wherever two rooms
+# share an edge, the stretch of it no wall covers is a portal. Walls are full
+# height, so visibility is worked out top-down: starting in the camera's
+# room with the horizontal view cone, every portal inside the cone makes the
+# room behind it visible and narrows the cone to the portal's angular span
+# for the rooms after that. Whatever the traversal never reaches is hidden
+# behind walls.
+
+class RoomGraph:
+    def __init__(self, rooms, walls, min_width=0.5):
+        """rooms are (name, (min_x, min_z, max_x, max_z)), walls are top-down boxes
+        (center_x, center_z, size_x, size_z) like Level.wall_rects()"""
+        self.names = [name for name, rect in rooms]
+        self.rects = [tuple(rect) for name, rect in rooms]
+        self.portals = [[] for rect in self.rects]
+        self.boxes = [(cx - sx / 2, cz - sz / 2, cx + sx / 2, cz + sz / 2) for cx, cz, sx, sz in walls]
+        self.min_width = min_width
+        self.last_room = None
+
+        # Rooms sharing an edge line, so only those pairs get compared
+        vertical = {}
+        horizontal = {}
+        for i, (x0, z0, x1, z1) in enumerate(self.rects):
+            vertical.setdefault(round(x1, 3), ([], []))[0].append(i)
+            vertical.setdefault(round(x0, 3), ([], []))[1].append(i)
+            horizontal.setdefault(round(z1, 3), ([], []))[0].append(i)
+            horizontal.setdefault(round(z0, 3), ([], []))[1].append(i)
+        for x, (left, right) in vertical.items():
+            covered = [(b[1], b[3]) for b in self.boxes if b[0] <= x <= b[2]]
+            for i in left:
+                for j in right:
+                    start = max(self.rects[i][1], self.rects[j][1])
+                    end = min(self.rects[i][3], self.rects[j][3])
+                    if end - start < self.min_width:
+                        continue
+                    for a, b in self.open_stretches(start, end, covered):
+                        self.connect(i, j, (x, a, x, b))
+        for z, (below, above) in horizontal.items():
+            covered = [(b[0], b[2]) for b in self.boxes if b[1] <= z <= b[3]]
+            for i in below:
+                for j in above:
+                    start = max(self.rects[i][0], self.rects[j][0])
+                    end = min(self.rects[i][2], self.rects[j][2])
+                    if end - start < self.min_width:
+                        continue
+                    for a, b in self.open_stretches(start, end, covered):
+                        self.connect(i, j, (a, z, b, z))
+
+    @classmethod
+    def from_level(cls, level):
+        return cls(level.rooms, level.wall_rects())
+
+    def open_stretches(self, start, end, covered):
+        """Parts of start..end that none of the covered intervals overlap"""
+        stretches = []
+        for a, b in sorted(covered):
+            if b <= start or a >= end:
+                continue
+            if a - start >= self.min_width:
+                stretches.append((start, a))
+            start = max(start, b)
+        if end - start >= self.min_width:
+            stretches.append((start, end))
+        return stretches
+
+    def connect(self, i, j, segment):
+        self.portals[i].append((j, segment))
+        self.portals[j].append((i, segment))
+
+    @property
+    def portal_count(self):
+        return sum(len(portals) for portals in self.portals) // 2
+
+    def room_at(self, x, z):
+        """Index of the room containing (x, z), or None outside every room"""
+        last = self.last_room
+        if last is not None:
+            x0, z0, x1, z1 = self.rects[last]
+            if x0 <= x <= x1 and z0 <= z <= z1:
+                return last
+        for i, (x0, z0, x1, z1) in enumerate(self.rects):
+            if x0 <= x <= x1 and z0 <= z <= z1:
+                self.last_room = i
+                return i
+        return None
+
+    def rooms_touching(self, box, pad=0.05):
+        """Rooms overlapping a top-down box (min_x, min_z, max_x, max_z)"""
+        x0, z0, x1, z1 = box
+        return frozenset(i for i, r in enumerate(self.rects)
+                         if x0 - pad < r[2] and r[0] < x1 + pad and z0 - pad < r[3] and r[1] < z1 + pad)
+
+    def visible_rooms(self, x, z, yaw, half_fov):
+        """Rooms visible from (x, z) looking along yaw (degrees, like rotation_y)
+        with a horizontal half field of view, or None when outside every room"""
+        start = self.room_at(x, z)
+        if start is None:
+            return None
+        visible = {start}
+        stack = [(start, -half_fov, half_fov, (start,))]
+        while stack:
+            room, low, high, path = stack.pop()
+            for other, segment in self.portals[room]:
+                if other in path:
+                    continue
+                for span_low, span_high in self.portal_spans(x, z, yaw, segment):
+                    narrow_low = max(low, span_low)
+                    narrow_high = min(high, span_high)
+                    if narrow_high - narrow_low > 0.01:
+                        visible.add(other)
+                        stack.append((other, narrow_low, narrow_high, path + (other,)))
+        return visible
+
+    @staticmethod
+    def portal_spans(x, z, yaw, segment):
+        """Angular spans (degrees from yaw) a portal covers as seen from (x, z)"""
+        ax, az, bx, bz = segment
+        # Standing in the doorway, everything through it is in view
+        dx = max(min(ax, bx) - x, 0, x - max(ax, bx))
+        dz = max(min(az, bz) - z, 0, z - max(az, bz))
+        if dx * dx + dz * dz < 0.25:
+            return [(-180, 180)]
+        a = (math.degrees(math.atan2(ax - x, az - z)) - yaw + 180) % 360 - 180
+        b = (math.degrees(math.atan2(bx - x, bz - z)) - yaw + 180) % 360 - 180
+        low, high = min(a, b), max(a, b)
+        if high - low <= 180:
+            return [(low, high)]
+        # The portal passes behind the camera, its span wraps around
+        return [(high, 180), (-180, low)]
+
+
+def view_half_angle(hfov, vfov, pitch):
+    """Half of the horizontal angle a camera frustum covers seen from above.
+    Pitching up or down swings the far corners of the frustum outwards, and
+    once the frustum takes in straight up or down it covers every direction."""
+    pitch = math.radians(min(90, abs(pitch)))
+    forward = math.cos(pitch) - math.sin(pitch) * math.tan(math.radians(vfov / 2))
+    if forward <= 0:
+        return 180
+    return math.degrees(math.atan2(math.tan(math.radians(hfov / 2)), forward))
+
+
+# python portals.py [LEVEL.json | mansion SEED ROOMS] - traversal cost, rooms
+# culled, and a line of sight cross check
+if __name__ == '__main__':
+    from level import load_level, DEFAULT_LEVEL
+    from visibility import WallIndex
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'mansion':
+        from procgen import mansion_level
+        rooms = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+        level = mansion_level(int(sys.argv[2]) if len(sys.argv) > 2 else 1, rooms, rooms)
+    else:
+        level = load_level(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LEVEL)
+
+    start = time.perf_counter()
+    graph = RoomGraph.from_level(level)
+    print(f'{level.name}: {len(graph.rects)} rooms, {graph.portal_count} portals, '
+          f'built in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    rng = random.Random(1)
+    min_x, max_x, min_z, max_z = level.floor_bounds()
+
+    def reachable(x, z, radius=0.5):
+        """The player's collision keeps the camera this far out of walls"""
+        return not any(b[0] - radius < x < b[2] + radius and b[1] - radius < z < b[3] + radius for b in graph.boxes)
+
+    views = []
+    while len(views) < 2000:
+        x, z = rng.uniform(min_x + 1, max_x - 1), rng.uniform(min_z + 1, max_z - 1)
+        if reachable(x, z):
+            views.append((x, z, rng.uniform(-180, 180)))
+    half_fov = 45
+    start = time.perf_counter()
+    results = [graph.visible_rooms(x, z, yaw, half_fov) for x, z, yaw in views]
+    elapsed = time.perf_counter() - start
+    counted = [len(rooms) for rooms in results if rooms is not None]
+    print(f'{elapsed / len(views) * 1e6:8.1f} us per traversal | '
+          f'{sum(counted) / len(counted):.1f} of {len(graph.rects)} rooms visible on average')
+
+    # Any point in view with a clear line of sight must be in a visible room
+    index = WallIndex(level.wall_rects(), level.floor_bounds())
+    missed = 0
+    checked = 0
+    for (x, z, yaw), rooms in zip(views[:200], results):
+        if rooms is None:
+            continue
+        for i in range(200):
+            px, pz = rng.uniform(min_x, max_x), rng.uniform(min_z, max_z)
+            angle = (math.degrees(math.atan2(px - x, pz - z)) - yaw + 180) % 360 - 180
+            target = graph.room_at(px, pz)
+            if abs(angle) > half_fov or target is None or not index.line_of_sight(x, z, px, pz):
+                continue
+            checked += 1
+            missed += target not in rooms
+    print(f'line of sight check: {missed} of {checked} visible points in culled rooms')
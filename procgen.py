@@ -0,0 +1,194 @@
+from collections import deque
+import json
+import random
+import sys
+import time
+
+from level import compile_level, read_compiled
+
+
+# Procedural mansion: seeded room grid in the level file format.
+# Rooms sit on a grid. A randomized depth-first maze over the grid opens one
+# door per tree edge, so every room is reachable, and a few extra doors make
+# loops so the ghost can't be dodged down a single corridor. Walls between
+# rooms are the same wall primitives as a hand made level, split in two
+# around each doorway. Every room gets a light and some furniture. The result
+# is plain level data (the JSON schema of levels/*.json), so it can be saved,
+# compiled and loaded like any other level.
+
+def generate_mansion(seed=1, rooms_x=20, rooms_z=20, room_size=15, door_width=3, loop_chance=0.15,
+                     wall_height=8, wall_thickness=0.5):
+    rng = random.Random(seed)
+    width = rooms_x * room_size
+    depth = rooms_z * room_size
+    min_x = -width / 2
+    min_z = -depth / 2
+    half = wall_height / 2
+
+    def center(i, j):
+        return (min_x + (i + 0.5) * room_size, min_z + (j + 0.5) * room_size)
+
+    def name(i, j):
+        return f'room {i},{j}'
+
+    # Maze over the room grid, then extra doors for loops
+    doors = set()
+    visited = {(0, 0)}
+    stack = [(0, 0)]
+    while stack:
+        i, j = stack[-1]
+        options = [(i + di, j + dj) for di, dj in ((1, 0), (-1, 0), (0, 1), (0, -1))
+                   if 0 <= i + di < rooms_x and 0 <= j + dj < rooms_z and (i + di, j + dj) not in visited]
+        if not options:
+            stack.pop()
+            continue
+        room = rng.choice(options)
+        doors.add(frozenset(((i, j), room)))
+        visited.add(room)
+        stack.append(room)
+    for i in range(rooms_x):
+        for j in range(rooms_z):
+            for room in ((i + 1, j), (i, j + 1)):
+                if room[0] < rooms_x and room[1] < rooms_z and rng.random() < loop_chance:
+                    doors.add(frozenset(((i, j), room)))
+
+    outer_walls = [
+        {'position': [0, half, depth / 2], 'scale': [width, wall_height, wall_thickness]},
+        {'position': [0, half, -depth / 2], 'scale': [width, wall_height, wall_thickness]},
+        {'position': [width / 2, half, 0], 'scale': [wall_thickness, wall_height, depth]},
+        {'position': [-width / 2, half, 0], 'scale': [wall_thickness, wall_height, depth]},
+    ]
+
+    room_walls = []
+    door_centers = {}
+
+    def wall_with_door(room, along_x, fixed, start, has_door, neighbour):
+        """A room side from start to start + room_size, split around a doorway"""
+        if not has_door:
+            segments = [(start, start + room_size)]
+        else:
+            door = rng.uniform(start + 1 + door_width / 2, start + room_size - 1 - door_width / 2)
+            segments = [(start, door - door_width / 2), (door + door_width / 2, start + room_size)]
+            door_centers[frozenset((room, neighbour))] = (door, fixed) if along_x else (fixed, door)
+        for a, b in segments:
+            middle = (a + b) / 2
+            if along_x:
+                room_walls.append({'room': name(*room), 'position': [middle, half, fixed],
+                                   'scale': [b - a, wall_height, wall_thickness]})
+            else:
+                room_walls.append({'room': name(*room), 'position': [fixed, half, middle],
+                                   'scale': [wall_thickness, wall_height, b - a]})
+
+    for i in range(rooms_x):
+        for j in range(rooms_z):
+            # Each room owns its east and north sides
+            if i < rooms_x - 1:
+                east = (i + 1, j)
+                wall_with_door((i, j), False, min_x + (i + 1) * room_size, min_z + j * room_size,
+                               frozenset(((i, j), east)) in doors, east)
+            if j < rooms_z - 1:
+                north = (i, j + 1)
+                wall_with_door((i, j), True, min_z + (j + 1) * room_size, min_x + i * room_size,
+                               frozenset(((i, j), north)) in doors, north)
+
+    # Furniture and lights
+    props = []
+    lights = []
+    for i in range(rooms_x):
+        for j in range(rooms_z):
+            cx, cz = center(i, j)
+            lights.append([cx, wall_height - 1, cz])
+            for n in range(rng.randint(0, 3)):
+                x = cx + rng.uniform(-room_size / 3, room_size / 3)
+                z = cz + rng.uniform(-room_size / 3, room_size / 3)
+                props.append({'name': 'chair', 'position': [x, 0.5, z], 'scale': [1, 1, 1], 'color': [60, 40, 30],
+                              'collider': True, 'solid': True, 'batch': 'white_cube'})
+            if rng.random() < 0.15:
+                x = cx + rng.uniform(-room_size / 4, room_size / 4)
+                z = cz + rng.uniform(-room_size / 4, room_size / 4)
+                props.append({'name': 'bed', 'position': [x, 0.5, z], 'scale': [4, 1, 6], 'texture': 'bed',
+                              'texture_scale': [1, 1], 'collider': True, 'solid': True, 'batch': 'bed'})
+            if rng.random() < 0.3:
+                # Painting on the south side of the room, just off the wall
+                x = cx + rng.uniform(-room_size / 4, room_size / 4)
+                z = min_z + j * room_size + wall_thickness
+                props.append({'name': 'painting', 'position': [x, 4, z], 'scale': [3, 2, 0.1], 'texture': 'wall',
+                              'color': [100, 80, 70], 'batch': 'wall_texture'})
+
+    # The player starts in one corner, the ghost in the room furthest away
+    # through the doors, the exit is somewhere on the west wall
+    neighbours = {}
+    for door in doors:
+        a, b = tuple(door)
+        neighbours.setdefault(a, []).append(b)
+        neighbours.setdefault(b, []).append(a)
+    came_from = {(0, 0): None}
+    queue = deque([(0, 0)])
+    while queue:
+        room = queue.popleft()
+        for other in neighbours.get(room, []):
+            if other not in came_from:
+                came_from[other] = room
+                queue.append(other)
+    far_room = room
+
+    start_x, start_z = center(0, 0)
+    ghost_x, ghost_z = center(*far_room)
+    exit_row = rng.randrange(rooms_z)
+    exit_door = [min_x + 0.5, 2, center(0, exit_row)[1]]
+    patrol_rooms = rng.sample([(i, j) for i in range(rooms_x) for j in range(rooms_z)], min(8, rooms_x * rooms_z))
+
+    # Benchmark route: from the start through the doors to the furthest room
+    path = []
+    room = far_room
+    while room is not None:
+        path.append(room)
+        room = came_from[room]
+    path.reverse()
+    route = []
+    for a, b in zip(path, path[1:]):
+        x, z = center(*a)
+        route.append([name(*a), [x, 2, z]])
+        door_x, door_z = door_centers[frozenset((a, b))]
+        route.append([name(*a), [door_x, 2, door_z]])
+    route.append([name(*far_room), [ghost_x, 2, ghost_z]])
+
+    return {
+        'name': f'mansion {seed} {rooms_x}x{rooms_z}',
+        'size': [width, depth],
+        'wall_height': wall_height,
+        'wall_thickness': wall_thickness,
+        'player_start': [start_x, 2, start_z],
+        'ghost_start': [ghost_x, 2, ghost_z],
+        'exit_door': exit_door,
+        'outer_walls': outer_walls,
+        'room_walls': room_walls,
+        'props': props,
+        'lights': lights,
+        'patrol_points': [[center(i, j)[0], 2, center(i, j)[1]] for i, j in patrol_rooms],
+        'benchmark_route': route,
+        'rooms': [{'name': name(i, j), 'rect': [min_x + i * room_size, min_z + j * room_size,
+                                                min_x + (i + 1) * room_size, min_z + (j + 1) * room_size]}
+                  for i in range(rooms_x) for j in range(rooms_z)],
+    }
+
+
+def mansion_level(seed=1, rooms_x=20, rooms_z=20, **kwargs):
+    """generate_mansion() as a Level, through the same compiler as level files"""
+    return read_compiled(compile_level(generate_mansion(seed, rooms_x, rooms_z, **kwargs)))
+
+
+if __name__ == '__main__':
+    # python procgen.py [SEED] [ROOMS_X] [ROOMS_Z] [OUT.json]
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    rooms_x = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rooms_z = int(sys.argv[3]) if len(sys.argv) > 3 else rooms_x
+    start = time.perf_counter()
+    data = generate_mansion(seed, rooms_x, rooms_z)
+    level = read_compiled(compile_level(data))
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f'{level.name}: {level.house_width:.0f}x{level.house_depth:.0f} units, {len(level.walls)} walls, '
+          f'{len(level.props)} props, {len(level.light_positions)} lights in {elapsed:.1f} ms')
+    if len(sys.argv) > 4:
+        with open(sys.argv[4], 'w') as f:
+            json.dump(data, f)
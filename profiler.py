@@ -0,0 +1,179 @@
+from array import array
+import csv
+import json
+import os
+import time
+
+
+# Frame profiler: per-subsystem frame times in ring buffers.
+# Functions and methods are registered once with instrument(). While the
+# profiler is disabled they are left untouched, so it costs one attribute
+# check per frame. Enabling it swaps in timing wrappers that add their time
+# to the subsystem's total for the current frame; end_frame() moves those
+# totals into fixed-size ring buffers. A frame longer than hitch_ms dumps the
+# last export_seconds of history to CSV and JSON.
+
+class FrameProfiler:
+    def __init__(self, subsystems, capacity=2048, hitch_ms=50, export_seconds=5, export_dir='.', export_cooldown=5):
+        self.names = list(subsystems)
+        self.capacity = capacity
+        self.hitch_ms = hitch_ms
+        self.export_seconds = export_seconds
+        self.export_dir = export_dir
+        self.export_cooldown = export_cooldown
+        self.enabled = False
+
+        # Ring buffers, one slot per frame
+        self.frame_ms = array('d', [0.0]) * capacity
+        self.stamps = array('d', [0.0]) * capacity
+        self.buffers = {name: array('d', [0.0]) * capacity for name in self.names}
+        self.index = 0
+        self.count = 0
+
+        # Seconds spent per subsystem in the frame being measured
+        self.current = dict.fromkeys(self.names, 0.0)
+        self.hooks = []
+        self.last_export = -export_cooldown
+        self.exports = []
+
+    def instrument(self, target, name, subsystem):
+        """Time target.name (or target[name] for a dict, like globals()) as part of a subsystem"""
+        self.hooks.append((target, name, subsystem, self.get(target, name)))
+        if self.enabled:
+            self.install(self.hooks[-1])
+
+    def instrument_callbacks(self, target, name, subsystem):
+        """Wrap a scheduler like invoke(func, ...) so the callbacks it runs are timed"""
+        schedule = self.get(target, name)
+
+        def timed_schedule(func, *args, **kwargs):
+            return schedule(self.timed(func, subsystem), *args, **kwargs)
+        self.hooks.append((target, name, None, schedule, timed_schedule))
+        if self.enabled:
+            self.install(self.hooks[-1])
+
+    def set_enabled(self, value):
+        if value == self.enabled:
+            return
+        self.enabled = value
+        for hook in self.hooks:
+            if value:
+                self.install(hook)
+            else:
+                self.set(hook[0], hook[1], hook[3])
+        for name in self.names:
+            self.current[name] = 0.0
+
+    def install(self, hook):
+        if hook[2] is None:
+            self.set(hook[0], hook[1], hook[4])
+        else:
+            self.set(hook[0], hook[1], self.timed(hook[3], hook[2]))
+
+    def timed(self, func, subsystem):
+        current = self.current
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                current[subsystem] += clock() - start
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    @staticmethod
+    def get(target, name):
+        if isinstance(target, dict):
+            return target[name]
+        # Class attributes directly, so methods are wrapped unbound
+        return target.__dict__[name] if isinstance(target, type) else getattr(target, name)
+
+    @staticmethod
+    def set(target, name, value):
+        if isinstance(target, dict):
+            target[name] = value
+        else:
+            setattr(target, name, value)
+
+    def end_frame(self, dt):
+        """Store this frame's subsystem times; call once per frame"""
+        if not self.enabled:
+            return
+        i = self.index
+        now = time.perf_counter()
+        self.frame_ms[i] = dt * 1000
+        self.stamps[i] = now
+        for name, seconds in self.current.items():
+            self.buffers[name][i] = seconds * 1000
+            self.current[name] = 0.0
+        self.index = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        if dt * 1000 > self.hitch_ms and now - self.last_export > self.export_cooldown:
+            self.last_export = now
+            self.export(f'hitch_{int(time.time())}_{int(dt * 1000)}ms')
+
+    def recent(self, seconds):
+        """Ring buffer slots of the last seconds, oldest first"""
+        if not self.count:
+            return []
+        newest = (self.index - 1) % self.capacity
+        cutoff = self.stamps[newest] - seconds
+        slots = []
+        for n in range(self.count):
+            i = (newest - n) % self.capacity
+            if self.stamps[i] < cutoff:
+                break
+            slots.append(i)
+        slots.reverse()
+        return slots
+
+    def summary(self, seconds=1):
+        """{subsystem: (avg ms, max ms)} over the last seconds, plus 'frame'"""
+        slots = self.recent(seconds)
+        result = {}
+        for name, buffer in [('frame', self.frame_ms)] + list(self.buffers.items()):
+            values = [buffer[i] for i in slots]
+            result[name] = (sum(values) / len(values), max(values)) if values else (0, 0)
+        return result
+
+    def rows(self, seconds):
+        newest = self.stamps[(self.index - 1) % self.capacity]
+        for i in self.recent(seconds):
+            yield [round(self.stamps[i] - newest, 4), round(self.frame_ms[i], 3)] + [round(self.buffers[name][i], 4) for name in self.names]
+
+    def export(self, basename):
+        """Write the last export_seconds to basename.csv and basename.json"""
+        header = ['t', 'frame_ms'] + [f'{name}_ms' for name in self.names]
+        rows = list(self.rows(self.export_seconds))
+        path = os.path.join(self.export_dir, basename)
+        with open(path + '.csv', 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+        with open(path + '.json', 'w') as f:
+            json.dump({'columns': header, 'frames': rows, 'hitch_ms': self.hitch_ms}, f)
+        self.exports.append(path)
+        print(f'PROFILER: {len(rows)} frames -> {path}.csv/.json')
+        return path
+
+
+# python profiler.py - cost of an instrumented call, disabled and enabled
+if __name__ == '__main__':
+    class Thing:
+        def update(self):
+            pass
+
+    profiler = FrameProfiler(['things'])
+    profiler.instrument(Thing, 'update', 'things')
+    things = [Thing() for i in range(1000)]
+    for enabled in (False, True):
+        profiler.set_enabled(enabled)
+        start = time.perf_counter()
+        for frame in range(200):
+            for thing in things:
+                thing.update()
+            profiler.end_frame(1 / 60)
+        per_call = (time.perf_counter() - start) / (200 * len(things)) * 1e9
+        print(f'profiler {"on " if enabled else "off"}: {per_call:6.1f} ns per update call')
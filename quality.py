@@ -0,0 +1,262 @@
+from collections import deque, namedtuple
+import random
+import sys
+
+from panda3d.core import CardMaker, SamplerState, Texture
+from direct.showbase.DirectObject import DirectObject
+
+
+# Quality governor: steps quality down and up to hold the frame rate.
+# Watches a rolling window of frame times and moves between quality levels
+# (QUALITY_LEVELS, lowest first). It steps down once the window's 90th
+# percentile has been over budget by DOWN_RATIO for DOWN_AFTER seconds, and
+# tries a step up once it has been within UP_RATIO of the budget for a while.
+# The gap between the two ratios and the two waits is the hysteresis, so it
+# settles instead of flipping between two levels every second.
+#
+# A vsynced frame never looks faster than the budget, however much room is
+# left, so a step up is a probe: if the new level drops below the frame
+# rate again within PROBE_SECONDS, the wait before the next try from the
+# level below doubles (up to MAX_UP_AFTER). A machine that can't hold a
+# level stops trying it every few seconds.
+#
+# A step down is checked too: if the lower level's first full window is
+# slower than the one that stepped down (a software renderer paying more for
+# the scaled resolution's buffer than it saves), it steps back up and won't
+# go below that level again.
+#
+# The window is cleared on every change, so each level is judged on its own
+# frames. Frames over HITCH_MS (loading, a GC pause) say nothing about
+# quality and are left out. Every change is kept in decisions for logging.
+
+QualityLevel = namedtuple('QualityLevel', 'name lights resolution overlays animation_hz')
+
+# lights None is every light the game allows (--lights); overlays are the
+# full screen vignette and the ghost's two pass transparency
+QUALITY_LEVELS = (
+    QualityLevel('lowest', lights=1, resolution=0.5, overlays=False, animation_hz=15),
+    QualityLevel('low', lights=1, resolution=0.75, overlays=False, animation_hz=20),
+    QualityLevel('medium', lights=2, resolution=1.0, overlays=True, animation_hz=30),
+    QualityLevel('high', lights=None, resolution=1.0, overlays=True, animation_hz=60),
+)
+
+DOWN_RATIO = 1.2
+UP_RATIO = 1.05
+DOWN_AFTER = 0.5
+UP_AFTER = 3.0
+MAX_UP_AFTER = 60.0
+PROBE_SECONDS = 10.0
+WORSE_RATIO = 1.1
+HITCH_MS = 250
+
+
+class QualityGovernor:
+    def __init__(self, apply, levels=QUALITY_LEVELS, target_fps=60, window=60, level=None):
+        """apply(level) is called with the QualityLevel to switch to, once
+        now and on every change. level is where to start (the highest if None)."""
+        self.apply = apply
+        self.levels = levels
+        self.budget_ms = 1000 / target_fps
+        self.frame_ms = deque(maxlen=window)
+        self.index = len(levels) - 1 if level is None else level
+        self.up_after = [UP_AFTER] * len(levels)  # Wait at each level before trying the next
+        self.floor = 0           # Lowest level that's worth stepping down to
+        self.stepped_down = None  # p90 that made the last step down, until it's checked
+        self.time = 0
+        self.changed_at = 0
+        self.over = 0   # Seconds the window has been over budget
+        self.under = 0  # Seconds it has been within budget
+        self.decisions = []
+        self.stats = {'level': self.level.name, 'p90_ms': 0, 'changes': 0, 'decisions': self.decisions}
+        apply(self.level)
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    def update(self, dt):
+        """Add a frame; steps a level down or up when it's time to"""
+        self.time += dt
+        ms = dt * 1000
+        if ms < HITCH_MS:
+            self.frame_ms.append(ms)
+        if len(self.frame_ms) < self.frame_ms.maxlen:
+            return
+        ordered = sorted(self.frame_ms)
+        p90 = ordered[len(ordered) * 9 // 10]
+        self.stats['p90_ms'] = p90
+        if self.stepped_down is not None:
+            worse = p90 > self.stepped_down * WORSE_RATIO
+            self.stepped_down = None
+            if worse:
+                self.floor = self.index + 1
+                self.step(1, p90, 'slower than the level above')
+                return
+        if p90 > self.budget_ms * DOWN_RATIO:
+            self.over += dt
+            self.under = 0
+            if self.over >= DOWN_AFTER and self.index > self.floor:
+                self.step(-1, p90)
+        elif p90 <= self.budget_ms * UP_RATIO:
+            self.under += dt
+            self.over = 0
+            if self.under >= self.up_after[self.index] and self.index < len(self.levels) - 1:
+                self.step(1, p90)
+        else:
+            # In between: neither is building up
+            self.over = 0
+            self.under = 0
+
+    def step(self, direction, p90, reason=None):
+        reason = reason or ('over budget' if direction < 0 else 'within budget')
+        if direction < 0 and self.decisions and self.decisions[-1]['to'] == self.level.name \
+                and self.decisions[-1]['direction'] > 0 and self.time - self.changed_at < PROBE_SECONDS:
+            # The last step up didn't hold, wait longer before the next one
+            below = self.index - 1
+            self.up_after[below] = min(MAX_UP_AFTER, self.up_after[below] * 2)
+            reason = f'step up failed, next try in {self.up_after[below]:.0f} s'
+        previous = self.level
+        self.set_level(self.index + direction)
+        if direction < 0:
+            self.stepped_down = p90
+        self.decisions.append({'time': round(self.time, 2), 'from': previous.name, 'to': self.level.name,
+                               'direction': direction, 'p90_ms': round(p90, 2), 'reason': reason})
+
+    def set_level(self, index):
+        """Switch to a level now (also how a fixed --quality is set)"""
+        self.index = max(0, min(len(self.levels) - 1, index))
+        self.frame_ms.clear()
+        self.over = 0
+        self.under = 0
+        self.changed_at = self.time
+        self.stats['level'] = self.level.name
+        self.stats['changes'] += 1
+        self.apply(self.level)
+
+    def describe(self, decision):
+        return (f'{decision["from"]} -> {decision["to"]} at {decision["time"]:.1f} s, '
+                f'p90 {decision["p90_ms"]:.1f} ms for a {self.budget_ms:.1f} ms budget ({decision["reason"]})')
+
+
+def level_index(name, levels=QUALITY_LEVELS):
+    """Index of the level called name, for --quality"""
+    for i, level in enumerate(levels):
+        if level.name == name:
+            return i
+    raise SystemExit(f'unknown quality {name}, try auto or one of {", ".join(level.name for level in levels)}')
+
+
+# Resolution scale: below a scale of 1 the main camera renders into an
+# offscreen buffer of that fraction of the window size, shown on a full
+# screen card behind the UI. The UI (camera.ui) still draws at full
+# resolution. The buffer follows the window's size.
+
+class ResolutionScaler:
+    def __init__(self, base, region):
+        self.base = base
+        self.region = region  # The window's display region for base.cam
+        self.scale = 1
+        self.buffer = None
+        self.card = None
+        self.events = DirectObject()
+        self.events.accept('window-event', self.on_window_event)
+        self.size = None
+
+    def set_scale(self, scale):
+        scale = min(1, scale)
+        if scale == self.scale:
+            return
+        self.scale = scale
+        self.rebuild()
+
+    def on_window_event(self, window):
+        if self.buffer is not None and window is self.base.win and self.window_size() != self.size:
+            self.rebuild()
+
+    def window_size(self):
+        return self.base.win.get_x_size(), self.base.win.get_y_size()
+
+    def rebuild(self):
+        self.release()
+        if self.scale >= 1:
+            return
+        win = self.base.win
+        self.size = self.window_size()
+        texture = Texture('scaled_scene')
+        texture.set_minfilter(SamplerState.FT_linear)
+        texture.set_magfilter(SamplerState.FT_linear)
+        texture.set_wrap_u(SamplerState.WM_clamp)
+        texture.set_wrap_v(SamplerState.WM_clamp)
+        width, height = (max(1, round(size * self.scale)) for size in self.size)
+        buffer = win.make_texture_buffer('scaled_scene', width, height, texture)
+        if buffer is None:
+            self.scale = 1  # No offscreen buffers here, stay at full size
+            return
+        buffer.set_sort(-10)
+        buffer.set_clear_color(win.get_clear_color())
+        buffer.set_clear_color_active(True)
+        buffer.make_display_region().set_camera(self.base.cam)
+        self.region.set_active(False)
+        cards = CardMaker('scaled_scene')
+        cards.set_frame_fullscreen_quad()
+        self.card = self.base.render2d.attach_new_node(cards.generate())
+        self.card.set_texture(texture)
+        self.card.set_depth_test(False)
+        self.card.set_depth_write(False)
+        self.buffer = buffer
+
+    def release(self):
+        if self.buffer is None:
+            return
+        self.card.remove_node()
+        self.card = None
+        self.base.graphicsEngine.remove_window(self.buffer)
+        self.buffer = None
+        self.region.set_active(True)
+
+
+# python quality.py [SECONDS] - how often the governor changes level on a
+# made-up machine: frame cost per level plus noise, with a heavy stretch in
+# the middle (the player walks into the big lit hall). Compared against the
+# same rules with no hysteresis: step down over budget, up under it, every
+# window.
+if __name__ == '__main__':
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    cost_ms = {'lowest': 7, 'low': 10, 'medium': 14, 'high': 18}
+
+    def run(governor_type):
+        rng = random.Random(1)
+        levels = []
+        governor = governor_type(levels.append)
+        shown = 0
+        missed = 0
+        while governor.time < seconds:
+            heavy = 1.5 if seconds * 0.4 < governor.time < seconds * 0.6 else 1
+            # A vsynced frame takes at least one refresh
+            ms = max(1000 / 60, cost_ms[governor.level.name] * heavy * rng.gauss(1, 0.08))
+            if rng.random() < 0.002:
+                ms += 400
+            missed += ms > 1000 / 60 * 1.05
+            governor.update(ms / 1000)
+            shown += 1
+        return governor, missed / shown, len(levels) - 1
+
+    class NoHysteresis(QualityGovernor):
+        def update(self, dt):
+            self.time += dt
+            self.frame_ms.append(dt * 1000)
+            if len(self.frame_ms) < self.frame_ms.maxlen:
+                return
+            p90 = sorted(self.frame_ms)[len(self.frame_ms) * 9 // 10]
+            if p90 > self.budget_ms and self.index > 0:
+                self.step(-1, p90)
+            elif p90 <= self.budget_ms * 1.05 and self.index < len(self.levels) - 1:
+                self.step(1, p90)
+
+    print(f'{"":<14} {"changes":>8} {"missed":>7}  final')
+    for name, governor_type in (('hysteresis', QualityGovernor), ('no hysteresis', NoHysteresis)):
+        governor, missed, changes = run(governor_type)
+        print(f'{name:<14} {changes:>8} {missed:>7.1%}  {governor.level.name}')
+    governor = run(QualityGovernor)[0]
+    for decision in governor.decisions:
+        print('  ' + governor.describe(decision))
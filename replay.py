@@ -0,0 +1,240 @@
+import json
+import struct
+import sys
+import time
+
+from level import load_level, DEFAULT_LEVEL
+from procgen import mansion_level
+from simulation import Simulation, PlayerInput
+
+
+# Records the per-tick input of a run and plays it back. With the seed, the
+# level and the exact input of every tick, a run plays out the same way
+# again, so two builds can be timed on the same session.
+#
+# File layout, little endian:
+#   header  magic 'SCRM', version (u8), tick rate (u16), seed (u64),
+#           level digest (8 bytes), mansion seed (i32, -1 for a level file),
+#           mansion rooms (u16), ghosts (u16), nav cell size (f64),
+#           level path length (u16) and path (utf-8)
+#   runs    repeat count (u16), key bits (u8), mouse dx, mouse dy (f32)
+# Ticks with identical input are stored as one run, so standing still or
+# holding W without touching the mouse costs 11 bytes however long it lasts.
+
+MAGIC = b'SCRM'
+# 2: random events moved to the event scheduler, version 1 runs play out differently
+# 3: the level, mansion and ghost count are in the header
+VERSION = 3
+HEADER = struct.Struct('<4sBHQ8siHHdH')
+RUN = struct.Struct('<HBff')
+MAX_RUN = 0xFFFF
+
+# Key bits
+KEY_W = 1
+KEY_S = 2
+KEY_A = 4
+KEY_D = 8
+KEY_SHIFT = 16
+RESTART = 32  # Game restarted right before this tick
+
+
+def encode(controls, restart=False):
+    """PlayerInput -> (key bits, mouse dx, mouse dy)"""
+    bits = 0
+    if controls.forward > 0:
+        bits |= KEY_W
+    elif controls.forward < 0:
+        bits |= KEY_S
+    if controls.strafe > 0:
+        bits |= KEY_D
+    elif controls.strafe < 0:
+        bits |= KEY_A
+    if controls.sprint:
+        bits |= KEY_SHIFT
+    if restart:
+        bits |= RESTART
+    # Round through f32 so the live run sees exactly what the file stores
+    dx, dy = struct.unpack('<ff', struct.pack('<ff', controls.mouse_dx, controls.mouse_dy))
+    return bits, dx, dy
+
+
+def decode(bits, dx, dy):
+    """(key bits, mouse dx, mouse dy) -> (PlayerInput, restart)"""
+    controls = PlayerInput(
+        bool(bits & KEY_W) - bool(bits & KEY_S),
+        bool(bits & KEY_D) - bool(bits & KEY_A),
+        bool(bits & KEY_SHIFT),
+        dx,
+        dy
+    )
+    return controls, bool(bits & RESTART)
+
+
+class InputRecorder:
+    def __init__(self, path, tick_rate, sim, level_path=DEFAULT_LEVEL, mansion_seed=-1, rooms=0):
+        """Records sim's run. level_path is the level file it was loaded from,
+        or mansion_seed and rooms the generated house it plays."""
+        level_path = level_path.encode() if mansion_seed < 0 else b''
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, tick_rate, sim.seed, bytes.fromhex(sim.level.digest),
+                                    mansion_seed, rooms, sim.ghost_count, sim.nav_grid.cell_size, len(level_path)))
+        self.file.write(level_path)
+        self.run = None
+        self.count = 0
+        self.ticks = 0
+
+    def record(self, controls, restart=False):
+        """Store one tick's input and return it as the simulation must see it"""
+        run = encode(controls, restart)
+        if run == self.run and self.count < MAX_RUN:
+            self.count += 1
+        else:
+            self.flush()
+            self.run = run
+            self.count = 1
+        self.ticks += 1
+        return decode(*run)[0]
+
+    def flush(self):
+        if self.run is not None:
+            self.file.write(RUN.pack(self.count, *self.run))
+
+    def close(self):
+        self.flush()
+        self.run = None
+        self.file.close()
+
+
+class InputPlayer:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version = HEADER.unpack_from(data)[:2]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} replay')
+        (self.tick_rate, self.seed, digest, self.mansion_seed, self.rooms, self.ghosts,
+         self.nav_cell_size, length) = HEADER.unpack_from(data)[2:]
+        self.path = path
+        self.level_digest = digest.hex()
+        start = HEADER.size + length
+        self.level_path = data[HEADER.size:start].decode()
+        self.runs = [RUN.unpack_from(data, offset) for offset in range(start, len(data), RUN.size)]
+        self.ticks = sum(run[0] for run in self.runs)
+        self.run_index = 0
+        self.left = self.runs[0][0] if self.runs else 0
+
+    def load_level(self):
+        """The level the run was recorded on"""
+        if self.mansion_seed >= 0:
+            level = mansion_level(self.mansion_seed, self.rooms, self.rooms)
+        else:
+            level = load_level(self.level_path)
+        self.check_level(level)
+        return level
+
+    def check_level(self, level):
+        if level.digest != self.level_digest:
+            raise ValueError(f'{self.path} was recorded on a different version of {level.name}')
+
+    def simulation(self):
+        """A fresh Simulation set up the way the recording's was"""
+        return Simulation(seed=self.seed, nav_cell_size=self.nav_cell_size, level=self.load_level(), ghosts=self.ghosts)
+
+    @property
+    def finished(self):
+        return self.run_index >= len(self.runs)
+
+    def next(self):
+        """(PlayerInput, restart) for the next tick, or None at the end"""
+        if self.finished:
+            return None
+        bits, dx, dy = self.runs[self.run_index][1:]
+        self.left -= 1
+        if self.left == 0:
+            self.run_index += 1
+            if not self.finished:
+                self.left = self.runs[self.run_index][0]
+        return decode(bits, dx, dy)
+
+
+# Timing report: per-frame times of a replay, for comparing builds
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def timing_report(frame_times, sim_times, sim):
+    """Summary of a replay: frame/tick time percentiles in ms plus where the run ended up"""
+    report = {'frames': len(frame_times), 'ticks': len(sim_times)}
+    for name, values in (('frame', frame_times), ('tick', sim_times)):
+        ms = [t * 1000 for t in values]
+        report[name] = {
+            'mean_ms': sum(ms) / len(ms) if ms else 0,
+            'p50_ms': percentile(ms, 50),
+            'p95_ms': percentile(ms, 95),
+            'p99_ms': percentile(ms, 99),
+            'max_ms': max(ms) if ms else 0,
+        }
+    # Two replays of the same file must agree on this, whatever the timings
+    report['final_state'] = {
+        'time': round(sim.time, 6),
+        'player': [round(sim.player.x, 4), round(sim.player.z, 4)],
+        'ghost': [round(sim.ghost.x, 4), round(sim.ghost.z, 4)],
+        'sanity': round(sim.sanity, 4),
+        'game_over': sim.game_over,
+        'game_won': sim.game_won,
+    }
+    report['frame_times_ms'] = [round(t * 1000, 3) for t in frame_times]
+    return report
+
+
+def write_report(path, report):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+def compare(path_a, path_b):
+    """Print the timing difference between two replay reports"""
+    with open(path_a) as f:
+        a = json.load(f)
+    with open(path_b) as f:
+        b = json.load(f)
+    if a['final_state'] != b['final_state']:
+        print('WARNING: the runs ended differently, the timings are not comparable')
+    for section in ('frame', 'tick'):
+        for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'):
+            old, new = a[section][key], b[section][key]
+            change = (new - old) / old * 100 if old else 0
+            print(f'{section:>6} {key:>8} {old:10.3f} -> {new:10.3f} ({change:+.1f}%)')
+
+
+# Headless replay: run a recording through the simulation, no window
+def replay_headless(path):
+    player = InputPlayer(path)
+    sim = player.simulation()
+    dt = 1 / player.tick_rate
+    sim_times = []
+    while not player.finished:
+        controls, restart = player.next()
+        if restart:
+            sim.reset()
+        start = time.perf_counter()
+        sim.step(dt, controls)
+        sim_times.append(time.perf_counter() - start)
+    return timing_report([], sim_times, sim)
+
+
+if __name__ == '__main__':
+    usage = 'usage: python replay.py run FILE [REPORT.json] | compare A.json B.json'
+    if len(sys.argv) >= 3 and sys.argv[1] == 'run':
+        report = replay_headless(sys.argv[2])
+        print(f'{report["ticks"]} ticks | tick p50 {report["tick"]["p50_ms"]:.3f} ms, '
+              f'p99 {report["tick"]["p99_ms"]:.3f} ms | end {report["final_state"]}')
+        if len(sys.argv) >= 4:
+            write_report(sys.argv[3], report)
+    elif len(sys.argv) == 4 and sys.argv[1] == 'compare':
+        compare(sys.argv[2], sys.argv[3])
+    else:
+        print(usage)
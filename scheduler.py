@@ -0,0 +1,248 @@
+import heapq
+import itertools
+import math
+import random
+import sys
+import time
+
+
+# Timed callbacks and random events on a heap. Random events used to be a
+# dice roll every tick with a fixed chance. That costs a random number per
+# tick whether anything happens or not, and the chance per second depends
+# on how long a tick is. A Process models the
+# event as a Poisson process with a rate per second instead: the wait until
+# its next event is drawn once from the exponential distribution, and the
+# event sits in the heap until it's due. Nothing is rolled in between.
+#
+# Changing a rate rescales the time left rather than rolling again. The
+# exponential is memoryless, so what's left of an Exp(old) wait, times
+# old / new, is an Exp(new) wait. A rate of 0 parks the process until the
+# rate goes up again, and a rate that didn't change costs nothing.
+#
+# Cancelled events stay in the heap and are skipped when they come up, but
+# they're counted: once they're most of a heap of COMPACT_MIN or more, the
+# heap is rebuilt without them, so a process whose rate keeps changing
+# can't grow it without bound.
+#
+# Events nobody waits on, only looks at now and then, can skip the heap:
+# a PulledProcess draws the same waits but fires them in one batch when its
+# state is read.
+
+COMPACT_MIN = 64
+
+
+class Event:
+    __slots__ = ('time', 'callback', 'args', 'cancelled', 'scheduler')
+
+    def __init__(self, time, callback, args, scheduler):
+        self.time = time
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.scheduler = scheduler  # None once it has fired
+
+    def cancel(self):
+        scheduler = self.scheduler
+        if self.cancelled or scheduler is None:
+            return
+        self.cancelled = True
+        scheduler.cancelled += 1
+        if scheduler.cancelled >= COMPACT_MIN and scheduler.cancelled * 2 > len(scheduler.heap):
+            scheduler.compact()
+
+
+class Process:
+    """callback() at random times, rate times per second on average"""
+    def __init__(self, scheduler, rate, callback, rng):
+        self.scheduler = scheduler
+        self.rate = rate
+        self.callback = callback
+        self.rng = rng
+        self.event = None
+        if rate > 0:
+            self.event = scheduler.at(scheduler.now + rng.expovariate(rate), self.fire)
+
+    def set_rate(self, rate):
+        if rate == self.rate:
+            return
+        scheduler = self.scheduler
+        if self.event is None or rate <= 0:
+            # Parked, or parking: the next wait starts from scratch
+            if self.event is not None:
+                self.event.cancel()
+                self.event = None
+            if rate > 0:
+                self.event = scheduler.at(scheduler.now + self.rng.expovariate(rate), self.fire)
+        else:
+            remaining = (self.event.time - scheduler.now) * self.rate / rate
+            self.event.cancel()
+            self.event = scheduler.at(scheduler.now + remaining, self.fire)
+        self.rate = rate
+
+    def fire(self):
+        # Next wait first, so the callback can change the rate
+        self.event = self.scheduler.at(self.scheduler.now + self.rng.expovariate(self.rate), self.fire)
+        self.callback()
+
+    def cancel(self):
+        if self.event is not None:
+            self.event.cancel()
+            self.event = None
+        self.rate = 0
+
+
+class PulledProcess:
+    """A Process whose events only change state that's read now and then
+    (light flicker). They stay out of the heap and fire in a batch when
+    catch_up() is called, as callback(time): the same waits, from the same
+    rng draws in the same order, as a Process would fire them one by one."""
+    def __init__(self, scheduler, rate, callback, rng):
+        self.scheduler = scheduler
+        self.rate = rate
+        self.callback = callback
+        self.rng = rng
+        self.next = scheduler.now + rng.expovariate(rate) if rate > 0 else None
+        self.fired = 0
+
+    def catch_up(self, time):
+        """Fire every event due by time, in time order"""
+        next_time = self.next
+        if next_time is None or next_time > time:
+            return
+        expovariate = self.rng.expovariate
+        rate = self.rate
+        callback = self.callback
+        while next_time <= time:
+            # Next wait first, like Process.fire
+            due = next_time
+            next_time = due + expovariate(rate)
+            self.fired += 1
+            callback(due)
+        self.next = next_time
+
+    def set_rate(self, rate):
+        """Process.set_rate, after firing what was due at the old rate"""
+        if rate == self.rate:
+            return
+        now = self.scheduler.now
+        self.catch_up(now)
+        if self.next is None or rate <= 0:
+            self.next = now + self.rng.expovariate(rate) if rate > 0 else None
+        else:
+            self.next = now + (self.next - now) * self.rate / rate
+        self.rate = rate
+
+
+class Scheduler:
+    def __init__(self):
+        self.now = 0
+        self.heap = []
+        # Events due at the same time fire in the order they were scheduled
+        self.order = itertools.count()
+        self.cancelled = 0  # Cancelled events still in the heap
+        self.stats = {'scheduled': 0, 'fired': 0, 'pending': 0, 'compactions': 0}
+
+    def at(self, time, callback, *args):
+        """Run callback(*args) once the clock reaches time; returns the Event"""
+        event = Event(time, callback, args, self)
+        heapq.heappush(self.heap, (time, next(self.order), event))
+        self.stats['scheduled'] += 1
+        self.stats['pending'] = len(self.heap)
+        return event
+
+    def invoke(self, callback, *args, delay=0):
+        """Like ursina's invoke(), on this scheduler's clock"""
+        return self.at(self.now + delay, callback, *args)
+
+    def process(self, rate, callback, rng):
+        """A Poisson process with rate events per second, its waits drawn from rng"""
+        return Process(self, rate, callback, rng)
+
+    def pulled_process(self, rate, callback, rng):
+        """A Process fired by catch_up(time) instead of the heap"""
+        return PulledProcess(self, rate, callback, rng)
+
+    def advance(self, dt):
+        """Move the clock on by dt, firing everything due on the way in time order"""
+        self.run_until(self.now + dt)
+
+    def run_until(self, time):
+        heap = self.heap
+        if not heap or heap[0][0] > time:
+            # Most ticks: nothing is due
+            self.now = time
+            return
+        while heap and heap[0][0] <= time:
+            event = heapq.heappop(heap)[2]
+            if event.cancelled:
+                self.cancelled -= 1
+                continue
+            event.scheduler = None
+            # Callbacks see the time their event was due
+            self.now = event.time
+            self.stats['fired'] += 1
+            event.callback(*event.args)
+        self.now = time
+        self.stats['pending'] = len(heap)
+
+    def compact(self):
+        """Drop the cancelled events from the heap"""
+        # In place, run_until may be popping from this list right now
+        self.heap[:] = [entry for entry in self.heap if not entry[2].cancelled]
+        heapq.heapify(self.heap)
+        self.cancelled = 0
+        self.stats['pending'] = len(self.heap)
+        self.stats['compactions'] += 1
+
+    def clear(self):
+        for entry in self.heap:
+            entry[2].cancelled = True
+            entry[2].scheduler = None
+        self.heap.clear()
+        self.cancelled = 0
+        self.stats['pending'] = 0
+
+
+def per_tick_rate(chance, tick_rate):
+    """The rate per second of an event that had this chance every tick"""
+    return -math.log(1 - chance) * tick_rate
+
+
+# python scheduler.py [SECONDS] - events per second at different frame rates, RNG calls per frame
+if __name__ == '__main__':
+    class CountingRandom(random.Random):
+        calls = 0
+
+        def random(self):
+            CountingRandom.calls += 1
+            return super().random()
+
+    def run(fps, seconds, scheduled):
+        """Count events of a 0.02-per-tick-at-60 chance over seconds at fps"""
+        rng = CountingRandom(1)
+        CountingRandom.calls = 0
+        dt = 1 / fps
+        frames = int(seconds * fps)
+        fired = [0]
+
+        def count():
+            fired[0] += 1
+        start = time.perf_counter()
+        if scheduled:
+            scheduler = Scheduler()
+            scheduler.process(per_tick_rate(0.02, 60), count, rng)
+            for i in range(frames):
+                scheduler.advance(dt)
+        else:
+            for i in range(frames):
+                if rng.random() < 0.02:
+                    count()
+        elapsed = time.perf_counter() - start
+        return fired[0] / seconds, CountingRandom.calls / frames, elapsed / frames * 1e9
+
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 3600
+    print(f'{"":<10} {"fps":>4} {"events/s":>9} {"rng/frame":>10} {"ns/frame":>9}')
+    for name, scheduled in (('per frame', False), ('scheduled', True)):
+        for fps in (30, 60, 144, 240):
+            rate, calls, ns = run(fps, seconds, scheduled)
+            print(f'{name:<10} {fps:>4} {rate:>9.3f} {calls:>10.3f} {ns:>9.0f}')
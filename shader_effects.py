@@ -0,0 +1,152 @@
+from panda3d.core import Shader, ClockObject
+import math
+
+
+# Shader effects: light flicker and the ghost's pulse, animated on the GPU.
+# Flicker and pulse are functions of time only, yet they used to be worked
+# out in Python every frame for every light, bulb and ghost, allocating a
+# new Color each time. Now the shaders do it: Panda hands every shader the
+# frame time as osg_FrameTime, each object carries a phase (a shader input,
+# or instance data for instanced bulbs), and Python only touches an object
+# when its state changes, like a light going out. flicker() is the same
+# formula for the CPU, for the handful of real point lights that need it.
+
+# Intensity of a light that's out, in the same units as its base intensity
+OFF_INTENSITY = 20 / 255
+# The most flicker() ever adds or takes away
+FLICKER_PEAK = 0.4
+
+FLICKER_GLSL = '''
+uniform float osg_FrameTime;
+
+float flicker(float phase) {
+    float t = osg_FrameTime + phase;
+    return sin(t * 20.0) * 0.3 + sin(t * 53.1) * 0.06 + sin(t * 97.7) * 0.04;
+}
+'''
+
+clock = ClockObject.get_global_clock()
+
+def flicker(phase):
+    """The shaders' flicker at this frame's time"""
+    t = clock.get_frame_time() + phase
+    return math.sin(t * 20) * 0.3 + math.sin(t * 53.1) * 0.06 + math.sin(t * 97.7) * 0.04
+
+# Ambient plus Lambert from each point light, with Panda's attenuation, like
+# the fixed-function lighting on everything else
+LIGHTING_GLSL = '''
+uniform struct p3d_LightModelParameters {
+    vec4 ambient;
+} p3d_LightModel;
+uniform struct p3d_LightSourceParameters {
+    vec4 color;
+    vec4 position;
+    vec3 attenuation;
+} p3d_LightSource[MAX_LIGHTS];
+
+vec3 lighting(vec3 view_position, vec3 view_normal) {
+    vec3 normal = normalize(view_normal);
+    vec3 light = p3d_LightModel.ambient.rgb;
+    for (int i = 0; i < MAX_LIGHTS; i++) {
+        vec3 offset = p3d_LightSource[i].position.xyz - view_position * p3d_LightSource[i].position.w;
+        float distance = length(offset);
+        vec3 attenuation = p3d_LightSource[i].attenuation;
+        float falloff = max(attenuation.x + attenuation.y * distance + attenuation.z * distance * distance, 1e-4);
+        light += p3d_LightSource[i].color.rgb * max(dot(normal, offset / max(distance, 1e-4)), 0) / falloff;
+    }
+    return light;
+}
+'''
+
+# Lightmapped surfaces: texture times atlas, scaled by the flicker of the
+# lamp they were baked with. lamp is (phase, base intensity, on, 0); a base
+# of 0 means no lamp, the baked light as is. The flicker is the same all
+# over a surface, so it's worked out per vertex, not per pixel.
+BAKED_VERTEX = '''
+#version 140
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform vec4 lamp;
+in vec4 p3d_Vertex;
+in vec4 p3d_Color;
+in vec2 p3d_MultiTexCoord0;
+in vec2 p3d_MultiTexCoord1;
+out vec2 uv;
+out vec2 lightmap_uv;
+out vec4 vertex_color;
+''' + FLICKER_GLSL + '''
+void main() {
+    gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
+    uv = p3d_MultiTexCoord0;
+    lightmap_uv = p3d_MultiTexCoord1;
+    float level = 1.0;
+    if (lamp.y > 0.0) {
+        level = (lamp.z > 0.0 ? max(0.2, lamp.y + flicker(lamp.x)) : OFF_INTENSITY) / lamp.y;
+    }
+    vertex_color = vec4(p3d_Color.rgb * level, p3d_Color.a);
+}
+'''.replace('OFF_INTENSITY', repr(OFF_INTENSITY))
+
+BAKED_FRAGMENT = '''
+#version 140
+uniform sampler2D p3d_Texture0;
+uniform sampler2D p3d_Texture1;
+uniform vec4 p3d_ColorScale;
+in vec2 uv;
+in vec2 lightmap_uv;
+in vec4 vertex_color;
+out vec4 fragment_color;
+
+void main() {
+    fragment_color = texture(p3d_Texture0, uv) * texture(p3d_Texture1, lightmap_uv) * vertex_color * p3d_ColorScale;
+}
+'''
+
+# The ghost: lit per vertex like the fixed-function lighting on everything
+# else, its alpha pulsing
+GHOST_VERTEX = '''
+#version 140
+#define MAX_LIGHTS {max_lights}
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat4 p3d_ModelViewMatrix;
+uniform mat3 p3d_NormalMatrix;
+uniform float osg_FrameTime;
+in vec4 p3d_Vertex;
+in vec3 p3d_Normal;
+in vec2 p3d_MultiTexCoord0;
+out vec2 uv;
+out vec4 light;
+{lighting}
+void main() {{
+    gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
+    uv = p3d_MultiTexCoord0;
+    vec3 view_position = (p3d_ModelViewMatrix * p3d_Vertex).xyz;
+    light = vec4(lighting(view_position, p3d_NormalMatrix * p3d_Normal), 0.7 + sin(osg_FrameTime * 3.0) * 0.2);
+}}
+'''
+
+GHOST_FRAGMENT = '''
+#version 140
+uniform sampler2D p3d_Texture0;
+uniform vec4 p3d_ColorScale;
+in vec2 uv;
+in vec4 light;
+out vec4 fragment_color;
+
+void main() {
+    fragment_color = texture(p3d_Texture0, uv) * p3d_ColorScale * light;
+}
+'''
+
+shaders = {}
+
+def baked_shader():
+    if 'baked' not in shaders:
+        shaders['baked'] = Shader.make(Shader.SL_GLSL, BAKED_VERTEX, BAKED_FRAGMENT)
+    return shaders['baked']
+
+def ghost_shader(max_lights=8):
+    key = ('ghost', max_lights)
+    if key not in shaders:
+        vertex = GHOST_VERTEX.format(max_lights=max_lights, lighting=LIGHTING_GLSL)
+        shaders[key] = Shader.make(Shader.SL_GLSL, vertex, GHOST_FRAGMENT)
+    return shaders[key]
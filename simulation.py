@@ -0,0 +1,485 @@
+from collections import namedtuple
+import math
+import random
+import time
+
+from ghosts import GhostGroup
+from level import load_level
+from navigation import NavGrid, FlowField
+from scheduler import Scheduler, per_tick_rate
+from triggers import TriggerSystem
+from visibility import WallIndex
+
+
+# The game rules, without Ursina: everything that decides how a run plays
+# out, sanity, stamina, fear, the ghost, light malfunctions, escaping and
+# dying. It steps with an explicit dt and takes player input as data, so the
+# same rules run in the game window, in a headless soak test or in a balance
+# tuner. Scream.py only reads this state to draw the scene and play effects.
+# SimulationBatch (batch.py) runs the same rules for many games at once.
+#
+# The house is treated top-down: positions are (x, z) and every distance is
+# measured on the floor plane.
+
+# Player input for one step. forward/strafe are -1..1 (W/S and D/A), mouse
+# deltas use the same units as ursina's mouse.velocity.
+PlayerInput = namedtuple('PlayerInput', 'forward strafe sprint mouse_dx mouse_dy')
+NO_INPUT = PlayerInput(0, 0, False, 0, 0)
+
+# Trigger volume actor id of the player
+PLAYER = 'player'
+
+# From this many ghosts up the NumPy swarm is faster than stepping them one
+# by one; below it NumPy's per call overhead costs more (python swarm.py:
+# medians of 7-9 runs put the swarm at 0.9-1.2x the group at 60 ghosts,
+# 1.0-1.2x at 70 and 1.2-1.3x at 80)
+SWARM_MIN_GHOSTS = 70
+
+
+class PlayerState:
+    __slots__ = ('x', 'z', 'yaw', 'pitch', 'speed')
+
+    def __init__(self, x, z):
+        self.x = x
+        self.z = z
+        self.yaw = 0
+        self.pitch = 0
+        self.speed = Simulation.normal_speed
+
+
+class GhostState:
+    __slots__ = ('x', 'z', 'speed', 'chase_speed', 'is_chasing', 'current_patrol', 'detection_range',
+                 'kill_range', 'teleport_timer', 'teleport_interval', 'last_seen_player_pos', 'aggression')
+
+    def __init__(self, x, z, rng, rules):
+        """rules is the Simulation, for its (tunable) ghost settings"""
+        self.x = x
+        self.z = z
+        self.speed = rules.ghost_speed
+        self.chase_speed = rules.chase_speed
+        self.is_chasing = False
+        self.current_patrol = 0
+        self.detection_range = rules.detection_range
+        self.kill_range = rules.kill_range
+        self.teleport_timer = 0
+        self.teleport_interval = rng.uniform(8, 15)
+        self.last_seen_player_pos = None
+        self.aggression = 0  # Increases over time
+
+
+class LightState:
+    __slots__ = ('is_on', 'back_at')
+
+    def __init__(self):
+        self.is_on = True
+        self.back_at = 0  # Out until this time
+
+
+class Simulation:
+    # Sprint functionality
+    sprint_speed = 8
+    normal_speed = 5
+    stamina_regen = 15
+    stamina_drain = 25
+
+    # The ghost, and how fast it gets faster (chase speed per second)
+    ghost_speed = 2.0
+    chase_speed = 4.5
+    detection_range = 15
+    kill_range = 1.5
+    aggression_rate = 0.01
+    search_radius = 1  # Gives up the search this close to where it last saw the player
+
+    # Sanity lost per second: ambient times 1 + fear, and sight per unit
+    # the ghost is inside detection range while it can see the player
+    ambient_sanity_drain = 0.1
+    sight_sanity_drain = 0.5
+
+    mouse_sensitivity = 50
+    player_radius = 0.4
+    exit_range = 3
+    bounds_margin = 1  # Keep player this far inside the outer walls
+
+    # Random events per second (see scheduler.py), the same on average as
+    # the chances per 60 Hz tick they were tuned as
+    malfunction_rate = per_tick_rate(0.02, 60)    # Per light, up to 1.5x with fear
+    hallucination_rate = per_tick_rate(0.01, 60)  # Below 30 sanity
+    light_burst_rate = per_tick_rate(0.001, 60)
+
+    def __init__(self, seed=None, nav_cell_size=1.0, level=None, ghosts=1):
+        self.reseed(seed)
+        self.ghost_count = ghosts
+        self.level = level = level or load_level()
+        walls = level.wall_rects()
+        bounds = level.floor_bounds()
+        self.min_x = bounds[0] + self.bounds_margin
+        self.max_x = bounds[1] - self.bounds_margin
+        self.min_z = bounds[2] + self.bounds_margin
+        self.max_z = bounds[3] - self.bounds_margin
+
+        # Navigation and visibility, built once from the level data
+        self.nav_grid = NavGrid(walls, bounds, cell_size=nav_cell_size)
+        self.wall_index = WallIndex(walls, bounds)
+        self.solid_index = WallIndex(level.solid_rects(), bounds)
+        self.player_flow = FlowField(self.nav_grid)
+        self.patrol_points = [(p[0], p[2]) for p in level.patrol_points]
+        self.patrol_flows = []
+        for x, z in self.patrol_points:
+            flow = FlowField(self.nav_grid)
+            flow.update(x, z)
+            self.patrol_flows.append(flow)
+
+        self.exit_x = level.exit_door[0]
+        self.exit_z = level.exit_door[2]
+
+        # Trigger volumes (see triggers.py), updated with the player once a
+        # tick. Nothing reacts to the ghosts, so they aren't queried.
+        self.triggers = TriggerSystem()
+        self.triggers.sphere(self.exit_x, self.exit_z, self.exit_range, 'exit', on_enter=self.reach_exit)
+        for room in level.rooms:
+            self.triggers.box(*room.rect, room.name, on_enter=self.enter_room)
+
+        # More than one ghost runs as a group, the vectorized swarm from
+        # SWARM_MIN_GHOSTS up (needs NumPy)
+        self.swarm = None
+        if ghosts >= SWARM_MIN_GHOSTS:
+            from swarm import GhostSwarm
+            self.swarm = GhostSwarm(self, ghosts)
+        elif ghosts > 1:
+            self.swarm = GhostGroup(self, ghosts)
+        self.reset()
+
+    def reseed(self, seed=None):
+        """New random streams for seed (a random seed for None); reset() after"""
+        # One random stream per subsystem, all derived from the seed, so a
+        # new roll in one subsystem doesn't reshuffle the others
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.ghost_rng = self.stream('ghost')
+        self.light_rng = self.stream('lights')
+        self.event_rng = self.stream('events')
+
+    def stream(self, name):
+        """A random.Random seeded from the run seed and a subsystem name"""
+        return random.Random(f'{self.seed}:{name}')
+
+    def reset(self):
+        """Back to the state of a fresh game"""
+        self.time = 0
+        self.game_over = False
+        self.game_won = False
+        self.sanity = 100  # Player's sanity level - decreases when ghost is near
+        self.stamina = 100
+        self.ghost_seen_timer = 0
+        self.ambient_fear = 0
+        self.heartbeat_intensity = 0
+        self.player_room = None
+        self.triggers.forget()
+        level = self.level
+        self.player = PlayerState(level.player_start[0], level.player_start[2])
+        self.ghost = GhostState(level.ghost_start[0], level.ghost_start[2], self.ghost_rng, self)
+        if self.swarm is not None:
+            self.swarm.reset()
+        # The light stream carries on into the next game: roll what the
+        # last one had due, as if its events had fired on time
+        if getattr(self, 'malfunctions', None) is not None:
+            self.malfunctions.catch_up(self.scheduler.now)
+        self.light_states = [LightState() for pos in level.light_positions]
+        self.events = []
+
+        # Random events wait in the scheduler instead of rolling every tick.
+        # One process covers every light at the combined rate. Only the
+        # renderer looks at the lights, so their malfunctions are rolled
+        # when it does (see lights).
+        self.scheduler = Scheduler()
+        self.fear_level = 0
+        self.hallucinating = False
+        self.malfunctions = self.scheduler.pulled_process(self.malfunction_rate * len(self.light_states),
+                                                         self.malfunction, self.light_rng)
+        self.hallucinations = self.scheduler.process(0, self.hallucinate, self.event_rng)
+        self.light_bursts = self.scheduler.process(self.light_burst_rate, self.light_burst, self.event_rng)
+
+    def step(self, dt, controls=NO_INPUT):
+        """Advance the game by dt seconds. Returns the events raised during
+        the step: 'death', 'win', 'hallucination', 'light_burst', 'teleport',
+        'room' (the player walked into player_room)"""
+        self.events = []
+        if self.game_over or self.game_won:
+            return self.events
+        self.time += dt
+        self.step_player(dt, controls)
+        self.step_rules(dt)
+        if self.game_over or self.game_won:
+            return self.events
+        self.step_events()
+        self.step_ghost(dt)
+        return self.events
+
+    def step_player(self, dt, controls):
+        player = self.player
+        if controls.mouse_dx or controls.mouse_dy:
+            player.yaw += controls.mouse_dx * self.mouse_sensitivity
+            player.pitch = max(-90, min(90, player.pitch - controls.mouse_dy * self.mouse_sensitivity))
+
+        # Sprint mechanics
+        if controls.sprint and self.stamina > 0:
+            player.speed = self.sprint_speed
+            self.stamina = max(0, self.stamina - self.stamina_drain * dt)
+        else:
+            player.speed = self.normal_speed
+            self.stamina = min(100, self.stamina + self.stamina_regen * dt)
+
+        if not controls.forward and not controls.strafe:
+            return
+        yaw = math.radians(player.yaw)
+        sin_yaw = math.sin(yaw)
+        cos_yaw = math.cos(yaw)
+        # Same axes as ursina's forward/right for rotation_y
+        dx = sin_yaw * controls.forward + cos_yaw * controls.strafe
+        dz = cos_yaw * controls.forward - sin_yaw * controls.strafe
+        length = math.sqrt(dx * dx + dz * dz)
+        if length == 0:
+            return
+        step = player.speed * dt / length
+        new_x = player.x + dx * step
+        new_z = player.z + dz * step
+        overlaps = self.solid_index.overlaps
+        if not overlaps(new_x, new_z, self.player_radius):
+            player.x = new_x
+            player.z = new_z
+            return
+        # Blocked - try one axis at a time so the player slides along walls
+        if not overlaps(new_x, player.z, self.player_radius):
+            player.x = new_x
+        elif not overlaps(player.x, new_z, self.player_radius):
+            player.z = new_z
+
+    def step_rules(self, dt):
+        player = self.player
+
+        if self.sanity <= 0:
+            self.die()
+            return
+
+        # Check for exit, and which room we're in
+        self.triggers.update(PLAYER, player.x, player.z)
+        if self.game_won:
+            return
+
+        # Ambient sanity drain (psychological pressure)
+        self.sanity = max(0, self.sanity - self.ambient_sanity_drain * dt * (1 + self.ambient_fear))
+
+        # Keep player in bounds
+        if not self.min_x <= player.x <= self.max_x:
+            player.x = max(self.min_x, min(self.max_x, player.x))
+        if not self.min_z <= player.z <= self.max_z:
+            player.z = max(self.min_z, min(self.max_z, player.z))
+
+    def step_events(self):
+        """Fire the random events due by now, then set the rates from here on"""
+        self.scheduler.run_until(self.time)
+        # Fear in steps of 0.1, so a chase changes the rate ten times rather than every tick
+        fear_level = round(self.ambient_fear * 10)
+        if fear_level != self.fear_level:
+            self.fear_level = fear_level
+            self.malfunctions.set_rate(self.malfunction_rate * (1 + fear_level / 20) * len(self.light_states))
+        # Sanity effects - hallucination flashes at low sanity
+        hallucinating = self.sanity < 30
+        if hallucinating != self.hallucinating:
+            self.hallucinating = hallucinating
+            self.hallucinations.set_rate(self.hallucination_rate if hallucinating else 0)
+
+    @property
+    def lights(self):
+        """The LightStates as of the last step"""
+        now = self.scheduler.now
+        self.malfunctions.catch_up(now)
+        for light in self.light_states:
+            light.is_on = light.back_at <= now
+        return self.light_states
+
+    def malfunction(self, time):
+        """Random malfunction - a light goes out temporarily"""
+        rng = self.light_rng
+        # Picking a light that's already out is a malfunction that can't
+        # happen, which keeps each lit light at malfunction_rate
+        light = rng.choice(self.light_states)
+        if light.back_at <= time:
+            light.back_at = time + rng.uniform(0.1, 2.0)
+
+    def light_burst(self):
+        """Random creepy event - every light goes out at once"""
+        now = self.scheduler.now
+        self.malfunctions.catch_up(now)
+        for light in self.light_states:
+            light.back_at = now + self.event_rng.uniform(0.5, 2)
+        self.events.append('light_burst')
+
+    def hallucinate(self):
+        self.events.append('hallucination')
+
+    def reach_exit(self, volume, actor):
+        self.game_won = True
+        self.events.append('win')
+
+    def enter_room(self, volume, actor):
+        self.player_room = volume.name
+        self.events.append('room')
+
+    def step_ghost(self, dt):
+        if self.swarm is not None:
+            self.swarm.step(dt)
+            return
+        ghost = self.ghost
+        player = self.player
+        player_distance = math.hypot(player.x - ghost.x, player.z - ghost.z)
+
+        # Increase aggression over time
+        ghost.aggression += dt * self.aggression_rate
+
+        # Detection logic - in range and no wall in between
+        if player_distance < ghost.detection_range and self.wall_index.line_of_sight(ghost.x, ghost.z, player.x, player.z):
+            ghost.is_chasing = True
+            ghost.last_seen_player_pos = (player.x, player.z)
+            self.ghost_seen_timer += dt
+
+            # Decrease sanity when ghost is visible and close
+            sanity_drain = (ghost.detection_range - player_distance) * self.sight_sanity_drain * dt
+            self.sanity = max(0, self.sanity - sanity_drain)
+
+            # Increase ambient fear
+            self.ambient_fear = min(1, self.ambient_fear + dt * 0.1)
+            self.heartbeat_intensity = min(1, (ghost.detection_range - player_distance) / ghost.detection_range)
+        else:
+            ghost.is_chasing = False
+            self.ghost_seen_timer = max(0, self.ghost_seen_timer - dt * 0.5)
+            self.ambient_fear = max(0, self.ambient_fear - dt * 0.05)
+            self.heartbeat_intensity = max(0, self.heartbeat_intensity - dt * 0.3)
+
+        # Movement through the flow fields. Chasing needs line of sight, so the
+        # straight line to the player is clear and needs no field. Once sight
+        # breaks the ghost follows player_flow to where it last saw the
+        # player, and goes back to its patrol if nobody is there.
+        if ghost.is_chasing:
+            self.move_ghost(None, player.x, player.z, (ghost.chase_speed + ghost.aggression) * dt)
+        elif ghost.last_seen_player_pos is not None:
+            target_x, target_z = ghost.last_seen_player_pos
+            self.player_flow.update(target_x, target_z)
+            self.move_ghost(self.player_flow, target_x, target_z, (ghost.chase_speed + ghost.aggression) * dt)
+            if math.hypot(ghost.x - target_x, ghost.z - target_z) < self.search_radius:
+                ghost.last_seen_player_pos = None
+        else:
+            target_x, target_z = self.patrol_points[ghost.current_patrol]
+            self.move_ghost(self.patrol_flows[ghost.current_patrol], target_x, target_z, ghost.speed * dt)
+            if math.hypot(ghost.x - target_x, ghost.z - target_z) < 2:
+                ghost.current_patrol = (ghost.current_patrol + 1) % len(self.patrol_points)
+
+        # Random teleportation (psychological horror element)
+        ghost.teleport_timer += dt
+        if ghost.teleport_timer > ghost.teleport_interval:
+            self.teleport_ghost()
+
+        # Kill player if too close
+        if player_distance < ghost.kill_range:
+            self.die()
+
+    def teleport_ghost(self):
+        ghost = self.ghost
+        player = self.player
+        rng = self.ghost_rng
+        ghost.teleport_timer = 0
+        ghost.teleport_interval = rng.uniform(5, 12) - ghost.aggression
+        # Teleport to a random location, sometimes closer to player
+        if rng.random() < 0.3 + ghost.aggression * 0.1:
+            # Teleport near player (scary!)
+            angle = rng.uniform(0, 360)
+            dist = rng.uniform(8, 15)
+            new_x = player.x + math.cos(math.radians(angle)) * dist
+            new_z = player.z + math.sin(math.radians(angle)) * dist
+            new_x = max(self.min_x + 1, min(self.max_x - 1, new_x))
+            new_z = max(self.min_z + 1, min(self.max_z - 1, new_z))
+            ghost.x, ghost.z = self.nav_grid.nearest_free(new_x, new_z)
+        else:
+            # Random teleport
+            ghost.x, ghost.z = rng.choice(self.patrol_points)
+        self.events.append('teleport')
+
+    def move_ghost(self, flow, target_x, target_z, distance):
+        """Follow the flow field, or head straight at the target without one"""
+        ghost = self.ghost
+        step = flow.direction(ghost.x, ghost.z) if flow is not None else None
+        if step is None:
+            dx = target_x - ghost.x
+            dz = target_z - ghost.z
+            length = math.sqrt(dx * dx + dz * dz)
+            if length == 0:
+                return
+            step = (dx / length, dz / length)
+        ghost.x += step[0] * distance
+        ghost.z += step[1] * distance
+
+    def die(self):
+        if self.game_over:
+            return
+        self.game_over = True
+        self.events.append('death')
+
+
+class FixedTimestep:
+    """Accumulates frame time and hands out whole simulation ticks. After
+    a hitch at most max_steps ticks run, the rest of the backlog is dropped
+    so the game slows down for a moment instead of spiralling."""
+    def __init__(self, tick_rate=60, max_steps=5):
+        self.dt = 1 / tick_rate
+        self.max_steps = max_steps
+        self.accumulator = 0
+        self.dropped_time = 0
+
+    def advance(self, frame_dt):
+        """Add a frame's time and return how many ticks to run now"""
+        self.accumulator += frame_dt
+        steps = int(self.accumulator / self.dt)
+        self.accumulator -= steps * self.dt
+        if steps > self.max_steps:
+            self.dropped_time += (steps - self.max_steps) * self.dt
+            steps = self.max_steps
+        return steps
+
+    @property
+    def alpha(self):
+        """How far the render frame is between the last tick and the next (0-1)"""
+        return min(1, self.accumulator / self.dt)
+
+
+# python simulation.py - step() cost at different tick rates, events per
+# minute should come out the same at every one (python batch.py for soak speed)
+if __name__ == '__main__':
+    def soak(dt, sim_seconds, seed=1):
+        """Run back to back games with a wandering bot, restarting on death or escape"""
+        sim = Simulation(seed=seed)
+        bot = random.Random(seed)
+        controls = NO_INPUT
+        games = 0
+        events = 0
+        steps = int(sim_seconds / dt)
+        start = time.perf_counter()
+        for i in range(steps):
+            if i % 30 == 0:
+                controls = PlayerInput(1, bot.choice((-1, 0, 1)), bot.random() < 0.3, bot.uniform(-0.5, 0.5), 0)
+            sim.step(dt, controls)
+            if sim.game_over or sim.game_won:
+                games += 1
+                events += sim.scheduler.stats['fired'] + sim.malfunctions.fired
+                sim.reset()
+        sim.malfunctions.catch_up(sim.time)
+        events += sim.scheduler.stats['fired'] + sim.malfunctions.fired
+        elapsed = time.perf_counter() - start
+        return elapsed / steps * 1e6, games, events / sim_seconds * 60
+
+    # Scheduled events (malfunctions, lights coming back, bursts,
+    # hallucinations) should happen as often whatever the step length
+    print(f'{"dt":>8} {"us / step":>10} {"games":>6} {"events/min":>11}')
+    for dt in (1 / 60, 1 / 30, 1 / 10, 1 / 4):
+        step_us, games, events = soak(dt, 3600)
+        print(f'{dt:>8.4f} {step_us:>10.2f} {games:>6} {events:>11.0f}')
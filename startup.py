@@ -0,0 +1,109 @@
+from collections import deque
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Startup: phase timings and work deferred until after the first frame.
+# Scream.py builds the whole game at import, so time to first frame grows
+# with everything that's added. StartupLog times each phase of that (the
+# imports, the window, the level, the house...) so a slow one shows up in
+# the STARTUP lines and in benchmark.json. DeferredWork holds what the first
+# frame can do without, like the entities behind the batched house meshes
+# and UI that isn't on screen yet, and runs it a few milliseconds per frame
+# afterwards. A job is a function, or a generator that yields between
+# steps so a big job is spread over frames too.
+
+class StartupLog:
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.phases = {}  # Name -> ms, in the order they ran
+
+    def phase(self, name):
+        """Close the phase that ran since the last call, under name"""
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0) + (now - self.last) * 1000
+        self.last = now
+
+    def report(self):
+        return ' | '.join(f'{name} {ms:.0f} ms' for name, ms in self.phases.items())
+
+
+class DeferredWork:
+    def __init__(self):
+        self.jobs = deque()
+        self.stats = {'jobs': 0, 'steps': 0, 'ms': 0, 'frames': 0, 'slowest_ms': 0}
+
+    def defer(self, job):
+        """Run job (a function or a generator) once the first frame is out"""
+        self.jobs.append(job)
+        self.stats['jobs'] += 1
+
+    @property
+    def done(self):
+        return not self.jobs
+
+    def run(self, budget_ms):
+        """Work through the jobs for up to budget_ms; True once all are done"""
+        if not self.jobs:
+            return True
+        start = time.perf_counter()
+        end = start + budget_ms / 1000
+        jobs = self.jobs
+        steps = 0
+        while jobs:
+            job = jobs[0]
+            steps += 1
+            if callable(job):
+                jobs.popleft()
+                job()
+            else:
+                try:
+                    next(job)
+                except StopIteration:
+                    jobs.popleft()
+            if time.perf_counter() >= end:
+                break
+        elapsed = (time.perf_counter() - start) * 1000
+        stats = self.stats
+        stats['steps'] += steps
+        stats['ms'] += elapsed
+        stats['frames'] += 1
+        stats['slowest_ms'] = max(stats['slowest_ms'], elapsed)
+        return not jobs
+
+
+# python startup.py [RUNS] [-- GAME FLAGS] - launch the game a few times, cold
+# scene cache then warm.
+# Each run starts Scream.py --startup-report, which quits once everything is
+# built and writes its phase timings to JSON. The first run starts without
+# a scene cache.
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    flags = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1] != '--' else 5
+    out_path = os.path.join(here, 'startup_report.json')
+    shutil.rmtree(os.path.join(here, '.cache', 'scenes'), ignore_errors=True)
+
+    results = []
+    for run in range(runs):
+        subprocess.run([sys.executable, os.path.join(here, 'Scream.py'), '--startup-report', out_path] + flags,
+                       cwd=here, check=True, stdout=subprocess.DEVNULL)
+        with open(out_path) as f:
+            results.append(json.load(f))
+    os.remove(out_path)
+
+    phases = list(results[-1]['phases'])
+    warm = results[1:] or results
+    print(f'{"phase":<14} {"cold ms":>8} {"warm ms":>8}')
+    for name in phases:
+        cold = results[0]['phases'].get(name, 0)
+        print(f'{name:<14} {cold:>8.0f} {statistics.median(r["phases"].get(name, 0) for r in warm):>8.0f}')
+    print('since launch')
+    for key, label in (('first_frame', 'first frame'), ('interactive', 'interactive'), ('deferred_done', 'all built')):
+        print(f'{label:<14} {results[0][key] * 1000:>8.0f} {statistics.median(r[key] for r in warm) * 1000:>8.0f}')
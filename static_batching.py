@@ -0,0 +1,135 @@
+from ursina import *
+from panda3d.core import Filename
+import os
+
+
+# Static geometry batching: walls, furniture and other props that never
+# move are copied into one node per material group and flattened, so Panda3D
+# can merge everything that shares a texture into a handful of big meshes. The original entities stay
+# in the scene (hidden) so their colliders keep working.
+#
+# The merged meshes can be saved as a .bam (Panda's native scene format) and
+# loaded back in one go next time, before the entities behind them exist.
+# Each group keeps a few string tags (its rooms, its lamp) that come back
+# with it. A .bam doesn't keep shaders made in code, and textures with no
+# file come back as copies, so load() swaps in the live ones by name and
+# the caller puts the shaders back.
+
+class StaticBatcher:
+    def __init__(self, name='static_batches'):
+        self.name = name
+        self.groups = {}
+        self.nodes = {}
+        self.tags = {}   # Group -> {name: string}, saved with the meshes
+        self.root = None
+        self.batched = False
+
+    def add(self, group, entities, **tags):
+        """Register non-moving entities under a material group"""
+        self.groups.setdefault(group, []).extend(entities)
+        if tags:
+            self.tags.setdefault(group, {}).update(tags)
+        if self.root is not None:
+            # Added after the meshes were built or loaded, they're already in there
+            for e in entities:
+                e.visible = not self.batched
+
+    def build(self):
+        """Copy every registered model into its group node and flatten it"""
+        self.root = scene.attach_new_node(self.name)
+        for group, entities in self.groups.items():
+            group_node = self.root.attach_new_node(group)
+            self.nodes[group] = group_node
+            for name, value in self.tags.get(group, {}).items():
+                group_node.set_tag(name, value)
+            for e in entities:
+                if not e.model:
+                    continue
+                copy = e.model.copy_to(group_node)
+                # Entity holds shader/light state, its model holds texture and color
+                copy.set_state(e.get_state().compose(e.model.get_state()))
+                copy.set_transform(scene, e.model.get_transform(scene))
+            # Bakes transforms, color scales and texture scales into the
+            # vertices, then merges geoms with identical render state
+            group_node.flatten_strong()
+        self.set_batched(True)
+
+    def save(self, path):
+        """Write the merged meshes to a .bam; False if it couldn't be written"""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        except OSError:
+            return False  # Read-only install, build them again next time
+        return self.root.write_bam_file(Filename.from_os_specific(path))
+
+    def load(self, path, textures=()):
+        """Load merged meshes saved by save() instead of building them.
+        textures are the live Panda textures to use in place of the saved
+        copies of the same name. False if there's no usable file."""
+        if not os.path.exists(path):
+            return False
+        root = application.base.loader.load_model(Filename.from_os_specific(path), noCache=True, okMissing=True)
+        if root is None:
+            return False
+        root.reparent_to(scene)
+        root.set_name(self.name)
+        self.root = root
+        for group_node in root.get_children():
+            group = group_node.get_name()
+            self.nodes[group] = group_node
+            tags = {name: group_node.get_tag(name) for name in group_node.node().get_tag_keys()}
+            if tags:
+                self.tags[group] = tags
+        live = {texture.get_name(): texture for texture in textures}
+        for texture in root.find_all_textures():
+            if texture.get_name() in live and live[texture.get_name()] is not texture:
+                root.replace_texture(texture, live[texture.get_name()])
+        self.batched = True
+        return True
+
+    def set_batched(self, value):
+        """Switch between the merged meshes and the original entities"""
+        self.batched = value
+        if self.root is None:
+            return
+        if value:
+            self.root.show()
+        else:
+            self.root.hide()
+        for entities in self.groups.values():
+            for e in entities:
+                e.visible = not value
+
+    def toggle(self):
+        self.set_batched(not self.batched)
+
+    def destroy(self):
+        """Remove the merged meshes and forget the entities (they aren't destroyed)"""
+        if self.root is not None:
+            self.root.remove_node()
+            self.root = None
+        self.groups = {}
+        self.nodes = {}
+        self.tags = {}
+
+
+def count_draw_calls(root=scene, in_view=False):
+    """Count geoms (one draw call each) and vertices under visible nodes.
+    With in_view, only nodes whose bounds touch the camera frustum count."""
+    draw_calls = 0
+    vertices = 0
+    cam = application.base.cam
+    frustum = cam.node().get_lens().make_bounds() if in_view else None
+    for node_path in root.find_all_matches('**/+GeomNode'):
+        if node_path.is_hidden():
+            continue
+        geom_node = node_path.node()
+        if frustum is not None:
+            bounds = geom_node.get_bounds().make_copy()
+            bounds.xform(node_path.get_mat(cam))
+            if not frustum.contains(bounds):
+                continue
+        draw_calls += geom_node.get_num_geoms()
+        for i in range(geom_node.get_num_geoms()):
+            vertices += geom_node.get_geom(i).get_vertex_data().get_num_rows()
+    return draw_calls, vertices
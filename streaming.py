@@ -0,0 +1,166 @@
+from ursina import *
+from static_batching import StaticBatcher
+import math
+import os
+import sys
+import time as clock
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Room streaming: only the chunks around the player exist as entities.
+# The level is cut into square chunks and every wall, prop and light goes in
+# the chunk its center falls in (walls longer than a chunk, like the outer
+# walls, stay resident). Chunks within load_radius of the player are built a
+# few entities at a time, at most budget_ms per frame, then flattened with
+# their own StaticBatcher. Chunks past unload_radius are destroyed; the gap
+# between the two radii stops a chunk from flickering in and out when the
+# player walks along its edge. Collisions come from the level data in the
+# simulation, so nothing depends on the entities being there.
+
+class ChunkStreamer:
+    def __init__(self, level, make_wall, make_prop, make_light, remove_light, chunk_size=30,
+                 load_radius=45, unload_radius=60, budget_ms=2, batched=True):
+        self.make_wall = make_wall
+        self.make_prop = make_prop
+        self.make_light = make_light
+        self.remove_light = remove_light
+        self.chunk_size = chunk_size
+        self.load_radius = load_radius
+        self.unload_radius = max(unload_radius, load_radius)
+        self.budget_ms = budget_ms
+        self.batched = batched
+
+        # Chunk key -> list of (kind, item, batch group)
+        self.chunks = {}
+        always = []
+        for wall in level.walls:
+            if max(wall.scale[0], wall.scale[2]) > chunk_size:
+                always.append(('wall', wall, 'wall_texture'))
+            else:
+                self.chunk_items(wall.position).append(('wall', wall, 'wall_texture'))
+        for prop in level.props:
+            self.chunk_items(prop.position).append(('prop', prop, prop.batch or 'white_cube'))
+        for i, position in enumerate(level.light_positions):
+            self.chunk_items(position).append(('light', i, None))
+
+        self.resident = {}   # Chunk key -> (entities, lights, batcher)
+        self.building = None  # (key, generator) of the chunk being built
+        self.stats = {'chunks': 0, 'entities': 0, 'lights': 0, 'loads': 0, 'unloads': 0, 'peak_mb': 0}
+        self.resident[None] = self.build_now(always, 'streamed_always')
+
+    def chunk_key(self, position):
+        return (math.floor(position[0] / self.chunk_size), math.floor(position[2] / self.chunk_size))
+
+    def chunk_items(self, position):
+        return self.chunks.setdefault(self.chunk_key(position), [])
+
+    def chunk_distance(self, key, x, z):
+        """Distance from a point to the nearest edge of a chunk (0 inside it)"""
+        min_x = key[0] * self.chunk_size
+        min_z = key[1] * self.chunk_size
+        dx = max(min_x - x, 0, x - min_x - self.chunk_size)
+        dz = max(min_z - z, 0, z - min_z - self.chunk_size)
+        return math.hypot(dx, dz)
+
+    def build(self, items, name):
+        """Create a chunk's entities one by one; yields after each, returns the chunk"""
+        entities = []
+        lights = []
+        batcher = StaticBatcher(name)
+        for kind, item, group in items:
+            if kind == 'light':
+                lights.append(self.make_light(item))
+            else:
+                entity = self.make_wall(item) if kind == 'wall' else self.make_prop(item)
+                entities.append(entity)
+                batcher.add(group, [entity])
+            yield
+        if self.batched:
+            batcher.build()
+        return entities, lights, batcher
+
+    def build_now(self, items, name):
+        generator = self.build(items, name)
+        while True:
+            try:
+                next(generator)
+            except StopIteration as done:
+                self.stats['loads'] += 1
+                return done.value
+
+    def update(self, x, z, budget_ms=None):
+        """Load and unload chunks around (x, z), spending at most budget_ms building"""
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+
+        # One unload per frame is plenty, destroying is cheap next to building
+        for key in self.resident:
+            if key is not None and self.chunk_distance(key, x, z) > self.unload_radius:
+                self.unload(key)
+                break
+
+        deadline = clock.perf_counter() + budget_ms / 1000
+        while clock.perf_counter() < deadline:
+            if self.building is None:
+                wanted = [key for key in self.chunks
+                          if key not in self.resident and self.chunk_distance(key, x, z) <= self.load_radius]
+                if not wanted:
+                    break
+                key = min(wanted, key=lambda key: self.chunk_distance(key, x, z))
+                self.building = (key, self.build(self.chunks[key], f'chunk_{key[0]}_{key[1]}'))
+            key, generator = self.building
+            try:
+                next(generator)
+            except StopIteration as done:
+                self.resident[key] = done.value
+                self.building = None
+                self.stats['loads'] += 1
+        self.update_stats()
+
+    def unload(self, key):
+        entities, lights, batcher = self.resident.pop(key)
+        batcher.destroy()
+        for entity in entities:
+            destroy(entity)
+        for light in lights:
+            self.remove_light(light)
+        self.stats['unloads'] += 1
+
+    def set_batched(self, value):
+        self.batched = value
+        for key, (entities, lights, batcher) in self.resident.items():
+            if value and batcher.root is None:
+                batcher.build()
+            batcher.set_batched(value)
+
+    def toggle(self):
+        self.set_batched(not self.batched)
+
+    def update_stats(self):
+        self.stats['chunks'] = len(self.resident) - 1
+        self.stats['entities'] = sum(len(entities) for entities, lights, batcher in self.resident.values())
+        self.stats['lights'] = sum(len(lights) for entities, lights, batcher in self.resident.values())
+        self.stats['peak_mb'] = peak_memory_mb() or 0
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process in MB, or None where it can't be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def memory_mb():
+    """Current resident memory of this process in MB, falling back to the peak
+    where the current figure can't be read"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return peak_memory_mb()
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
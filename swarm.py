@@ -0,0 +1,299 @@
+import math
+import sys
+import time
+
+import numpy as np
+
+from navigation import NEIGHBOURS
+from ghosts import GhostGroup
+
+
+# Many ghosts as NumPy arrays (nightmare mode). Same rules as
+# Simulation.step_ghost, for every ghost at once: positions, patrol targets,
+# chase flags, aggression and teleport timers are arrays, and distances,
+# chasing, patrol steering and kill checks are whole-array operations, line
+# of sight included: every ghost in detection range is slab tested against
+# the walls near the player in one go. Only teleports stay scalar (drawn
+# from the ghost random stream in ghost order, so runs stay deterministic).
+#
+# Ghost 0 is mirrored into sim.ghost after every step, so everything that
+# reads the single ghost (HUD, interpolation, replays) keeps working.
+# Reset, teleports and the mirror are GhostGroup's (ghosts.py), the plain
+# Python version Simulation uses below SWARM_MIN_GHOSTS: with a handful of
+# ghosts NumPy's per call overhead costs more than the loops it replaces.
+# Patrol steering looks up each patrol flow field's downhill neighbour for
+# every cell, computed once up front instead of lazily per cell; searching
+# does the same with player_flow, one table per sighting cell.
+
+MAX_SEARCH_TABLES = 64
+
+class GhostSwarm(GhostGroup):
+    def __init__(self, sim, count):
+        self.sim = sim
+        self.count = count
+        grid = sim.nav_grid
+        self.grid = grid
+        centers = [grid.cell_center(i) for i in range(grid.cols * grid.rows)]
+        self.center_x = np.array([c[0] for c in centers])
+        self.center_z = np.array([c[1] for c in centers])
+        self.patrol_x = np.array([p[0] for p in sim.patrol_points])
+        self.patrol_z = np.array([p[1] for p in sim.patrol_points])
+        self.next_cells = np.stack([downhill_table(flow.distance, grid) for flow in sim.patrol_flows])
+        self.boxes = np.array(sim.wall_index.boxes).reshape(-1, 4)
+        self.search_tables = {}
+
+        self.x = np.zeros(count)
+        self.z = np.zeros(count)
+        # Positions before the latest step, for interpolation
+        self.prev_x = np.zeros(count)
+        self.prev_z = np.zeros(count)
+        self.patrol = np.zeros(count, dtype=np.int64)
+        self.chasing = np.zeros(count, dtype=bool)
+        self.searching = np.zeros(count, dtype=bool)
+        self.last_seen = None
+        self.aggression = np.zeros(count)
+        self.teleport_timer = np.zeros(count)
+        self.teleport_interval = np.zeros(count)
+        self.teleported = np.zeros(count, dtype=bool)
+        self.nearest_distance = math.inf
+
+    def step(self, dt):
+        sim = self.sim
+        player = sim.player
+        px, pz = player.x, player.z
+        x, z = self.x, self.z
+        self.prev_x[:] = x
+        self.prev_z[:] = z
+        self.teleported[:] = False
+        distance = np.hypot(px - x, pz - z)
+        self.nearest_distance = float(distance.min())
+
+        # Increase aggression over time
+        self.aggression += dt * sim.aggression_rate
+
+        # Detection - only ghosts in range pay for a line of sight test, and
+        # only against walls within detection range of the player
+        detection_range = self.detection_range
+        chasing = self.chasing
+        chasing[:] = False
+        in_range = np.flatnonzero(distance < detection_range)
+        if len(in_range):
+            boxes = self.boxes
+            near = ((boxes[:, 2] >= px - detection_range) & (boxes[:, 0] <= px + detection_range) &
+                    (boxes[:, 3] >= pz - detection_range) & (boxes[:, 1] <= pz + detection_range))
+            chasing[in_range] = lines_of_sight(boxes[near], x[in_range], z[in_range], px, pz)
+        if chasing.any():
+            seen = distance[chasing]
+            self.last_seen = (px, pz)
+            sim.ghost_seen_timer += dt
+            sim.sanity = max(0, sim.sanity - float(((detection_range - seen) * sim.sight_sanity_drain * dt).sum()))
+            sim.ambient_fear = min(1, sim.ambient_fear + dt * 0.1)
+            sim.heartbeat_intensity = min(1, (detection_range - float(seen.min())) / detection_range)
+        else:
+            sim.ghost_seen_timer = max(0, sim.ghost_seen_timer - dt * 0.5)
+            sim.ambient_fear = max(0, sim.ambient_fear - dt * 0.05)
+            sim.heartbeat_intensity = max(0, sim.heartbeat_intensity - dt * 0.3)
+
+        # Chasers head straight for the player, searchers follow player_flow
+        # to the last sighting and patrollers their patrol point's flow field,
+        # or go straight at the target when the field has no step
+        searching = self.searching
+        searching |= chasing
+        patrolling = ~searching
+        lost = searching & ~chasing
+        cells = grid_cells(self.grid, x, z)
+        target_x = self.patrol_x[self.patrol]
+        target_z = self.patrol_z[self.patrol]
+        next_cell = self.next_cells[self.patrol, cells]
+        if lost.any():
+            search_x, search_z = self.last_seen
+            target_x = np.where(lost, search_x, target_x)
+            target_z = np.where(lost, search_z, target_z)
+            next_cell = np.where(lost, self.search_table(search_x, search_z)[cells], next_cell)
+        flow_x = self.center_x[next_cell] - x
+        flow_z = self.center_z[next_cell] - z
+        use_flow = ~chasing & (next_cell >= 0) & ((flow_x != 0) | (flow_z != 0))
+        aim_x = np.where(chasing, px, np.where(use_flow, self.center_x[next_cell], target_x))
+        aim_z = np.where(chasing, pz, np.where(use_flow, self.center_z[next_cell], target_z))
+        dx = aim_x - x
+        dz = aim_z - z
+        length = np.sqrt(dx * dx + dz * dz)
+        moving = length > 0
+        step = np.where(searching, self.chase_speed + self.aggression, self.speed) * dt
+        step = np.divide(step, length, out=np.zeros(self.count), where=moving)
+        x += dx * step
+        z += dz * step
+        target_distance = np.hypot(x - target_x, z - target_z)
+        arrived = patrolling & (target_distance < 2)
+        self.patrol[arrived] = (self.patrol[arrived] + 1) % len(self.patrol_x)
+        searching[lost & (target_distance < sim.search_radius)] = False
+
+        # Random teleportation
+        self.teleport_timer += dt
+        for i in np.flatnonzero(self.teleport_timer > self.teleport_interval).tolist():
+            self.teleport(i)
+
+        # Kill player if any ghost was too close
+        if (distance < self.kill_range).any():
+            sim.die()
+        self.mirror()
+
+    def search_table(self, x, z):
+        """downhill_table() of player_flow aimed at (x, z)"""
+        flow = self.sim.player_flow
+        flow.update(x, z)
+        table = self.search_tables.get(flow.target_cell)
+        if table is None:
+            if len(self.search_tables) >= MAX_SEARCH_TABLES:
+                self.search_tables.clear()
+            table = self.search_tables[flow.target_cell] = downhill_table(flow.distance, self.grid)
+        return table
+
+    def nearest(self, x, z, count, skip_first=True):
+        """Indices of the count ghosts closest to (x, z), nearest first"""
+        first = 1 if skip_first else 0
+        distance = np.hypot(self.x[first:] - x, self.z[first:] - z)
+        count = min(count, len(distance))
+        if count == 0:
+            return []
+        closest = np.argpartition(distance, count - 1)[:count]
+        return (closest[np.argsort(distance[closest])] + first).tolist()
+
+
+def grid_cells(grid, x, z):
+    """NavGrid.cell() for arrays of positions"""
+    col = np.minimum(np.maximum(((x - grid.min_x) / grid.cell_size).astype(np.int64), 0), grid.cols - 1)
+    row = np.minimum(np.maximum(((z - grid.min_z) / grid.cell_size).astype(np.int64), 0), grid.rows - 1)
+    return row * grid.cols + col
+
+
+def lines_of_sight(boxes, x0, z0, x1, z1):
+    """WallIndex.line_of_sight() from many (x0, z0) to one (x1, z1), brute force
+    against (min_x, min_z, max_x, max_z) boxes with the same slab test. Column
+    arrays (n, 1) for x1 and z1 give every viewer its own target."""
+    if not len(boxes):
+        return np.ones(len(x0), dtype=bool)
+    x0 = x0[:, None]
+    z0 = z0[:, None]
+    dx = x1 - x0
+    dz = z1 - z0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_dx = 1 / dx
+        inv_dz = 1 / dz
+        t0 = (boxes[:, 0] - x0) * inv_dx
+        t1 = (boxes[:, 2] - x0) * inv_dx
+        u0 = (boxes[:, 1] - z0) * inv_dz
+        u1 = (boxes[:, 3] - z0) * inv_dz
+    # A segment parallel to an axis is inside that slab everywhere or nowhere
+    along_z = dx == 0
+    along_x = dz == 0
+    inside_x = (boxes[:, 0] <= x0) & (x0 <= boxes[:, 2])
+    inside_z = (boxes[:, 1] <= z0) & (z0 <= boxes[:, 3])
+    enter = np.maximum(np.where(along_z, -np.inf, np.minimum(t0, t1)), np.where(along_x, -np.inf, np.minimum(u0, u1)))
+    leave = np.minimum(np.where(along_z, np.inf, np.maximum(t0, t1)), np.where(along_x, np.inf, np.maximum(u0, u1)))
+    hit = (enter <= leave) & (enter > 0) & (enter <= 1) & (~along_z | inside_x) & (~along_x | inside_z)
+    return ~hit.any(axis=1)
+
+
+def downhill_table(distance, grid):
+    """FlowField.downhill() for every cell at once: next cell or -1"""
+    cols, rows = grid.cols, grid.rows
+    distance = np.array(distance, dtype=np.int64).reshape(rows, cols)
+    padded = np.full((rows + 2, cols + 2), -1, dtype=np.int64)
+    padded[1:-1, 1:-1] = distance
+    row, col = np.indices((rows, cols))
+    best = distance.copy()
+    best_cell = np.full((rows, cols), -1, dtype=np.int64)
+    # Same neighbour order and tie breaking as the scalar version
+    for dc, dr in NEIGHBOURS:
+        neighbour = padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+        better = (neighbour >= 0) & (neighbour < best)
+        if dc and dr:
+            # No cutting corners past a wall
+            better &= (padded[1:1 + rows, 1 + dc:1 + dc + cols] >= 0) & (padded[1 + dr:1 + dr + rows, 1:1 + cols] >= 0)
+        best = np.where(better, neighbour, best)
+        best_cell = np.where(better, (row + dr) * cols + col + dc, best_cell)
+    best_cell[distance <= 0] = -1
+    return best_cell.ravel()
+
+
+# python swarm.py [REPEATS] - step_ghost per ghost, GhostGroup and the swarm,
+# 1 to 1000 ghosts, each the median of REPEATS runs. Every row is printed,
+# the swarm's losses included: the crossover where it starts to win is what
+# SWARM_MIN_GHOSTS is set from.
+if __name__ == '__main__':
+    from statistics import median
+
+    from simulation import Simulation, GhostState, PlayerInput, SWARM_MIN_GHOSTS
+
+    dt = 1 / 60
+    ticks = 600
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+
+    def group_sim(seed, count, group_type):
+        """Simulation running its ghosts as group_type, even for one ghost"""
+        sim = Simulation(seed=seed)
+        sim.swarm = group_type(sim, count)
+        sim.reseed(seed)
+        sim.reset()
+        return sim
+
+    def drift(a, b, controls):
+        """Play both with the same input, largest ghost 0 position difference"""
+        worst = 0
+        for i in range(3600):
+            a.step(dt, controls)
+            b.step(dt, controls)
+            worst = max(worst, abs(a.ghost.x - b.ghost.x), abs(a.ghost.z - b.ghost.z))
+            if a.game_over or a.game_won:
+                break
+        return i + 1, worst
+
+    # Same seed and input: the swarm must play out like the scalar ghost,
+    # and like the group with more ghosts
+    controls = PlayerInput(1, 0, False, 0.2, 0)
+    scalar = Simulation(seed=7)
+    single = group_sim(7, 1, GhostSwarm)
+    steps, worst = drift(scalar, single, controls)
+    print(f'1 ghost, scalar vs swarm: {steps} ticks, max position difference {worst:.2e}, '
+          f'sanity {scalar.sanity:.3f} / {single.sanity:.3f}')
+    total = 0
+    worst = 0
+    for seed in range(1, 11):
+        steps, difference = drift(group_sim(seed, 10, GhostGroup), group_sim(seed, 10, GhostSwarm), controls)
+        total += steps
+        worst = max(worst, difference)
+    print(f'10 ghosts, group vs swarm: 10 seeds, {total} ticks, max position difference {worst:.2e}')
+
+    def scalar_time(count):
+        """A GhostState per ghost, each stepped by step_ghost"""
+        sim = Simulation(seed=1)
+        ghosts = [sim.ghost] + [GhostState(*sim.nav_grid.nearest_free(*sim.patrol_points[i % len(sim.patrol_points)]), sim.ghost_rng, sim)
+                                for i in range(1, count)]
+        start = time.perf_counter()
+        for tick in range(ticks):
+            for ghost in ghosts:
+                sim.ghost = ghost
+                sim.step_ghost(dt)
+            sim.game_over = False
+        return (time.perf_counter() - start) / ticks * 1e6
+
+    def group_time(count, group_type):
+        sim = group_sim(1, count, group_type)
+        start = time.perf_counter()
+        for tick in range(ticks):
+            sim.step_ghost(dt)
+            sim.game_over = False
+        return (time.perf_counter() - start) / ticks * 1e6
+
+    print(f'{"ghosts":>7} {"step_ghost us":>14} {"group us":>9} {"swarm us":>9} {"swarm vs group":>15}  used')
+    for count in (1, 10, 20, 50, 60, 70, 80, 100, 200, 500, 1000):
+        # Runs of each kind take turns, so a slow spell on the machine hits all of them
+        timings = [[], [], []]
+        for repeat in range(repeats):
+            timings[0].append(scalar_time(count))
+            timings[1].append(group_time(count, GhostGroup))
+            timings[2].append(group_time(count, GhostSwarm))
+        scalar_us, group_us, swarm_us = (median(runs) for runs in timings)
+        used = 'step_ghost' if count == 1 else 'swarm' if count >= SWARM_MIN_GHOSTS else 'group'
+        print(f'{count:>7} {scalar_us:>14.1f} {group_us:>9.1f} {swarm_us:>9.1f} {group_us / swarm_us:>14.1f}x  {used}')
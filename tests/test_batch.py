@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from simulation import PlayerInput, Simulation
+
+batch = pytest.importorskip('batch')
+np = pytest.importorskip('numpy')
+
+DT = 1 / 60
+# Simulated seconds per wall second a soak has to reach at 60 Hz
+SOAK_TARGET = 10000
+
+
+def controls_for(bot, games):
+    """A wandering bot's input for each game, and the same as arrays"""
+    controls = [PlayerInput(1, bot.choice((-1, 0, 1)), bot.random() < 0.3, bot.uniform(-0.5, 0.5), bot.choice((0, 0.1)))
+                for game in range(games)]
+    return controls, PlayerInput(*(np.array(values) for values in zip(*controls)))
+
+
+def assert_same(sim, games, game):
+    assert games.time[game] == pytest.approx(sim.time, abs=1e-9)
+    assert (games.player_x[game], games.player_z[game]) == pytest.approx((sim.player.x, sim.player.z), abs=1e-9)
+    assert (games.ghost_x[game], games.ghost_z[game]) == pytest.approx((sim.ghost.x, sim.ghost.z), abs=1e-9)
+    assert games.sanity[game] == pytest.approx(sim.sanity, abs=1e-9)
+    assert games.stamina[game] == pytest.approx(sim.stamina, abs=1e-9)
+    assert games.ambient_fear[game] == pytest.approx(sim.ambient_fear, abs=1e-9)
+    assert games.ghost_chasing[game] == sim.ghost.is_chasing
+    assert games.ghost_searching[game] == (sim.ghost.last_seen_player_pos is not None)
+    assert games.patrol[game] == sim.ghost.current_patrol
+    assert games.game_over[game] == sim.game_over
+    assert games.game_won[game] == sim.game_won
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_batch_plays_like_simulation(seed):
+    count = 12
+    seeds = [seed * 100 + game for game in range(count)]
+    games = batch.SimulationBatch(seeds)
+    sims = [Simulation(seed=s) for s in seeds]
+    events = [[] for game in range(count)]
+    # Low sanity for hallucinations and deaths, and some start by the exit
+    for game, sim in enumerate(sims):
+        sim.sanity = games.sanity[game] = 31 + game % 5
+        if game % 3 == 0:
+            sim.player.x = games.player_x[game] = -26.0
+            sim.player.z = games.player_z[game] = -2.0
+    bot = random.Random(seed)
+    finished = []
+    for tick in range(1800):
+        if tick % 30 == 0:
+            controls, arrays = controls_for(bot, count)
+        games.step(DT, arrays)
+        for game, sim in enumerate(sims):
+            events[game] += sim.step(DT, controls[game])
+            assert_same(sim, games, game)
+            assert games.events[game] == events[game]
+            if sim.game_over or sim.game_won:
+                finished.append(events[game][-1])
+                new_seed = seeds[game] + 1000 * len(finished)
+                sim.reseed(new_seed)
+                sim.reset()
+                games.reseed(game, new_seed)
+                games.reset(game)
+                events[game] = []
+    assert 'death' in finished and 'win' in finished
+
+
+def test_ended_games_stay_as_they_are():
+    games = batch.SimulationBatch([1, 2])
+    games.sanity[0] = 0
+    games.step(DT, PlayerInput(1, 0, False, 0.1, 0))
+    assert games.game_over.tolist() == [True, False]
+    assert games.events[0] == ['death']
+    x, z, time = games.player_x[0], games.player_z[0], games.time[0]
+    for tick in range(60):
+        games.step(DT, PlayerInput(1, 0, False, 0.1, 0))
+    assert (games.player_x[0], games.player_z[0], games.time[0]) == (x, z, time)
+    assert games.events[0] == ['death']
+    assert games.time[1] == pytest.approx(61 * DT)
+
+
+def test_soak_meets_the_throughput_target():
+    # Best of a few, the machine running the tests may be busy
+    speed = max(batch.soak(2048 * 5, 2048)['speed'] for run in range(3))
+    assert speed >= SOAK_TARGET
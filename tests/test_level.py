@@ -0,0 +1,58 @@
+import json
+import os
+import shutil
+
+from level import DEFAULT_LEVEL, cache_path, compile_level, load_level, read_compiled
+
+FIELDS = ('name', 'house_width', 'house_depth', 'wall_height', 'wall_thickness', 'player_start', 'ghost_start',
+          'exit_door', 'outer_walls', 'room_walls', 'props', 'light_positions', 'patrol_points',
+          'benchmark_route', 'rooms', 'digest')
+
+
+def fields(level):
+    return {name: getattr(level, name) for name in FIELDS}
+
+
+def test_compiled_level_keeps_the_json(tmp_path):
+    with open(DEFAULT_LEVEL) as f:
+        data = json.load(f)
+    level = read_compiled(compile_level(data))
+    assert level.name == data['name']
+    assert len(level.walls) == len(data['outer_walls']) + len(data['room_walls'])
+    assert [list(w.position) for w in level.room_walls] == [w['position'] for w in data['room_walls']]
+    bed = level.props[0]
+    assert (bed.name, bed.texture, bed.batch, bed.collider, bed.solid) == ('bed', 'bed', 'bed', True, True)
+    assert bed.color == (255, 255, 255, 255)
+    headboard = level.props[1]
+    assert headboard.color == (80, 60, 40, 255) and not headboard.collider and headboard.texture_scale is None
+    assert [room.name for room in level.rooms] == [room['name'] for room in data['rooms']]
+    assert level.benchmark_route[0] == ('entrance', (-25, 2, -25))
+
+
+def test_cached_load_matches_a_fresh_compile(tmp_path):
+    path = str(tmp_path / 'house.json')
+    shutil.copy(DEFAULT_LEVEL, path)
+    cache = str(tmp_path / 'cache')
+    cold = load_level(path, cache)
+    assert os.path.exists(cache_path(path, cache))
+    warm = load_level(path, cache)
+    assert fields(warm) == fields(cold)
+    assert type(warm.props[0]) is type(cold.props[0])
+    with open(path) as f:
+        assert fields(read_compiled(compile_level(json.load(f)))) == fields(cold)
+
+
+def test_edited_level_is_compiled_again(tmp_path):
+    path = str(tmp_path / 'house.json')
+    cache = str(tmp_path / 'cache')
+    with open(DEFAULT_LEVEL) as f:
+        data = json.load(f)
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    before = load_level(path, cache)
+    data['player_start'] = [1, 2, 3]
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1)  # A different size, in case the mtime doesn't move
+    after = load_level(path, cache)
+    assert after.player_start == (1, 2, 3)
+    assert after.digest != before.digest
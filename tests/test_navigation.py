@@ -0,0 +1,49 @@
+from navigation import FlowField, NavGrid
+
+
+def test_flow_field_distances_around_a_wall():
+    # 5x5 grid of 1 m cells, a wall across the middle row with a gap on the right
+    grid = NavGrid([(-0.5, 0, 4, 0.2)], (-2.5, 2.5, -2.5, 2.5), agent_radius=0)
+    field = FlowField(grid)
+    field.update(-2, -2)  # Bottom left corner
+    rows = [field.distance[row * grid.cols:(row + 1) * grid.cols] for row in range(grid.rows)]
+    assert rows == [
+        [0, 1, 2, 3, 4],
+        [1, 2, 3, 4, 5],
+        [-1, -1, -1, -1, 6],
+        [11, 10, 9, 8, 7],
+        [12, 11, 10, 9, 8],
+    ]
+
+
+def test_flow_field_steps_downhill_to_the_target():
+    grid = NavGrid([(-0.5, 0, 4, 0.2)], (-2.5, 2.5, -2.5, 2.5), agent_radius=0)
+    field = FlowField(grid)
+    field.update(-2, -2)
+    x, z = -2, 2
+    for step in range(40):
+        direction = field.direction(x, z)
+        if direction is None:
+            break
+        x += direction[0] * 0.25
+        z += direction[1] * 0.25
+        assert not grid.blocked[grid.cell(x, z)]
+    assert grid.cell(x, z) == grid.cell(-2, -2)
+
+
+def test_flow_field_rebuilds_only_when_the_target_changes_cell():
+    grid = NavGrid([], (0, 10, 0, 10))
+    field = FlowField(grid)
+    assert field.update(1.2, 1.2)
+    assert not field.update(1.8, 1.4)
+    assert field.update(5, 5)
+    assert field.update(1.5, 1.5)
+    assert field.rebuilds == 2  # The first target's distances came from the cache
+
+
+def test_blocked_target_paths_to_the_nearest_free_cell():
+    grid = NavGrid([(5, 5, 1, 1)], (0, 10, 0, 10), agent_radius=0)
+    field = FlowField(grid)
+    field.update(5, 5)
+    assert field.target_cell != grid.cell(5, 5)
+    assert field.distance[field.target_cell] == 0
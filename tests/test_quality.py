@@ -0,0 +1,44 @@
+from quality import DOWN_AFTER, MAX_UP_AFTER, UP_AFTER, QualityGovernor, level_index
+
+BUDGET_MS = 1000 / 60
+
+
+def play(governor, seconds, frame_ms):
+    """Feed frames of frame_ms(level name) until governor.time reaches seconds"""
+    while governor.time < seconds:
+        governor.update(frame_ms(governor.level.name) / 1000)
+
+
+def test_frames_between_the_two_ratios_keep_the_level():
+    governor = QualityGovernor(lambda level: None, level=level_index('medium'))
+    # Over the budget, but not by enough to step down nor little enough to step up
+    play(governor, 60, lambda name: BUDGET_MS * 1.1)
+    assert governor.decisions == []
+    assert governor.level.name == 'medium'
+
+
+def test_steps_down_only_after_being_over_budget_for_a_while():
+    governor = QualityGovernor(lambda level: None)
+    frame_ms = BUDGET_MS * 1.5
+    full = governor.frame_ms.maxlen * frame_ms / 1000  # When the window first fills
+    play(governor, full + DOWN_AFTER - 0.1, lambda name: frame_ms)
+    assert governor.level.name == 'high'
+    play(governor, full + DOWN_AFTER + 0.1, lambda name: frame_ms)
+    assert governor.level.name == 'medium'
+    assert governor.decisions[-1]['reason'] == 'over budget'
+
+
+def test_a_level_that_never_holds_is_tried_less_and_less_often():
+    applied = []
+    governor = QualityGovernor(applied.append, level=level_index('medium'))
+    # Medium holds the frame rate exactly, high can't
+    play(governor, 300, lambda name: BUDGET_MS if name == 'medium' else BUDGET_MS * 1.5)
+    ups = [d['time'] for d in governor.decisions if d['direction'] > 0]
+    downs = [d['time'] for d in governor.decisions if d['direction'] < 0]
+    assert len(ups) == len(downs) and 3 < len(ups) <= 300 / MAX_UP_AFTER + 4
+    waits = [up - down for down, up in zip(downs, ups[1:])]
+    assert waits[0] > UP_AFTER * 2
+    assert all(later > earlier for earlier, later in zip(waits, waits[1:]) if earlier < MAX_UP_AFTER)
+    assert governor.up_after[level_index('medium')] == MAX_UP_AFTER
+    assert [level.name for level in applied[:3]] == ['medium', 'high', 'medium']
+    assert governor.decisions[1]['reason'].startswith('step up failed')
@@ -0,0 +1,53 @@
+import random
+import struct
+
+import pytest
+
+from procgen import mansion_level
+from replay import InputPlayer, InputRecorder, replay_headless, timing_report
+from simulation import NO_INPUT, PlayerInput, Simulation
+
+
+def record(path, sim, ticks, **where):
+    """Play sim with a wandering bot, recording it; returns the live report"""
+    bot = random.Random(2)
+    recorder = InputRecorder(path, 60, sim, **where)
+    controls = NO_INPUT
+    for i in range(ticks):
+        if i % 20 == 0:
+            controls = PlayerInput(bot.choice((-1, 0, 1)), bot.choice((-1, 0, 1)), bot.random() < 0.3,
+                                   bot.uniform(-0.5, 0.5), bot.uniform(-0.1, 0.1))
+        restart = sim.game_over or sim.game_won
+        if restart:
+            sim.reset()
+        sim.step(1 / 60, recorder.record(controls, restart))
+    recorder.close()
+    return timing_report([], [], sim)
+
+
+def test_replay_plays_the_run_out_the_same(tmp_path):
+    path = str(tmp_path / 'run.scrm')
+    live = record(path, Simulation(seed=7), 3000)
+    report = replay_headless(path)
+    assert report['ticks'] == 3000
+    assert report['final_state'] == live['final_state']
+
+
+def test_replay_rebuilds_a_mansion_from_the_header(tmp_path):
+    path = str(tmp_path / 'mansion.scrm')
+    sim = Simulation(seed=3, nav_cell_size=0.5, level=mansion_level(5, 3, 3), ghosts=4)
+    live = record(path, sim, 600, mansion_seed=5, rooms=3)
+    player = InputPlayer(path)
+    assert (player.seed, player.mansion_seed, player.rooms, player.ghosts, player.nav_cell_size) == (3, 5, 3, 4, 0.5)
+    assert player.level_digest == sim.level.digest
+    assert replay_headless(path)['final_state'] == live['final_state']
+
+
+def test_replay_refuses_a_different_level(tmp_path):
+    path = str(tmp_path / 'run.scrm')
+    record(path, Simulation(seed=1), 10)
+    with open(path, 'r+b') as f:
+        f.seek(struct.calcsize('<4sBHQ'))  # The level digest
+        f.write(b'\xff')
+    with pytest.raises(ValueError):
+        InputPlayer(path).simulation()
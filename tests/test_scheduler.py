@@ -0,0 +1,98 @@
+import random
+
+from scheduler import COMPACT_MIN, Scheduler
+
+
+def test_events_fire_in_time_order_then_scheduling_order():
+    scheduler = Scheduler()
+    fired = []
+    for name, time in (('c', 3), ('a', 1), ('b1', 2), ('b2', 2)):
+        scheduler.at(time, fired.append, name)
+    scheduler.advance(1.5)
+    assert fired == ['a']
+    scheduler.run_until(3)
+    assert fired == ['a', 'b1', 'b2', 'c']
+    assert scheduler.now == 3
+
+
+def test_callbacks_see_the_time_they_were_due():
+    scheduler = Scheduler()
+    seen = []
+    scheduler.at(0.25, lambda: seen.append(scheduler.now))
+    scheduler.invoke(lambda: seen.append(scheduler.now), delay=0.5)
+    scheduler.advance(1)
+    assert seen == [0.25, 0.5]
+    assert scheduler.now == 1
+
+
+def test_cancelled_events_do_not_fire():
+    scheduler = Scheduler()
+    fired = []
+    keep = scheduler.at(1, fired.append, 'keep')
+    drop = scheduler.at(1, fired.append, 'drop')
+    drop.cancel()
+    drop.cancel()
+    assert scheduler.cancelled == 1
+    scheduler.advance(2)
+    assert fired == ['keep']
+    assert scheduler.cancelled == 0
+    keep.cancel()  # Already fired, nothing to count
+    assert scheduler.cancelled == 0
+
+
+def test_cancelled_events_are_compacted_out_of_the_heap():
+    scheduler = Scheduler()
+    fired = []
+    live = [scheduler.at(100 + i, fired.append, i) for i in range(10)]
+    for i in range(COMPACT_MIN * 10):
+        scheduler.at(50, fired.append, 'cancelled').cancel()
+        assert len(scheduler.heap) < COMPACT_MIN * 2 + len(live)
+    assert scheduler.stats['compactions'] > 0
+    scheduler.advance(200)
+    assert fired == list(range(10))
+
+
+def test_process_only_reschedules_when_its_rate_changes():
+    scheduler = Scheduler()
+    fired = []
+    process = scheduler.process(2.0, lambda: fired.append(scheduler.now), random.Random(1))
+    scheduled = scheduler.stats['scheduled']
+    for i in range(100):
+        process.set_rate(2.0)
+    assert scheduler.stats['scheduled'] == scheduled
+    # A rate change keeps one pending event, however often it happens
+    for i in range(1000):
+        process.set_rate(1.0 + i % 2)
+    assert len(scheduler.heap) - scheduler.cancelled == 1
+    process.set_rate(0)
+    assert len(scheduler.heap) == scheduler.cancelled
+    scheduler.advance(100)
+    assert fired == []
+
+
+def test_process_fires_at_its_rate():
+    scheduler = Scheduler()
+    fired = []
+    scheduler.process(5.0, lambda: fired.append(1), random.Random(3))
+    for i in range(60 * 200):
+        scheduler.advance(1 / 60)
+    assert 900 < len(fired) < 1100
+
+
+def test_pulled_process_fires_when_a_process_would():
+    scheduler = Scheduler()
+    fired = []
+    pulled = []
+    process = scheduler.process(3.0, lambda: fired.append(scheduler.now), random.Random(5))
+    puller = scheduler.pulled_process(3.0, pulled.append, random.Random(5))
+    for i in range(60 * 30):
+        scheduler.advance(1 / 60)
+        if i % 200 == 0:
+            process.set_rate(1.0 + i % 3)
+            puller.set_rate(1.0 + i % 3)
+        if i % 47 == 0:
+            puller.catch_up(scheduler.now)
+    puller.catch_up(scheduler.now)
+    assert len(fired) > 30
+    assert pulled == fired
+    assert puller.fired == len(fired)
@@ -0,0 +1,59 @@
+import math
+
+import pytest
+
+from simulation import FixedTimestep, Simulation
+
+DT = 1 / 60
+
+
+def test_fixed_timestep_hands_out_whole_ticks():
+    clock = FixedTimestep(tick_rate=60)
+    assert clock.advance(1 / 120) == 0
+    assert clock.alpha == pytest.approx(0.5)
+    assert clock.advance(1 / 120) == 1
+    assert clock.alpha == pytest.approx(0, abs=1e-9)
+    assert sum(clock.advance(1 / 144) for i in range(144)) in (59, 60)  # Float rounding may leave the last in the accumulator
+    assert 0 <= clock.alpha < 1
+
+
+def test_fixed_timestep_keeps_the_remainder():
+    clock = FixedTimestep(tick_rate=8)
+    assert clock.advance(0.3125) == 2
+    assert clock.alpha == 0.5
+    assert clock.advance(0.0625) == 1
+    assert clock.alpha == pytest.approx(0, abs=1e-9)
+
+
+def test_fixed_timestep_drops_the_backlog_after_a_hitch():
+    clock = FixedTimestep(tick_rate=60, max_steps=5)
+    assert clock.advance(1.0) == 5
+    assert clock.dropped_time == pytest.approx(55 / 60)
+    assert clock.alpha < 1
+    assert clock.advance(1 / 60) == 1
+
+
+def test_ghost_searches_where_it_last_saw_the_player():
+    sim = Simulation(seed=1)
+    ghost = sim.ghost
+    seen_at = (17.5, 12.5)
+    assert sim.wall_index.line_of_sight(ghost.x, ghost.z, *seen_at)
+    sim.player.x, sim.player.z = seen_at
+    sim.step(DT)
+    assert ghost.is_chasing
+    assert ghost.last_seen_player_pos == seen_at
+
+    # Out of sight: it follows player_flow to the sighting, then patrols again
+    sim.player.x, sim.player.z = sim.level.player_start[0], sim.level.player_start[2]
+    for tick in range(300):
+        x, z = ghost.x, ghost.z
+        flow_step = sim.player_flow.direction(x, z)
+        sim.step(DT)
+        assert not ghost.is_chasing
+        if ghost.last_seen_player_pos is None:
+            break
+        if flow_step is not None:
+            speed = (ghost.chase_speed + ghost.aggression) * DT
+            assert (ghost.x, ghost.z) == pytest.approx((x + flow_step[0] * speed, z + flow_step[1] * speed))
+    assert ghost.last_seen_player_pos is None
+    assert math.hypot(ghost.x - seen_at[0], ghost.z - seen_at[1]) < sim.search_radius
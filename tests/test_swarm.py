@@ -0,0 +1,73 @@
+import math
+
+import pytest
+
+from ghosts import GhostGroup
+from simulation import NO_INPUT, PlayerInput, Simulation
+
+swarm = pytest.importorskip('swarm')
+
+DT = 1 / 60
+
+
+def group_sim(seed, count, group_type):
+    """Simulation running its ghosts as group_type, even for one ghost"""
+    sim = Simulation(seed=seed)
+    sim.swarm = group_type(sim, count)
+    sim.reseed(seed)
+    sim.reset()
+    return sim
+
+
+def play(a, b, controls, ticks=3600):
+    """Step both with the same input, checking ghost 0 and the player's state agree"""
+    for tick in range(ticks):
+        a.step(DT, controls)
+        b.step(DT, controls)
+        assert (a.ghost.x, a.ghost.z) == pytest.approx((b.ghost.x, b.ghost.z), abs=1e-9)
+        assert a.sanity == pytest.approx(b.sanity, abs=1e-9)
+        assert a.game_over == b.game_over
+        if a.game_over or a.game_won:
+            return tick
+    return ticks
+
+
+@pytest.mark.parametrize('group_type', [GhostGroup, swarm.GhostSwarm])
+def test_one_ghost_group_plays_like_the_scalar_ghost(group_type):
+    controls = PlayerInput(1, 0, False, 0.2, 0)
+    assert play(Simulation(seed=7), group_sim(7, 1, group_type), controls) > 60
+
+
+@pytest.mark.parametrize('seed', range(1, 6))
+def test_swarm_plays_like_the_group(seed):
+    controls = PlayerInput(1, 0, False, 0.2, 0)
+    group = group_sim(seed, 10, GhostGroup)
+    fast = group_sim(seed, 10, swarm.GhostSwarm)
+    play(group, fast, controls)
+    assert fast.swarm.x.tolist() == pytest.approx(group.swarm.x, abs=1e-9)
+    assert fast.swarm.z.tolist() == pytest.approx(group.swarm.z, abs=1e-9)
+
+
+@pytest.mark.parametrize('count', [1, 10])
+def test_swarm_searches_like_the_group(count):
+    group = group_sim(3, count, GhostGroup)
+    fast = group_sim(3, count, swarm.GhostSwarm)
+    # A sighting next to ghost 0, then the player goes to the open cell
+    # furthest from every ghost
+    for sim in (group, fast):
+        sim.player.x, sim.player.z = 17.5, 12.5
+    play(group, fast, NO_INPUT, ticks=1)
+    assert group.swarm.chasing[0]
+    grid = group.nav_grid
+    cells = [grid.cell_center(i) for i in range(grid.cols * grid.rows) if not grid.blocked[i]]
+    hideout = max(cells, key=lambda c: min(math.hypot(c[0] - x, c[1] - z) for x, z in zip(group.swarm.x, group.swarm.z)))
+    for sim in (group, fast):
+        sim.player.x, sim.player.z = hideout
+    searched = 0
+    for tick in range(240):
+        play(group, fast, NO_INPUT, ticks=1)
+        searched += group.swarm.searching[0]
+        assert fast.swarm.searching.tolist() == group.swarm.searching
+    assert 0 < searched < 240
+    assert fast.swarm.x.tolist() == pytest.approx(group.swarm.x, abs=1e-9)
+    assert fast.swarm.z.tolist() == pytest.approx(group.swarm.z, abs=1e-9)
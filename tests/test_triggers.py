@@ -0,0 +1,76 @@
+import random
+
+from triggers import TriggerSystem
+
+
+def recording_system():
+    calls = []
+
+    def record(kind):
+        return lambda volume, actor: calls.append((kind, volume.name, actor))
+    triggers = TriggerSystem(cell_size=4)
+    callbacks = dict(on_enter=record('enter'), on_stay=record('stay'), on_exit=record('exit'))
+    return triggers, calls, callbacks
+
+
+def test_enter_stay_exit():
+    triggers, calls, callbacks = recording_system()
+    triggers.box(0, 0, 2, 2, 'box', **callbacks)
+    triggers.sphere(10, 0, 1, 'sphere', **callbacks)
+    triggers.update('a', -1, 1)
+    assert calls == []
+    triggers.update('a', 1, 1)
+    triggers.update('a', 1.5, 1)
+    triggers.update('a', 3, 1)
+    assert calls == [('enter', 'box', 'a'), ('stay', 'box', 'a'), ('exit', 'box', 'a')]
+    del calls[:]
+    triggers.update('a', 10.5, 0)
+    triggers.update('b', 10, 0.5)
+    triggers.update('a', 12, 0)
+    assert calls == [('enter', 'sphere', 'a'), ('enter', 'sphere', 'b'), ('exit', 'sphere', 'a')]
+    assert [volume.name for volume in triggers.volumes_at('b')] == ['sphere']
+
+
+def test_overlapping_volumes_fire_in_the_order_they_were_added():
+    triggers, calls, callbacks = recording_system()
+    triggers.box(0, 0, 10, 10, 'room', **callbacks)
+    triggers.sphere(5, 5, 1, 'pickup', **callbacks)
+    triggers.update('a', 5, 5)
+    assert calls == [('enter', 'room', 'a'), ('enter', 'pickup', 'a')]
+    del calls[:]
+    triggers.update('a', 8, 8)
+    assert calls == [('exit', 'pickup', 'a'), ('stay', 'room', 'a')]
+
+
+def test_removed_volumes_and_forget_skip_exit_callbacks():
+    triggers, calls, callbacks = recording_system()
+    pickup = triggers.sphere(0, 0, 1, 'pickup', **callbacks)
+    triggers.update('a', 0, 0)
+    triggers.remove(pickup)
+    triggers.update('a', 0.1, 0)
+    assert calls == [('enter', 'pickup', 'a')]
+    triggers.sphere(0, 0, 1, 'again', **callbacks)
+    triggers.update('a', 0.1, 0)
+    triggers.forget()
+    triggers.update('a', 5, 5)
+    assert calls == [('enter', 'pickup', 'a'), ('enter', 'again', 'a')]
+
+
+def test_rest_radius_skips_queries_without_changing_the_result():
+    rng = random.Random(4)
+    triggers = TriggerSystem(cell_size=8)
+    for i in range(200):
+        x, z = rng.uniform(0, 100), rng.uniform(0, 100)
+        if i % 2:
+            triggers.sphere(x, z, rng.uniform(0.5, 4), i)
+        else:
+            triggers.box(x, z, x + rng.uniform(1, 10), z + rng.uniform(1, 10), i)
+    x, z = 50, 50
+    updates = 0
+    for step in range(5000):
+        x = min(100, max(0, x + rng.uniform(-0.1, 0.1)))
+        z = min(100, max(0, z + rng.uniform(-0.1, 0.1)))
+        triggers.update('a', x, z)
+        updates += 1
+        assert triggers.volumes_at('a') == [volume for volume in triggers.volumes if volume.contains(x, z)]
+    assert triggers.queries < updates / 2
@@ -0,0 +1,33 @@
+import math
+import random
+
+from level import load_level
+from visibility import WallIndex, segment_hits_box
+
+
+def brute_force(boxes, x0, z0, x1, z1):
+    dx = x1 - x0
+    dz = z1 - z0
+    inv_dx = 1 / dx if dx != 0 else math.inf
+    inv_dz = 1 / dz if dz != 0 else math.inf
+    return not any(segment_hits_box(x0, z0, dx, dz, inv_dx, inv_dz, box) for box in boxes)
+
+
+def test_visible_from_matches_brute_force():
+    level = load_level()
+    bounds = level.floor_bounds()
+    index = WallIndex(level.wall_rects(), bounds)
+    rng = random.Random(3)
+    viewers = [(rng.uniform(bounds[0], bounds[1]), rng.uniform(bounds[2], bounds[3])) for i in range(100)]
+    # Axis aligned viewers too, for the dx == 0 / dz == 0 paths
+    viewers += [(0, z) for x, z in viewers[:10]] + [(x, 0) for x, z in viewers[:10]]
+    for i in range(50):
+        x, z = rng.uniform(bounds[0], bounds[1]), rng.uniform(bounds[2], bounds[3])
+        expected = [brute_force(index.boxes, vx, vz, x, z) for vx, vz in viewers]
+        assert index.visible_from(viewers, x, z) == expected
+        assert index.visible_from(viewers, 0, z) == [brute_force(index.boxes, vx, vz, 0, z) for vx, vz in viewers]
+
+
+def test_a_wall_between_blocks_and_a_gap_does_not():
+    index = WallIndex([(0, 0, 10, 1)], (-10, 10, -10, 10))
+    assert index.visible_from([(0, -5), (8, -5), (7, 2)], 0, 5) == [False, False, True]
@@ -0,0 +1,229 @@
+import math
+import random
+import sys
+import time
+
+
+# Trigger volumes with enter/stay/exit callbacks, from a spatial hash. Exits, rooms, pickups and scares are volumes on the floor plane: boxes, or
+# spheres (a circle seen top-down, so really a cylinder). Every volume is
+# filed under each grid cell its bounds touch. Moving an actor looks up its
+# one cell and tests only the volumes there, so the cost per query stays
+# flat however many volumes the house holds. The system remembers which
+# volumes each actor was in and calls:
+#   on_enter(volume, actor)  the first update the actor is inside
+#   on_stay(volume, actor)   every later update it's still inside
+#   on_exit(volume, actor)   the first update it's out again
+# An actor is any hashable id. Callbacks run in the order volumes were
+# added, so a seeded run fires them the same way every time.
+#
+# After a query the actor also gets a rest radius: the distance to the
+# nearest volume edge or cell edge (when a cell edge is nearest, the 8 cells
+# around are searched too, out to their outer edges). Until it has moved
+# that far it can't be in different volumes, so updates inside it skip the
+# query (and only run on_stay). Walking through a room is one query every
+# few metres.
+
+NOWHERE = []
+
+
+# Rest radii are shrunk by this much so rounding can't carry an actor over an edge
+REST_SLACK = 1e-6
+
+
+class Volume:
+    __slots__ = ('name', 'bounds', 'on_enter', 'on_stay', 'on_exit', 'cells', 'data')
+
+    def __init__(self, name, bounds, on_enter, on_stay, on_exit, data):
+        self.name = name
+        self.bounds = bounds  # (min_x, min_z, max_x, max_z)
+        self.on_enter = on_enter
+        self.on_stay = on_stay
+        self.on_exit = on_exit
+        self.cells = ()
+        self.data = data
+
+
+class Box(Volume):
+    __slots__ = ()
+
+    def contains(self, x, z):
+        min_x, min_z, max_x, max_z = self.bounds
+        return min_x <= x <= max_x and min_z <= z <= max_z
+
+    def edge_distance(self, x, z):
+        min_x, min_z, max_x, max_z = self.bounds
+        if min_x <= x <= max_x and min_z <= z <= max_z:
+            return min(x - min_x, max_x - x, z - min_z, max_z - z)
+        dx = max(min_x - x, 0, x - max_x)
+        dz = max(min_z - z, 0, z - max_z)
+        return math.sqrt(dx * dx + dz * dz)
+
+
+class Sphere(Volume):
+    __slots__ = ('x', 'z', 'radius', 'radius_sq')
+
+    def __init__(self, name, x, z, radius, *args):
+        super().__init__(name, (x - radius, z - radius, x + radius, z + radius), *args)
+        self.x = x
+        self.z = z
+        self.radius = radius
+        self.radius_sq = radius * radius
+
+    def contains(self, x, z):
+        dx = x - self.x
+        dz = z - self.z
+        return dx * dx + dz * dz < self.radius_sq
+
+    def edge_distance(self, x, z):
+        return abs(math.hypot(x - self.x, z - self.z) - self.radius)
+
+
+class TriggerSystem:
+    def __init__(self, cell_size=8):
+        self.cell_size = cell_size
+        self.cells = {}   # (col, row) -> volumes touching that cell
+        self.inside = {}  # actor -> volumes it was in after its last update
+        self.rest = {}    # actor -> (x, z, squared rest radius) of its last query
+        self.volumes = []
+        self.queries = 0
+        self.tests = 0  # Containment tests, over all queries
+        self.stats = {'volumes': 0}
+
+    def box(self, min_x, min_z, max_x, max_z, name=None, on_enter=None, on_stay=None, on_exit=None, data=None):
+        return self.add(Box(name, (min_x, min_z, max_x, max_z), on_enter, on_stay, on_exit, data))
+
+    def sphere(self, x, z, radius, name=None, on_enter=None, on_stay=None, on_exit=None, data=None):
+        return self.add(Sphere(name, x, z, radius, on_enter, on_stay, on_exit, data))
+
+    def add(self, volume):
+        size = self.cell_size
+        min_x, min_z, max_x, max_z = volume.bounds
+        volume.cells = [(col, row)
+                        for col in range(int(min_x // size), int(max_x // size) + 1)
+                        for row in range(int(min_z // size), int(max_z // size) + 1)]
+        for cell in volume.cells:
+            self.cells.setdefault(cell, []).append(volume)
+        self.volumes.append(volume)
+        self.rest.clear()
+        self.stats['volumes'] = len(self.volumes)
+        return volume
+
+    def remove(self, volume):
+        """Drop a volume, without exit callbacks (a pickup that's been taken)"""
+        for cell in volume.cells:
+            cell_volumes = self.cells[cell]
+            cell_volumes.remove(volume)
+            if not cell_volumes:
+                del self.cells[cell]
+        self.volumes.remove(volume)
+        for actor, inside in self.inside.items():
+            if volume in inside:
+                self.inside[actor] = [v for v in inside if v is not volume]
+        self.rest.clear()
+        self.stats['volumes'] = len(self.volumes)
+
+    def update(self, actor, x, z):
+        """Move actor to (x, z) and run the callbacks for what it entered, stayed in and left"""
+        before = self.inside.get(actor, NOWHERE)
+        rest = self.rest.get(actor)
+        if rest is not None:
+            dx = x - rest[0]
+            dz = z - rest[1]
+            if dx * dx + dz * dz < rest[2]:
+                for volume in before:
+                    if volume.on_stay:
+                        volume.on_stay(volume, actor)
+                return
+        size = self.cell_size
+        cells = self.cells
+        col = x // size
+        row = z // size
+        col_i = int(col)
+        row_i = int(row)
+        candidates = cells.get((col_i, row_i), NOWHERE)
+        self.queries += 1
+        self.tests += len(candidates)
+        now = [volume for volume in candidates if volume.contains(x, z)]
+        # The cell's edges bound the rest radius too, past them are other volumes
+        radius = cell_edge = min(x - col * size, (col + 1) * size - x, z - row * size, (row + 1) * size - z)
+        for volume in candidates:
+            min_x, min_z, max_x, max_z = volume.bounds
+            if min_x - radius < x < max_x + radius and min_z - radius < z < max_z + radius:
+                edge = volume.edge_distance(x, z)
+                if edge < radius:
+                    radius = edge
+        if radius == cell_edge:
+            # Nothing in the cell is closer than its edge: look in the 8
+            # cells around too, out to their outer edges
+            radius = min(x - (col - 1) * size, (col + 2) * size - x, z - (row - 1) * size, (row + 2) * size - z)
+            for near_col in (col_i - 1, col_i, col_i + 1):
+                for near_row in (row_i - 1, row_i, row_i + 1):
+                    for volume in cells.get((near_col, near_row), NOWHERE):
+                        min_x, min_z, max_x, max_z = volume.bounds
+                        if min_x - radius < x < max_x + radius and min_z - radius < z < max_z + radius:
+                            edge = volume.edge_distance(x, z)
+                            if edge < radius:
+                                radius = edge
+        radius -= REST_SLACK
+        self.rest[actor] = (x, z, radius * radius if radius > 0 else 0)
+        if now == before:
+            for volume in now:
+                if volume.on_stay:
+                    volume.on_stay(volume, actor)
+            return
+        self.inside[actor] = now
+        for volume in before:
+            if volume not in now and volume.on_exit:
+                volume.on_exit(volume, actor)
+        for volume in now:
+            if volume in before:
+                if volume.on_stay:
+                    volume.on_stay(volume, actor)
+            elif volume.on_enter:
+                volume.on_enter(volume, actor)
+
+    def volumes_at(self, actor):
+        """The volumes actor was inside after its last update"""
+        return self.inside.get(actor, NOWHERE)
+
+    def forget(self):
+        """Forget where every actor was, without exit callbacks (a restart)"""
+        self.inside.clear()
+        self.rest.clear()
+
+
+# python triggers.py [ACTORS] - update cost as volumes are added, against a linear scan
+if __name__ == '__main__':
+    actors = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = 300  # A 20x20 mansion
+    rng = random.Random(1)
+    positions = [(rng.uniform(0, size), rng.uniform(0, size)) for i in range(actors)]
+    frames = 100
+
+    print(f'{"volumes":>8} {"hash us/update":>15} {"scan us/update":>15} {"queried":>8} {"tests/query":>12}')
+    for count in (10, 100, 1000, 10000):
+        triggers = TriggerSystem()
+        for i in range(count):
+            x, z = rng.uniform(0, size), rng.uniform(0, size)
+            if i % 2:
+                triggers.sphere(x, z, rng.uniform(0.5, 3), on_enter=lambda volume, actor: None)
+            else:
+                w, d = rng.uniform(1, 6), rng.uniform(1, 6)
+                triggers.box(x - w, z - d, x + w, z + d, on_enter=lambda volume, actor: None)
+
+        start = time.perf_counter()
+        for frame in range(frames):
+            for actor, (x, z) in enumerate(positions):
+                triggers.update(actor, x + frame * 0.1, z)
+        hashed = (time.perf_counter() - start) / (frames * actors) * 1e6
+        queried = triggers.queries / (frames * actors)
+        tests = triggers.tests / triggers.queries
+
+        # What a list of per-frame checks costs: every volume, every actor
+        volumes = triggers.volumes
+        start = time.perf_counter()
+        for frame in range(frames // 10):
+            for actor, (x, z) in enumerate(positions):
+                inside = [volume for volume in volumes if volume.contains(x + frame * 0.1, z)]
+        scanned = (time.perf_counter() - start) / (frames // 10 * actors) * 1e6
+        print(f'{count:>8} {hashed:>15.2f} {scanned:>15.2f} {queried:>8.0%} {tests:>12.2f}')
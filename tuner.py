@@ -0,0 +1,244 @@
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import itertools
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+from cli import arg_value
+from level import load_level, DEFAULT_LEVEL
+from navigation import FlowField
+from simulation import Simulation, PlayerInput
+
+
+# Difficulty tuner, thousands of bot games per setting on every core. Plays
+# the headless simulation with a scripted bot over a grid of balance
+# settings and writes win rate, how long players last and how much sanity
+# they have left for each one. Every setting plays the same seeds, so two
+# settings are compared on the same games and the differences aren't just
+# luck. Games are handed out in batches to a process pool; each worker
+# builds the level's Simulation once (nav grid, flow fields) and only
+# resets it between games, and a batch only sends back a few numbers per
+# game, so the work scales with the cores.
+#
+#   python tuner.py --set detection_range=10,15,20 --set chase_speed=3.5,4.5 --games 500
+#
+# Writes tuning.csv (one row per setting) and tuning.json (the same, with
+# the sanity histograms); --out changes the name.
+
+TICK = 1 / 60
+MAX_GAME_SECONDS = 600  # A bot that hasn't got out by then is stuck
+
+# Simulation attributes the tuner can set
+KNOBS = ('ghost_speed', 'chase_speed', 'detection_range', 'kill_range', 'aggression_rate',
+         'stamina_drain', 'stamina_regen', 'ambient_sanity_drain', 'sight_sanity_drain')
+
+DEFAULT_GRID = {
+    'detection_range': (10, 15, 20),
+    'chase_speed': (3.5, 4.5, 5.5),
+    'aggression_rate': (0.005, 0.01, 0.02),
+}
+
+# How a game ended
+ESCAPED = 'escaped'
+CAUGHT = 'caught'           # Ghost got within kill range
+FRIGHTENED = 'frightened'   # Sanity ran out
+TIMED_OUT = 'timed_out'
+OUTCOMES = (ESCAPED, CAUGHT, FRIGHTENED, TIMED_OUT)
+
+
+class ExitBot:
+    """Shortest path to the exit, running from the ghost when it's close"""
+    def __init__(self, sim, evade_range=6):
+        self.flow = FlowField(sim.nav_grid)
+        self.flow.update(sim.exit_x, sim.exit_z)
+        self.evade_range = evade_range
+
+    def controls(self, sim):
+        player = sim.player
+        ghost = sim.ghost
+        direction = self.flow.direction(player.x, player.z)
+        if direction is None:
+            # On the exit's cell, or squeezed against a wall
+            direction = unit(sim.exit_x - player.x, sim.exit_z - player.z)
+        dx, dz = direction
+        sprint = False
+        if ghost.is_chasing:
+            sprint = True
+            gx = ghost.x - player.x
+            gz = ghost.z - player.z
+            distance = math.hypot(gx, gz)
+            if 0 < distance < self.evade_range:
+                # Bend the path away from the ghost, harder the closer it is
+                push = 2 * (self.evade_range - distance) / self.evade_range
+                dx, dz = unit(dx - gx / distance * push, dz - gz / distance * push)
+        # Face the way to go and walk forward, one tick's turn at a time
+        turn = (math.degrees(math.atan2(dx, dz)) - player.yaw + 180) % 360 - 180
+        return PlayerInput(1, 0, sprint, turn / sim.mouse_sensitivity, 0)
+
+
+def unit(dx, dz):
+    length = math.hypot(dx, dz)
+    if length == 0:
+        return (0, 1)
+    return (dx / length, dz / length)
+
+
+def play(sim, bot, max_seconds=MAX_GAME_SECONDS):
+    """Play one game from a reset sim; returns (outcome, seconds, sanity)"""
+    controls = bot.controls
+    step = sim.step
+    for tick in range(int(max_seconds / TICK)):
+        step(TICK, controls(sim))
+        if sim.game_won:
+            return ESCAPED, sim.time, sim.sanity
+        if sim.game_over:
+            return FRIGHTENED if sim.sanity <= 0 else CAUGHT, sim.time, sim.sanity
+    return TIMED_OUT, sim.time, sim.sanity
+
+
+# One Simulation and bot per worker process, reused for every game
+worker_sim = None
+worker_bot = None
+
+def start_worker(level_path):
+    global worker_sim, worker_bot
+    worker_sim = Simulation(seed=0, level=load_level(level_path))
+    worker_bot = ExitBot(worker_sim)
+
+def play_batch(settings, seeds):
+    """Play a game per seed with the given knob values"""
+    sim = worker_sim
+    for name in KNOBS:
+        setattr(sim, name, settings.get(name, getattr(Simulation, name)))
+    results = []
+    for seed in seeds:
+        sim.reseed(seed)
+        sim.reset()
+        results.append(play(sim, worker_bot))
+    return results
+
+
+def grid_settings(grid):
+    """Every combination of the grid's values, as knob -> value dicts"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def tune(grid, games, workers=None, level_path=DEFAULT_LEVEL, batch_size=20, first_seed=1):
+    """Play games per setting; returns one summary per setting, in grid order"""
+    settings = grid_settings(grid)
+    seeds = list(range(first_seed, first_seed + games))
+    batches = [seeds[i:i + batch_size] for i in range(0, games, batch_size)]
+    results = [[] for s in settings]
+    with ProcessPoolExecutor(max_workers=workers, initializer=start_worker, initargs=(level_path,)) as pool:
+        futures = [(i, pool.submit(play_batch, s, batch)) for i, s in enumerate(settings) for batch in batches]
+        for i, future in futures:
+            results[i].extend(future.result())
+    return [summarize(s, r) for s, r in zip(settings, results)]
+
+def summarize(settings, results):
+    games = len(results)
+    counts = {outcome: 0 for outcome in OUTCOMES}
+    for outcome, seconds, sanity in results:
+        counts[outcome] += 1
+    deaths = [seconds for outcome, seconds, sanity in results if outcome in (CAUGHT, FRIGHTENED)]
+    escapes = [seconds for outcome, seconds, sanity in results if outcome == ESCAPED]
+    sanity = [sanity for outcome, seconds, sanity in results]
+    histogram = [0] * 10  # Final sanity in steps of 10
+    for value in sanity:
+        histogram[min(9, int(value // 10))] += 1
+    return {
+        'settings': settings,
+        'games': games,
+        'rates': {outcome: count / games for outcome, count in counts.items()},
+        'time_to_death': spread(deaths),
+        'time_to_escape': spread(escapes),
+        'sanity': spread(sanity),
+        'sanity_histogram': histogram,
+    }
+
+def spread(values):
+    """Mean and 10th/50th/90th percentiles, or None with nothing to measure"""
+    if not values:
+        return None
+    if len(values) == 1:
+        return {'mean': values[0], 'p10': values[0], 'p50': values[0], 'p90': values[0]}
+    deciles = statistics.quantiles(values, n=10)
+    return {'mean': statistics.fmean(values), 'p10': deciles[0], 'p50': deciles[4], 'p90': deciles[8]}
+
+def write_results(summaries, path):
+    """path.csv with a row per setting, path.json with everything"""
+    knobs = sorted({name for summary in summaries for name in summary['settings']})
+    header = knobs + ['games'] + [f'{outcome}_rate' for outcome in OUTCOMES] + [
+        f'{measure}_{stat}' for measure in ('time_to_death', 'time_to_escape', 'sanity') for stat in ('mean', 'p10', 'p50', 'p90')]
+    with open(path + '.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for summary in summaries:
+            row = [summary['settings'].get(name, getattr(Simulation, name)) for name in knobs]
+            row += [summary['games']] + [round(summary['rates'][outcome], 4) for outcome in OUTCOMES]
+            for measure in ('time_to_death', 'time_to_escape', 'sanity'):
+                stats = summary[measure]
+                row += [round(stats[stat], 2) if stats else '' for stat in ('mean', 'p10', 'p50', 'p90')]
+            writer.writerow(row)
+    with open(path + '.json', 'w') as f:
+        json.dump({'tick': TICK, 'max_game_seconds': MAX_GAME_SECONDS, 'results': summaries}, f, indent=1)
+    print(f'TUNER: {len(summaries)} settings -> {path}.csv/.json')
+
+
+def parse_grid(argv):
+    """--set knob=v1,v2,... flags as a grid, the default grid without any"""
+    grid = {}
+    for flag, value in zip(argv, argv[1:]):
+        if flag != '--set':
+            continue
+        name, values = value.split('=')
+        if name not in KNOBS:
+            raise SystemExit(f'unknown knob {name}, try one of {", ".join(KNOBS)}')
+        grid[name] = tuple(float(v) for v in values.split(','))
+    return grid or DEFAULT_GRID
+
+
+# python tuner.py [--set knob=v1,v2,...]... [--games N] [--workers N] [--level PATH] [--out NAME]
+# python tuner.py --scaling [--games N]
+if __name__ == '__main__':
+    games = arg_value('--games', 200)
+    level_path = arg_value('--level', DEFAULT_LEVEL)
+    cores = os.cpu_count() or 1
+
+    if '--scaling' in sys.argv:
+        # Games per second with more and more workers, on one small grid
+        grid = {'detection_range': (10, 20), 'chase_speed': (3.5, 5.5)}
+        counts = sorted({1, 2, 4, 8, 16, cores} & set(range(1, cores + 1)))
+        print(f'{cores} cores, {len(grid_settings(grid)) * games} games per run')
+        print(f'{"workers":>8} {"seconds":>8} {"games/s":>8} {"speedup":>8}')
+        base = None
+        for workers in counts:
+            start = time.perf_counter()
+            tune(grid, games, workers, level_path)
+            elapsed = time.perf_counter() - start
+            rate = len(grid_settings(grid)) * games / elapsed
+            base = base or rate
+            print(f'{workers:>8} {elapsed:>8.1f} {rate:>8.1f} {rate / base:>7.2f}x')
+        sys.exit()
+
+    grid = parse_grid(sys.argv)
+    workers = arg_value('--workers', cores)
+    settings = grid_settings(grid)
+    print(f'TUNER: {len(settings)} settings x {games} games on {workers} workers')
+    start = time.perf_counter()
+    summaries = tune(grid, games, workers, level_path)
+    elapsed = time.perf_counter() - start
+    print(f'TUNER: {len(settings) * games} games in {elapsed:.1f} s ({len(settings) * games / elapsed:.0f} games/s)')
+
+    names = list(grid)
+    print(' '.join(f'{name:>16}' for name in names) + f' {"escaped":>8} {"caught":>7} {"fright":>7} {"death s":>8} {"sanity":>7}')
+    for summary in summaries:
+        death = summary['time_to_death']
+        print(' '.join(f'{summary["settings"][name]:>16g}' for name in names) +
+              f' {summary["rates"][ESCAPED]:>8.0%} {summary["rates"][CAUGHT]:>7.0%} {summary["rates"][FRIGHTENED]:>7.0%}'
+              f' {death["p50"] if death else math.nan:>8.1f} {summary["sanity"]["p50"]:>7.1f}')
+    write_results(summaries, arg_value('--out', 'tuning'))
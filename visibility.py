@@ -0,0 +1,214 @@
+import math
+import random
+import time
+
+
+# Walls as top-down boxes in a uniform grid, built once from the level data.
+# A line of sight query walks only the grid cells the segment passes through
+# (Amanatides & Woo) and slab tests the boxes there, stopping at the first
+# hit. Walls are full height, so the test is 2D.
+
+class WallIndex:
+    def __init__(self, walls, bounds, cell_size=4.0):
+        """walls are top-down boxes (center_x, center_z, size_x, size_z)"""
+        self.min_x, self.max_x, self.min_z, self.max_z = bounds
+        self.cell_size = cell_size
+        self.cols = max(1, int(math.ceil((self.max_x - self.min_x) / cell_size)))
+        self.rows = max(1, int(math.ceil((self.max_z - self.min_z) / cell_size)))
+        self.cells = [() for i in range(self.cols * self.rows)]
+        self.boxes = []
+        for cx, cz, sx, sz in walls:
+            self.insert((cx - sx / 2, cz - sz / 2, cx + sx / 2, cz + sz / 2))
+
+    def insert(self, box):
+        self.boxes.append(box)
+        x0, z0, x1, z1 = box
+        col0, row0 = self.cell_coords(x0, z0)
+        col1, row1 = self.cell_coords(x1, z1)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                index = row * self.cols + col
+                self.cells[index] = self.cells[index] + (box,)
+
+    def cell_coords(self, x, z):
+        col = int((x - self.min_x) / self.cell_size)
+        row = int((z - self.min_z) / self.cell_size)
+        return (min(self.cols - 1, max(0, col)), min(self.rows - 1, max(0, row)))
+
+    def line_of_sight(self, x0, z0, x1, z1, end_cell=None):
+        """True if no wall crosses the segment. A wall the segment starts
+        inside of doesn't block it, so a ghost drifting through a wall can
+        still see out. end_cell is cell_coords(x1, z1), if already known."""
+        dx = x1 - x0
+        dz = z1 - z0
+        cell_size = self.cell_size
+        cols = self.cols
+        col, row = self.cell_coords(x0, z0)
+        end_col, end_row = end_cell or self.cell_coords(x1, z1)
+
+        # Grid traversal setup
+        step_col = 1 if dx > 0 else -1
+        step_row = 1 if dz > 0 else -1
+        if dx != 0:
+            next_x = self.min_x + (col + (step_col > 0)) * cell_size
+            t_max_x = (next_x - x0) / dx
+            t_delta_x = cell_size / abs(dx)
+        else:
+            t_max_x = t_delta_x = math.inf
+        if dz != 0:
+            next_z = self.min_z + (row + (step_row > 0)) * cell_size
+            t_max_z = (next_z - z0) / dz
+            t_delta_z = cell_size / abs(dz)
+        else:
+            t_max_z = t_delta_z = math.inf
+        inv_dx = 1 / dx if dx != 0 else math.inf
+        inv_dz = 1 / dz if dz != 0 else math.inf
+
+        # Segment bounds for a cheap reject before the slab test. Boxes that
+        # span several cells are simply retested, that's cheaper than dedupe.
+        seg_x0 = x0 if x0 < x1 else x1
+        seg_x1 = x1 if x0 < x1 else x0
+        seg_z0 = z0 if z0 < z1 else z1
+        seg_z1 = z1 if z0 < z1 else z0
+        while True:
+            for box in self.cells[row * cols + col]:
+                if box[0] > seg_x1 or box[2] < seg_x0 or box[1] > seg_z1 or box[3] < seg_z0:
+                    continue
+                if segment_hits_box(x0, z0, dx, dz, inv_dx, inv_dz, box):
+                    return False
+            if col == end_col and row == end_row:
+                return True
+            if t_max_x < t_max_z:
+                if t_max_x > 1:
+                    return True
+                col += step_col
+                t_max_x += t_delta_x
+            else:
+                if t_max_z > 1:
+                    return True
+                row += step_row
+                t_max_z += t_delta_z
+            if not (0 <= col < cols and 0 <= row < self.rows):
+                return True
+
+    def overlaps(self, x, z, radius):
+        """True if a circle at (x, z) touches any box, for collision"""
+        cell_size = self.cell_size
+        cols = self.cols
+        col0 = int((x - radius - self.min_x) / cell_size)
+        col1 = int((x + radius - self.min_x) / cell_size)
+        row0 = int((z - radius - self.min_z) / cell_size)
+        row1 = int((z + radius - self.min_z) / cell_size)
+        if col0 < 0:
+            col0 = 0
+        if row0 < 0:
+            row0 = 0
+        if col1 >= cols:
+            col1 = cols - 1
+        if row1 >= self.rows:
+            row1 = self.rows - 1
+        radius_sq = radius * radius
+        cells = self.cells
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                for bx0, bz0, bx1, bz1 in cells[row * cols + col]:
+                    px = bx0 if x < bx0 else bx1 if x > bx1 else x
+                    pz = bz0 if z < bz0 else bz1 if z > bz1 else z
+                    if (px - x) * (px - x) + (pz - z) * (pz - z) < radius_sq:
+                        return True
+        return False
+
+    def visible_from(self, viewers, x, z):
+        """Line of sight from every (x, z) viewer to one target, e.g. all ghosts
+        to the player. Only the target's cell is worked out once, each viewer
+        still walks its own cells."""
+        end_cell = self.cell_coords(x, z)
+        line_of_sight = self.line_of_sight
+        return [line_of_sight(vx, vz, x, z, end_cell) for vx, vz in viewers]
+
+
+def segment_hits_box(x0, z0, dx, dz, inv_dx, inv_dz, box):
+    """Slab test: does the segment enter the box for some t in (0, 1]?"""
+    bx0, bz0, bx1, bz1 = box
+    if dx != 0:
+        t0 = (bx0 - x0) * inv_dx
+        t1 = (bx1 - x0) * inv_dx
+        if t0 > t1:
+            t0, t1 = t1, t0
+    elif bx0 <= x0 <= bx1:
+        t0, t1 = -math.inf, math.inf
+    else:
+        return False
+    if dz != 0:
+        u0 = (bz0 - z0) * inv_dz
+        u1 = (bz1 - z0) * inv_dz
+        if u0 > u1:
+            u0, u1 = u1, u0
+    elif bz0 <= z0 <= bz1:
+        u0, u1 = -math.inf, math.inf
+    else:
+        return False
+    enter = t0 if t0 > u0 else u0
+    leave = t1 if t1 < u1 else u1
+    return enter <= leave and 0 < enter <= 1
+
+
+# python visibility.py - grid walk against testing every wall, on bigger and bigger maps
+if __name__ == '__main__':
+    from level import load_level
+    level = load_level()
+
+    def run(walls, bounds, span):
+        index = WallIndex(walls, bounds)
+        rng = random.Random(1)
+        segments = []
+        for i in range(20000):
+            x0 = rng.uniform(bounds[0], bounds[1])
+            z0 = rng.uniform(bounds[2], bounds[3])
+            # Ghost -> player distances, up to the detection range and a bit
+            angle = rng.uniform(0, math.tau)
+            length = rng.uniform(0, span)
+            segments.append((x0, z0, x0 + math.cos(angle) * length, z0 + math.sin(angle) * length))
+
+        def brute_force(x0, z0, x1, z1):
+            dx = x1 - x0
+            dz = z1 - z0
+            inv_dx = 1 / dx if dx != 0 else math.inf
+            inv_dz = 1 / dz if dz != 0 else math.inf
+            return not any(segment_hits_box(x0, z0, dx, dz, inv_dx, inv_dz, box) for box in index.boxes)
+
+        start = time.perf_counter()
+        expected = [brute_force(*segment) for segment in segments]
+        brute_us = (time.perf_counter() - start) * 1e6 / len(segments)
+
+        start = time.perf_counter()
+        result = [index.line_of_sight(*segment) for segment in segments]
+        grid_us = (time.perf_counter() - start) * 1e6 / len(segments)
+        assert result == expected, 'grid index disagrees with brute force'
+
+        # 64 ghosts looking at one player, against asking one at a time
+        viewers = [segment[:2] for segment in segments[:64]]
+        targets = [segment[2:] for segment in segments[:300]]
+        start = time.perf_counter()
+        looped = [[index.line_of_sight(vx, vz, x, z) for vx, vz in viewers] for x, z in targets]
+        loop_us = (time.perf_counter() - start) * 1e6 / (len(viewers) * len(targets))
+        start = time.perf_counter()
+        shared = [index.visible_from(viewers, x, z) for x, z in targets]
+        from_us = (time.perf_counter() - start) * 1e6 / (len(viewers) * len(targets))
+        assert shared == looped, 'visible_from disagrees with line_of_sight'
+
+        print(f'{len(walls):>6} walls {f"{index.cols}x{index.rows}":>8} cells | '
+              f'brute force {brute_us:7.2f} us | grid {grid_us:5.2f} us | visible {sum(result)}/{len(result)} | '
+              f'one target: loop {loop_us:5.2f} us, visible_from {from_us:5.2f} us')
+
+    # The house as it is, then tiled into bigger maps
+    walls = level.wall_rects()
+    bounds = level.floor_bounds()
+    for tiles in (1, 3, 6):
+        tiled = []
+        for i in range(tiles):
+            for j in range(tiles):
+                ox = (i - (tiles - 1) / 2) * level.house_width
+                oz = (j - (tiles - 1) / 2) * level.house_depth
+                tiled += [(cx + ox, cz + oz, sx, sz) for cx, cz, sx, sz in walls]
+        run(tiled, [b * tiles for b in bounds], span=20)